@@ -0,0 +1,82 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from python.common.logger import get_logger
+from python.common.common_flow import run_command
+from python.common.output_parsers import build_parsers
+from python.agent.workspace import LOCK_FILE, BUILD_DIRS
+
+logger = get_logger(__name__)
+
+def _error_count(build_result):
+    findings = build_result.get('findings', {}).get('build_error', {})
+    return sum(1 for d in findings.get('diagnostics', []) if d['severity'] == 'error')
+
+def _generate_and_build(index, chat, prompt_parts, config, project_dir, candidate_dir, write_files, build_command, cancel_event, build_timeout):
+    response = chat.send_message(prompt_parts, config)
+    code_response = response.parsed
+    if cancel_event.is_set():
+        return index, code_response, None
+    # Without bin/obj: their restore state refers to the original project path
+    shutil.copytree(project_dir, candidate_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns(LOCK_FILE, *BUILD_DIRS))
+    write_files(code_response, candidate_dir)
+    logger.info(f"Building candidate {index} in {candidate_dir}")
+    build_result = run_command(list(build_command), candidate_dir, timeout=build_timeout, parsers=build_parsers(), cancel_event=cancel_event)
+    return index, code_response, build_result
+
+def generate_and_build_candidates(chat, prompt_parts, config, count, project_dir, candidates_dir, write_files, build_command=("dotnet", "build"), max_workers=None, build_timeout=300):
+    """
+    Requests `count` candidate responses to the same prompt concurrently, writes each into its
+    own copy of the project and builds them in parallel on a bounded worker pool.
+    The first candidate that builds wins and is returned at once: the other builds are cancelled,
+    LLM calls still in flight finish in the background and only add their cache counters to `chat`,
+    which continues the winner's conversation. If none builds, the candidate with the fewest errors
+    is kept, and if none could even be generated, a single request is made on `chat` itself.
+    Returns (code_response, build_result) of the kept candidate.
+    """
+    cancel_event = threading.Event()
+    forks = [chat.fork(f"candidate{i}") for i in range(count)]
+    results = {}
+    winner = None
+    executor = ThreadPoolExecutor(max_workers=max_workers or count)
+    try:
+        futures = [
+            executor.submit(_generate_and_build, i, forks[i], prompt_parts, config, project_dir,
+                            os.path.join(candidates_dir, f"candidate{i}"), write_files, build_command, cancel_event, build_timeout)
+            for i in range(count)
+        ]
+        for future, fork in zip(futures, forks):
+            future.add_done_callback(lambda _, fork=fork: chat.merge_counts(fork))
+        for future in as_completed(futures):
+            try:
+                index, code_response, build_result = future.result()
+            except Exception as e:
+                logger.error(f"Candidate generation failed: {e}")
+                continue
+            if build_result is None:
+                continue
+            results[index] = (code_response, build_result)
+            if build_result['returncode'] == 0:
+                logger.info(f"Candidate {index} built successfully, cancelling the others.")
+                winner = index
+                cancel_event.set()
+                break
+            logger.warning(f"Candidate {index} failed to build ({_error_count(build_result)} error(s)).")
+    finally:
+        cancel_event.set()
+        # Builds stop on the cancel event, LLM calls in flight can't be interrupted: don't wait for them.
+        # The losing forks only write their own (salted) cache entries and counters, never to `chat`'s turns
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if winner is None:
+        if not results:
+            logger.warning("No candidate could be generated, falling back to a single request.")
+            _, code_response, build_result = _generate_and_build(count, chat, prompt_parts, config, project_dir,
+                                                                 os.path.join(candidates_dir, "fallback"), write_files, build_command, threading.Event(), build_timeout)
+            return code_response, build_result
+        winner = min(results, key=lambda i: (_error_count(results[i][1]), i))
+        logger.warning(f"No candidate built, continuing with candidate {winner}.")
+
+    chat.adopt(forks[winner])
+    return results[winner]
@@ -1,19 +1,32 @@
 import os
 import argparse
 import time
-import shutil
 from pydantic import BaseModel
-from google.genai import types
 from python.common.logger import get_logger
-from python.recorder.main_recorder import Recorder
 from python.common.common_flow import (
     initialize_gemini_client,
     send_message_with_retries,
+    is_stale_file_error,
+    reupload_stale_files,
     run_command,
     write_file,
+    upload_files,
     upload_dir_files,
+    collect_dir_files,
+    local_files,
+    local_dir_files,
     dump_ui_tree,
 )
+from python.common.upload_cache import UploadCache
+from python.common.llm_client import LLMClient, get_shared_bucket, api_key_id
+from python.common.llm_cache import ResponseCache, CachedChat
+from python.common.output_parsers import build_parsers
+from python.common.log_distiller import distill_build_log
+from python.agent.candidates import generate_and_build_candidates
+from python.agent.workspace import WorkspacePool
+from python.agent.pipeline import ExecutionPipeline
+from python.common.context_planner import ContextPlanner
+from python.common.tracing import tracer, span, enable_tracing
 
 logger = get_logger(__name__)
 
@@ -23,12 +36,20 @@ MAX_EXECUTION_ATTEMPTS = 6
 RUN_OUTPUT_DIR = "generated_scripts/{timestamp}"
 COMPILATION_ITERATION_DIR = "{run_output_dir}/compilation/iteration{i}"
 EXECUTION_ITERATION_DIR = "{run_output_dir}/execution/iteration{i}"
+CANDIDATES_DIR = "{run_output_dir}/candidates/iteration{i}"
+BUILD_COMMAND = ["dotnet", "build"]
+TEST_COMMAND = ["dotnet", "test", "--logger", "console;verbosity=detailed"]
 MODEL = "gemini-flash-latest"
 TEMPLATE_PROJECT_DIR = "csharp/TemplateTest"
-
-# --- Configuration ---
-client = initialize_gemini_client()
-
+WORKSPACE_POOL_DIR = "generated_scripts/.workspaces"
+# One upload cache per API key: uploaded files are only visible to the key's project
+UPLOAD_CACHE_FILE = "generated_scripts/.upload_cache/{key_id}.json"
+LLM_CACHE_DIR = "generated_scripts/.llm_cache"
+# Test runs keep only the last seconds of low fps video and events in memory, written on failure
+FAILURE_CAPTURE_SECONDS = 30
+# Token budget for the files attached to each LLM turn
+DEFAULT_CONTEXT_BUDGET = 200000
+CONTEXT_PLAN_FILE = "context_plan.json"
 
 # -- Structured Output --
 class CodeResponse(BaseModel):
@@ -38,13 +59,14 @@ class CodeResponse(BaseModel):
     comments: str = None
 
 # --- Prompts ---
-try:
-    cur_path = os.path.dirname(os.path.abspath(__file__))
-    with open(os.path.join(cur_path, 'flaui_prompt.md'), 'r', encoding='utf-8') as f:
-        system_prompt = f.read()
-except FileNotFoundError:
-    logger.error(f"Error: `flaui_prompt.md` not found.")
-    exit()
+def load_system_prompt():
+    try:
+        cur_path = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(cur_path, 'flaui_prompt.md'), 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        logger.error(f"Error: `flaui_prompt.md` not found.")
+        exit()
 
 # --- Helper Functions ---
 def write_response_files(response: CodeResponse, target_dir: str, rename_to_txt: bool = False):
@@ -60,162 +82,225 @@ def main():
     parser.add_argument("recording_dir", help="Path to the recording directory.")
     parser.add_argument("-p", "--process-name", help="The process name of the target application.")
     parser.add_argument("-w", "--window-title", help="The window title of the target application.")
+    parser.add_argument("-n", "--candidates", type=int, default=1, help="Number of candidate scripts to generate and build in parallel per compilation attempt.")
+    parser.add_argument("--replay", action="store_true", help="Serve every LLM call from the response cache, without network access.")
+    parser.add_argument("--no-llm-cache", action="store_true", help="Always call the LLM, ignoring cached responses.")
+    parser.add_argument("--context-budget", type=int, default=DEFAULT_CONTEXT_BUDGET, help="Token budget for the files attached to each LLM turn, the least relevant are left out (0: no limit).")
+    parser.add_argument("--context-max-mb", type=float, help="Also limit the size of the files attached to each LLM turn, in MB.")
+    parser.add_argument("--full-recording", action="store_true", help="Record test runs in full (20 fps video, audio) instead of only capturing the last seconds of failing runs.")
+    parser.add_argument("--trace", action="store_true", help="Write a Chrome trace (trace.json) and a phase summary to the run output directory.")
     args = parser.parse_args()
+    if args.replay and args.no_llm_cache:
+        parser.error("--replay needs the LLM response cache.")
+    if args.trace:
+        enable_tracing()
+
+    # Heavy dependencies are imported here rather than at module level, so that importing
+    # this module (and --help) stays fast
+    from google.genai import types
+    from python.recorder.main_recorder import Recorder
+    system_prompt = load_system_prompt()
 
     run_output_dir = RUN_OUTPUT_DIR.format(timestamp=time.strftime("%Y%m%d-%H%M%S"))
     os.makedirs(run_output_dir, exist_ok=True)
     logger.info(f"Run output directory: {run_output_dir}")
 
-    # --- Copy Template Project ---
-    project_dir = os.path.join(run_output_dir, "TemplateTest")
-    shutil.copytree(TEMPLATE_PROJECT_DIR, project_dir)
-    logger.info(f"Copied template project to {project_dir}")
+    # --- Configuration ---
+    client = None if args.replay else initialize_gemini_client()
+    upload_cache = UploadCache(UPLOAD_CACHE_FILE.format(key_id=api_key_id()))
+    llm_client = LLMClient(rate_limiter=get_shared_bucket())
+
+    def send(live_chat, parts, config):
+        try:
+            return send_message_with_retries(live_chat, parts, config, llm_client=llm_client)
+        except Exception as e:
+            # A cached upload can expire or be deleted remotely before its cache entry does
+            if not is_stale_file_error(e):
+                raise
+            logger.warning(f"An attached file is no longer available ({e}), re-uploading it.")
+            return send_message_with_retries(live_chat, reupload_stale_files(client, parts, upload_cache), config, llm_client=llm_client)
+
+    chat = CachedChat(
+        MODEL,
+        cache=None if args.no_llm_cache else ResponseCache(LLM_CACHE_DIR),
+        chat_factory=lambda history: client.chats.create(model=MODEL, history=history),
+        send=send,
+        replay=args.replay
+    )
+    generation_config = types.GenerateContentConfig(
+        response_schema=CodeResponse,
+        response_mime_type="application/json",
+        system_instruction=system_prompt
+    )
+
+    # Each LLM turn's attachments are planned within the budget, the plan is written next to them
+    planner = None
+    if args.context_budget or args.context_max_mb:
+        planner = ContextPlanner(args.context_budget or None, int(args.context_max_mb * 1024 * 1024) if args.context_max_mb else None)
+
+    def upload_dir(dir_path, plan_file):
+        if args.replay:
+            return local_dir_files(dir_path, planner=planner, plan_file=plan_file)
+        return upload_dir_files(client, dir_path, cache=upload_cache, planner=planner, plan_file=plan_file)
+
+    # --- Acquire Project Workspace ---
+    workspace_pool = WorkspacePool(TEMPLATE_PROJECT_DIR, WORKSPACE_POOL_DIR, warm_command=["dotnet", "restore"])
+    with span("workspace.acquire"):
+        project_dir = workspace_pool.acquire()
 
     flaui_project_path = f"{project_dir}/TemplateTest.csproj"
 
-   
-    chat = client.chats.create(model=MODEL)
-
-    logger.info(f"Analyzing data in: {args.recording_dir}")
-    initial_files = upload_dir_files(client, args.recording_dir)
-
-    # Copy project all cs, csproj as txt to temp dir for upload
-    tmp_dir = os.path.join(run_output_dir, "tmp")
-    shutil.copytree(TEMPLATE_PROJECT_DIR, tmp_dir)
-    # Rename in tmpdir all cs , csproj file to txt
-    for dirpath, _, filenames in os.walk(tmp_dir):
-        if dirpath.endswith("bin") or dirpath.endswith("obj"):
-            continue
-        for filename in filenames:
-            if filename.endswith((".cs", ".csproj")):
-                original_path = os.path.join(dirpath, filename)
-                new_path = original_path + ".txt"
-                shutil.move(original_path, new_path)
+    def finish_run():
+        try:
+            workspace_pool.export(project_dir, os.path.join(run_output_dir, "TemplateTest"))
+        finally:
+            workspace_pool.release(project_dir)
+        logger.info(f"LLM cache: {chat.hits} hit(s), {chat.misses} miss(es)")
+        llm_client.write_metrics(os.path.join(run_output_dir, "llm_metrics.json"))
+        tracer.write(run_output_dir)
+
+    # Whatever ends the run, the workspace is released and the metrics and trace are written
+    try:
+        logger.info(f"Analyzing data in: {args.recording_dir}")
+        with span("upload.recording"):
+            initial_files = upload_dir(args.recording_dir, os.path.join(run_output_dir, CONTEXT_PLAN_FILE))
+
+        # Template sources are uploaded as plain text straight from the template, identical content is served from the upload cache
+        with span("upload.template"):
+            template_files = collect_dir_files(TEMPLATE_PROJECT_DIR, extensions=(".cs", ".csproj"), skip_dirs=("bin", "obj"))
+            if args.replay:
+                template_parts = local_files(template_files, mime_type="text/plain")
             else:
-                #delete it
-                os.remove(os.path.join(dirpath, filename))
-
-    prompt_parts = []
-    logger.info("Generating initial script... (This may take a moment)")
-    prompt_parts.extend(initial_files)
-    prompt_parts.extend(upload_dir_files(client, tmp_dir))
-    prompt_parts.append("Generate the initial C# script to perform the recorded scenario using FlaUI and MSTest.")
-
-    # --- Compilation Loop ---
-    compilation_success = False
-    code_response = None
-    iteration_dir = ""
-    for i in range(MAX_COMPILATION_ATTEMPTS):
-        logger.info(f"--- Compilation Attempt {i+1}/{MAX_COMPILATION_ATTEMPTS} ---")
-        
-
-        # --- Generate Script ---
-        if i > 0:
-            prompt_parts = ["The previously generated script failed to compile.\nAttached are the compilation logs for analysis and script refinement."]
-            prompt_parts.extend(upload_dir_files(client, iteration_dir))
-        response = send_message_with_retries(
-            chat,
-            prompt_parts,
-            types.GenerateContentConfig(
-                response_schema=CodeResponse,
-                response_mime_type="application/json",
-                system_instruction=system_prompt
-            )
-        )
-        if i == 0:
-            # Delete temp dir after first use
-            shutil.rmtree(tmp_dir)
-        code_response: CodeResponse = response.parsed
-        if code_response.failure_reason:
-            logger.info(f"LLM failure reason: {code_response.failure_reason}")
-        if code_response.comments:
-            logger.info(f"LLM comments: {code_response.comments}")
-        iteration_dir = COMPILATION_ITERATION_DIR.format(run_output_dir=run_output_dir, i=i)
-        # --- Write Scripts to File ---
-        write_response_files(code_response, project_dir)
-        write_response_files(code_response, iteration_dir, rename_to_txt=True)
-
-        # --- Compile Script ---
-        logger.info(f"Compiling scripts: {flaui_project_path}")
-        compilation_result = run_command(["dotnet", "build"], project_dir)
-        logger.info(f"--- Compilation Output ---\n{compilation_result['stdout']}\n{compilation_result['stderr']}\n---")
-
-        log_path = iteration_dir + "/compilation_log.txt"
-        log_output = f"STDOUT:\n{compilation_result['stdout']}\n\nSTDERR:\n{compilation_result['stderr']}"
-        write_file(log_path, log_output)
-        logger.info(f"Compilation log file written to {log_path}")
-
-        if compilation_result['returncode'] == 0:
-            logger.info("--- Compilation Successful! ---")
-            compilation_success = True
-            break
-
-        logger.warning("--- Compilation Failed! ---")
-        if i == MAX_COMPILATION_ATTEMPTS - 1: break
-
-    if not compilation_success:
-        logger.error("--- Max Compilation Retries Reached! Could not compile the script. ---")
-        return
-
-    # --- Execution Loop ---
-    execution_success = False
-    for i in range(MAX_EXECUTION_ATTEMPTS):
-        logger.info(f"--- Execution Attempt {i+1}/{MAX_EXECUTION_ATTEMPTS} ---")
-        iteration_dir = EXECUTION_ITERATION_DIR.format(run_output_dir=run_output_dir, i=i + MAX_COMPILATION_ATTEMPTS)
-
-        # --- Run Script ---
-        logger.info(f"Running test: {flaui_project_path}")
-        generated_recording_dir = iteration_dir + "/recordings"
-        recorder = Recorder(output_folder=generated_recording_dir, take_screenshots=False)
-        recorder.start()
-        execution_result = run_command(["dotnet", "test", "--logger", "console;verbosity=detailed"], project_dir)
-        logger.info(f"--- Execution Output ---\n{execution_result['stdout']}\n{execution_result['stderr']}\n---")
-        recorder.stop()
-
-        # --- Log Execution Results ---
-        log_path = iteration_dir + "/execution_log.txt"
-        log_output = f"STDOUT:\n{execution_result['stdout']}\n\nSTDERR:\n{execution_result['stderr']}"
-        write_file(log_path, log_output)
-        logger.info(f"Execution log file written to {log_path}")
-
-        if "!Passed!" in execution_result['stdout']:
-            logger.info("--- Test Executed Successfully! ---")
-            execution_success = True
-            break
-
-        logger.warning("--- Test Execution Failed! ---")
-        if i == MAX_EXECUTION_ATTEMPTS - 1: break
-
-        logger.info("Collecting and sending data for refinement...")
-         # --- Dump UI Tree ---
-        ui_dump_path = os.path.join(iteration_dir, "ui_dump.json.txt")
-        res = dump_ui_tree(process_name=args.process_name, window_title=args.window_title, output_file=ui_dump_path, whitelist=args.process_name, screenshots=False)
-        logger.info(f"UI tree dump : {res}")
-
-        prompt_parts = ["The previously generated script failed to execute correctly.\nAttached are the logs of the failed run for analysis, and script refinement."]
-        prompt_parts.extend(upload_dir_files(client, iteration_dir))
-
-        # --- Generate Script ---
-        response = send_message_with_retries(
-            chat,
-            prompt_parts,
-            types.GenerateContentConfig(
-                response_schema=CodeResponse,
-                response_mime_type="application/json",
-                system_instruction=system_prompt
-            )
+                template_parts = [f for _, f, _ in upload_files(client, template_files, cache=upload_cache, mime_type="text/plain") if f]
+
+        prompt_parts = []
+        logger.info("Generating initial script... (This may take a moment)")
+        prompt_parts.extend(initial_files)
+        prompt_parts.extend(template_parts)
+        prompt_parts.append("Generate the initial C# script to perform the recorded scenario using FlaUI and MSTest.")
+
+        # --- Compilation Loop ---
+        compilation_success = False
+        code_response = None
+        iteration_dir = ""
+        for i in range(MAX_COMPILATION_ATTEMPTS):
+            logger.info(f"--- Compilation Attempt {i+1}/{MAX_COMPILATION_ATTEMPTS} ---")
+            with span("compilation", iteration=f"compilation/{i}"):
+
+                # --- Generate Script ---
+                if i > 0:
+                    prompt_parts = ["The previously generated script failed to compile.\nAttached is a summary of the compilation errors, with the offending source lines, for analysis and script refinement."]
+                    with span("upload.iteration"):
+                        prompt_parts.extend(upload_dir(iteration_dir, os.path.join(iteration_dir, CONTEXT_PLAN_FILE)))
+                iteration_dir = COMPILATION_ITERATION_DIR.format(run_output_dir=run_output_dir, i=i)
+                if args.candidates > 1:
+                    # --- Generate and Compile Candidates in Parallel ---
+                    candidates_dir = CANDIDATES_DIR.format(run_output_dir=run_output_dir, i=i)
+                    with span("candidates", count=args.candidates):
+                        code_response, compilation_result = generate_and_build_candidates(
+                            chat, prompt_parts, generation_config, args.candidates,
+                            project_dir, candidates_dir, write_response_files, BUILD_COMMAND
+                        )
+                    write_response_files(code_response, project_dir)
+                else:
+                    with span("generate"):
+                        response = chat.send_message(prompt_parts, generation_config)
+                    code_response: CodeResponse = response.parsed
+                    # --- Write Scripts to File ---
+                    write_response_files(code_response, project_dir)
+
+                    # --- Compile Script ---
+                    logger.info(f"Compiling scripts: {flaui_project_path}")
+                    with span("build"):
+                        compilation_result = run_command(BUILD_COMMAND, project_dir, parsers=build_parsers())
+                if code_response.failure_reason:
+                    logger.info(f"LLM failure reason: {code_response.failure_reason}")
+                if code_response.comments:
+                    logger.info(f"LLM comments: {code_response.comments}")
+                write_response_files(code_response, iteration_dir, rename_to_txt=True)
+                logger.info(f"--- Compilation Output ---\n{compilation_result['stdout']}\n{compilation_result['stderr']}\n---")
+
+                # The raw log stays on disk (.log is not uploaded), the LLM gets the distilled summary
+                log_path = iteration_dir + "/compilation_log.log"
+                log_output = f"STDOUT:\n{compilation_result['stdout']}\n\nSTDERR:\n{compilation_result['stderr']}"
+                write_file(log_path, log_output)
+                summary_path = iteration_dir + "/compilation_summary.txt"
+                write_file(summary_path, distill_build_log(compilation_result['stdout'], compilation_result['stderr'], project_dir))
+                logger.info(f"Compilation log file written to {log_path}")
+
+                if compilation_result['returncode'] == 0:
+                    logger.info("--- Compilation Successful! ---")
+                    compilation_success = True
+                    break
+
+                logger.warning("--- Compilation Failed! ---")
+                if i == MAX_COMPILATION_ATTEMPTS - 1: break
+
+        if not compilation_success:
+            logger.error("--- Max Compilation Retries Reached! Could not compile the script. ---")
+            return
+
+        # --- Execution Loop ---
+        def start_recording(recordings_dir):
+            buffer_seconds = None if args.full_recording else FAILURE_CAPTURE_SECONDS
+            recorder = Recorder(output_folder=recordings_dir, take_screenshots=False, buffer_seconds=buffer_seconds)
+            recorder.start()
+            return recorder
+
+        def stop_recording(recorder, failed):
+            recorder.stop()
+            # In failure capture mode, passing runs leave nothing on disk
+            if recorder.buffer_seconds and failed:
+                recorder.save()
+
+        def upload(file_paths):
+            if args.replay:
+                return local_files(file_paths)
+            return [f for _, f, _ in upload_files(client, file_paths, cache=upload_cache) if f]
+
+        pipeline = ExecutionPipeline(
+            TEST_COMMAND, project_dir,
+            start_recording=start_recording,
+            stop_recording=stop_recording,
+            dump_ui=lambda output_file: dump_ui_tree(process_name=args.process_name, window_title=args.window_title, output_file=output_file, whitelist=args.process_name, screenshots=False),
+            upload=upload,
+            generate=lambda parts: chat.send_message(parts, generation_config),
+            planner=planner,
+            plan_file_name=CONTEXT_PLAN_FILE
         )
-        code_response = response.parsed
-        if code_response.failure_reason:
-            logger.info(f"LLM failure reason: {code_response.failure_reason}")
-        if code_response.comments:
-            logger.info(f"LLM comments: {code_response.comments}")
-        # --- Write Script to File ---
-        write_response_files(code_response, project_dir)
-        write_response_files(code_response, iteration_dir, rename_to_txt=True)
-
-    if not execution_success:
-        logger.error("--- Max Execution Retries Reached! Could not fix the script. ---")
+        execution_success = False
+        for i in range(MAX_EXECUTION_ATTEMPTS):
+            logger.info(f"--- Execution Attempt {i+1}/{MAX_EXECUTION_ATTEMPTS} ---")
+            iteration = f"execution/{i}"
+            with span("execution", iteration=iteration):
+                iteration_dir = EXECUTION_ITERATION_DIR.format(run_output_dir=run_output_dir, i=i + MAX_COMPILATION_ATTEMPTS)
+
+                # --- Run Script, then Collect Data and Generate the Refined Script concurrently ---
+                logger.info(f"Running test: {flaui_project_path}")
+                prompt = "The previously generated script failed to execute correctly.\nAttached are a summary of the failed test run and its recording for analysis, and script refinement."
+                execution_result, response = pipeline.run(iteration_dir, prompt, iteration=iteration, last=i == MAX_EXECUTION_ATTEMPTS - 1)
+
+                if "!Passed!" in execution_result['stdout']:
+                    logger.info("--- Test Executed Successfully! ---")
+                    execution_success = True
+                    break
+
+                logger.warning("--- Test Execution Failed! ---")
+                if response is None: break
+
+                code_response = response.parsed
+                if code_response.failure_reason:
+                    logger.info(f"LLM failure reason: {code_response.failure_reason}")
+                if code_response.comments:
+                    logger.info(f"LLM comments: {code_response.comments}")
+                # --- Write Script to File ---
+                write_response_files(code_response, project_dir)
+                write_response_files(code_response, iteration_dir, rename_to_txt=True)
+
+        if not execution_success:
+            logger.error("--- Max Execution Retries Reached! Could not fix the script. ---")
+    finally:
+        finish_run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
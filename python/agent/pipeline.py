@@ -0,0 +1,170 @@
+import os
+import asyncio
+import threading
+from python.common.logger import get_logger
+from python.common.common_flow import run_command, write_file, collect_dir_files
+from python.common.output_parsers import dotnet_test_parsers
+from python.common.log_distiller import distill_test_log
+from python.common.context_planner import artifact_kind, PINNED_KINDS
+from python.common.tracing import span
+
+logger = get_logger(__name__)
+
+UPLOAD_EXTENSIONS = (".mp4", ".png", ".txt")
+
+async def run_step(name, func, *args, attributes=None, **kwargs):
+    """
+    Awaits a blocking step run on a worker thread, traced as a span with the given attributes.
+    """
+    def run():
+        with span(name, **(attributes or {})):
+            return func(*args, **kwargs)
+    return await asyncio.to_thread(run)
+
+async def run_command_async(command, cwd=None, timeout=300, parsers=None, name="run_command", attributes=None):
+    """
+    Awaitable run_command. Cancelling the awaiting task kills the process tree.
+    """
+    cancel_event = threading.Event()
+    try:
+        return await run_step(name, run_command, command, cwd, timeout, parsers, cancel_event=cancel_event, attributes=attributes)
+    except asyncio.CancelledError:
+        cancel_event.set()
+        raise
+
+class ArtifactUploads:
+    """
+    Starts uploading each artifact as soon as it is written, in the background.
+    results() returns the uploaded parts in the order upload_dir_files would have used.
+    With a planner, only the artifacts it always keeps (the failure summaries) are uploaded eagerly:
+    the others are planned on their local copies once all are written, and only the selected ones
+    are uploaded, so that the byte budget bounds what is actually sent.
+    """
+    def __init__(self, upload, attributes=None, planner=None, plan_file=None):
+        self.upload = upload
+        self.attributes = attributes
+        self.planner = planner
+        self.plan_file = plan_file
+        self.paths = []
+        self.tasks = {}
+
+    def _start(self, path):
+        if path not in self.tasks:
+            self.tasks[path] = asyncio.create_task(run_step("upload", self.upload, [path], attributes=self.attributes))
+
+    def submit(self, *paths):
+        for path in paths:
+            if path in self.paths:
+                continue
+            self.paths.append(path)
+            if self.planner is None or artifact_kind(path) in PINNED_KINDS:
+                self._start(path)
+
+    def submit_dir(self, dir_path, extensions=UPLOAD_EXTENSIONS):
+        self.submit(*collect_dir_files(dir_path, extensions))
+
+    async def results(self, root_dir, extensions=UPLOAD_EXTENSIONS):
+        order = {path: i for i, path in enumerate(collect_dir_files(root_dir, extensions))}
+        paths = sorted(self.paths, key=lambda p: (order.get(p, len(order)), p))
+        if self.planner:
+            paths = await asyncio.to_thread(self.planner.select, paths, self.plan_file)
+        for path in paths:
+            self._start(path)
+        parts = []
+        for path in paths:
+            try:
+                parts.extend(await self.tasks[path])
+            except Exception as e:
+                logger.error(f"Upload of {path} failed: {e}")
+        return parts
+
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
+
+class ExecutionPipeline:
+    """
+    Runs one test execution iteration with its independent steps overlapped:
+    the UI dump runs while the recording finalizes, and every artifact is uploaded as soon as
+    it is written, so the iteration takes about as long as its longest chain of steps.
+    With a planner (see context_planner), the artifacts sent to the LLM are kept within its budget,
+    and the plan is written to plan_file_name in the iteration directory.
+    The blocking operations are injected, so stub commands and a fake LLM can stand in for them:
+        start_recording(recordings_dir) -> recording, stop_recording(recording, failed),
+        dump_ui(output_file), upload(paths) -> parts, generate(prompt_parts) -> response.
+    parsers() returns the output parsers of each test run, e.g. with the run's abort thresholds.
+    """
+    def __init__(self, test_command, project_dir, start_recording, stop_recording, dump_ui, upload, generate, test_timeout=300, planner=None, plan_file_name=None, parsers=dotnet_test_parsers):
+        self.test_command = list(test_command)
+        self.project_dir = project_dir
+        self.start_recording = start_recording
+        self.stop_recording = stop_recording
+        self.dump_ui = dump_ui
+        self.upload = upload
+        self.generate = generate
+        self.test_timeout = test_timeout
+        self.planner = planner
+        self.plan_file_name = plan_file_name
+        self.parsers = parsers
+
+    def run(self, iteration_dir, prompt, iteration=None, last=False):
+        """
+        Runs the iteration. Returns (execution_result, response); response is None when the test
+        passed or on the last iteration, where nothing is sent to the LLM.
+        """
+        return asyncio.run(self.run_iteration(iteration_dir, prompt, iteration, last))
+
+    @staticmethod
+    async def _then(task, callback):
+        await task
+        callback()
+
+    async def run_iteration(self, iteration_dir, prompt, iteration=None, last=False):
+        attributes = {'iteration': iteration} if iteration is not None else {}
+        recordings_dir = os.path.join(iteration_dir, "recordings")
+        plan_file = os.path.join(iteration_dir, self.plan_file_name) if self.plan_file_name else None
+        uploads = ArtifactUploads(self.upload, attributes, self.planner, plan_file)
+        tasks = []
+        try:
+            # --- Run Script ---
+            recording = await run_step("recorder.start", self.start_recording, recordings_dir, attributes=attributes)
+            try:
+                execution_result = await run_command_async(self.test_command, self.project_dir, self.test_timeout, self.parsers(), name="test", attributes=attributes)
+            except BaseException:
+                await run_step("recorder.stop", self.stop_recording, recording, True, attributes=attributes)
+                raise
+            passed = "!Passed!" in execution_result['stdout']
+            stop_task = asyncio.create_task(run_step("recorder.stop", self.stop_recording, recording, not passed, attributes=attributes))
+            tasks.append(stop_task)
+            logger.info(f"--- Execution Output ---\n{execution_result['stdout']}\n{execution_result['stderr']}\n---")
+
+            # --- Log Execution Results ---
+            log_path = os.path.join(iteration_dir, "execution_log.log")
+            write_file(log_path, f"STDOUT:\n{execution_result['stdout']}\n\nSTDERR:\n{execution_result['stderr']}")
+            summary_path = os.path.join(iteration_dir, "execution_summary.txt")
+            write_file(summary_path, distill_test_log(execution_result['stdout'], execution_result['stderr'], self.project_dir))
+            logger.info(f"Execution log file written to {log_path}")
+            if passed or last:
+                await stop_task
+                return execution_result, None
+            uploads.submit(summary_path)
+
+            # --- Dump UI Tree, while the recording finalizes ---
+            logger.info("Collecting and sending data for refinement...")
+            ui_dump_path = os.path.join(iteration_dir, "ui_dump.json.txt")
+            dump_task = asyncio.create_task(run_step("dump_ui_tree", self.dump_ui, ui_dump_path, attributes=attributes))
+            tasks.append(dump_task)
+            await asyncio.gather(
+                self._then(dump_task, lambda: uploads.submit(*[p for p in (ui_dump_path,) if os.path.exists(p)])),
+                self._then(stop_task, lambda: uploads.submit_dir(recordings_dir))
+            )
+            logger.info(f"UI tree dump : {dump_task.result()}")
+
+            # --- Generate Script ---
+            prompt_parts = [prompt] + await uploads.results(iteration_dir)
+            response = await run_step("generate", self.generate, prompt_parts, attributes=attributes)
+            return execution_result, response
+        finally:
+            uploads.cancel()
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,122 @@
+import os
+import shutil
+import psutil
+from python.common.logger import get_logger
+from python.common.common_flow import run_command
+
+logger = get_logger(__name__)
+
+# Build output is kept between runs so that builds stay incremental
+BUILD_DIRS = ("bin", "obj")
+LOCK_FILE = ".workspace.lock"
+
+class WorkspacePool:
+    """
+    Pool of reusable, pre-restored copies of the template project.
+    Template sources are hardlinked into each workspace (copied where linking is not
+    possible), only the generated files are real copies since they get rewritten.
+    bin/ and obj/ survive between runs, so only the first build of a workspace is cold.
+    """
+    def __init__(self, template_dir, pool_dir, generated_files=("TestClass.cs", "ApplicationPage.cs"), warm_command=None):
+        self.template_dir = template_dir
+        self.pool_dir = pool_dir
+        self.generated_files = generated_files
+        self.warm_command = warm_command
+
+    def _template_files(self):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.template_dir):
+            dirnames[:] = [d for d in dirnames if d not in BUILD_DIRS]
+            for filename in filenames:
+                files.append(os.path.relpath(os.path.join(dirpath, filename), self.template_dir))
+        return files
+
+    def _try_lock(self, workspace_dir):
+        lock_path = os.path.join(workspace_dir, LOCK_FILE)
+        os.makedirs(workspace_dir, exist_ok=True)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Reclaim workspaces left locked by runs that died
+            try:
+                with open(lock_path, 'r') as f:
+                    pid = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                pid = 0
+            if pid and psutil.pid_exists(pid):
+                return False
+            os.remove(lock_path)
+            return self._try_lock(workspace_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+
+    def acquire(self):
+        """
+        Hands out a free workspace, reset to the template. Creates a new one if all are in use.
+        """
+        os.makedirs(self.pool_dir, exist_ok=True)
+        index = 0
+        while True:
+            workspace_dir = os.path.join(self.pool_dir, f"workspace{index}")
+            is_new = not os.path.exists(workspace_dir)
+            if self._try_lock(workspace_dir):
+                break
+            index += 1
+        self.reset(workspace_dir)
+        if is_new and self.warm_command:
+            logger.info(f"Warming up new workspace {workspace_dir}...")
+            run_command(list(self.warm_command), workspace_dir)
+        logger.info(f"Using workspace {workspace_dir}")
+        return workspace_dir
+
+    def release(self, workspace_dir):
+        try:
+            os.remove(os.path.join(workspace_dir, LOCK_FILE))
+        except OSError:
+            pass
+
+    def _place(self, source, target, generated):
+        if os.path.exists(target):
+            if not generated:
+                # Keep linked or identical copies untouched, so MSBuild timestamps stay valid
+                if os.path.samefile(source, target):
+                    return
+                source_stat, target_stat = os.stat(source), os.stat(target)
+                if source_stat.st_size == target_stat.st_size and source_stat.st_mtime == target_stat.st_mtime:
+                    return
+            os.remove(target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if generated:
+            # Generated files are rewritten in place, they must never share an inode with the template
+            shutil.copyfile(source, target)
+            return
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    def reset(self, workspace_dir):
+        """
+        Brings a workspace back to the template state, touching only files that differ.
+        """
+        template_files = self._template_files()
+        for relative_path in template_files:
+            is_generated = os.path.basename(relative_path) in self.generated_files
+            self._place(os.path.join(self.template_dir, relative_path), os.path.join(workspace_dir, relative_path), is_generated)
+
+        # Drop files that are not part of the template anymore
+        expected = set(template_files) | {LOCK_FILE}
+        for dirpath, dirnames, filenames in os.walk(workspace_dir):
+            dirnames[:] = [d for d in dirnames if d not in BUILD_DIRS]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.relpath(path, workspace_dir) not in expected:
+                    os.remove(path)
+
+    def export(self, workspace_dir, target_dir):
+        """
+        Copies the workspace sources (without build output) to target_dir, e.g. the run output folder.
+        """
+        shutil.copytree(workspace_dir, target_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns(LOCK_FILE, *BUILD_DIRS))
+        logger.info(f"Exported project to {target_dir}")
@@ -1,15 +1,27 @@
 import os
+import queue
+import signal
 import subprocess
 import threading
 import time
 import shutil
-from google import genai
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 from python.common.logger import get_logger
+from python.common.upload_cache import UploadCache, file_hash
+from python.common.llm_client import LLMClient, get_shared_bucket, get_status_code
+from python.common.output_parsers import OutputParser
+from python.common.tracing import span
 
 logger = get_logger(__name__)
 
+# generate_content errors on attached files that are gone: 403 once expired or for another project, 404 once deleted
+STALE_FILE_STATUS_CODES = (403, 404)
+
 def initialize_gemini_client():
     """Initializes and returns the Gemini client."""
+    # google-genai is slow to import, only pay for it when a client is actually needed
+    from google import genai
     try:
         client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
         return client
@@ -18,49 +30,141 @@ def initialize_gemini_client():
         logger.error("Please make sure you have set up your API key or ADC correctly.")
         exit()
 
-def send_message_with_retries(chat, prompt_parts, config, max_retries=3, retry_delay=2):
+def send_message_with_retries(chat, prompt_parts, config, max_retries=3, retry_delay=2, llm_client: LLMClient = None):
     """
-    Sends a message using chat.send_message, retries up to max_retries if a 503 error is returned.
-    Returns the response or raises the last exception.
+    Sends a message using chat.send_message, retrying throttling (429), server errors and timeouts
+    with exponential backoff through the rate limiter shared by all runs on the API key.
+    max_retries is the number of attempts, as it has always been here (LLMClient counts the retries
+    after the first attempt). Returns the response or raises the last exception.
     """
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = chat.send_message(prompt_parts, config=config)
-            return response
-        except Exception as e:
-            # Check for 503 error in exception message
-            if hasattr(e, 'status_code') and e.status_code == 503:
-                logger.warning(f"503 Service Unavailable. Retry {attempt}/{max_retries}...")
-                time.sleep(retry_delay)
-            elif '503' in str(e):
-                logger.warning(f"503 Service Unavailable. Retry {attempt}/{max_retries}...")
-                time.sleep(retry_delay)
-            else:
-                raise
-    raise Exception(f"Failed after {max_retries} retries due to repeated 503 errors.")
+    if llm_client is None:
+        llm_client = LLMClient(rate_limiter=get_shared_bucket(), max_retries=max(0, max_retries - 1), base_delay=retry_delay)
+    return llm_client.send_message(chat, prompt_parts, config)
 
-def run_command(command: list[str], cwd: str = None, timeout: int = 300) -> dict:
+def _kill_process_tree(process):
     """
-    Runs a command and captures its output.
-    Returns a dictionary containing 'stdout', 'stderr', and 'returncode'.
+    Kills a process and its children (e.g. the testhost spawned by `dotnet test`).
+    """
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], capture_output=True)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except Exception:
+        pass
+    try:
+        process.kill()
+    except Exception:
+        pass
+
+def _read_stream(stream, name, lines_queue):
+    for line in iter(stream.readline, ''):
+        lines_queue.put((name, line))
+    stream.close()
+    lines_queue.put((name, None))
+
+def run_command(command: list[str], cwd: str = None, timeout: int = 300, parsers: list[OutputParser] = None, grace_period: float = 5.0, cancel_event: threading.Event = None) -> dict:
+    """
+    Runs a command, streaming its output line by line to the given parsers (see _run_command).
+    """
+    with span("run_command", command=' '.join(command)) as attributes:
+        result = _run_command(command, cwd, timeout, parsers, grace_period, cancel_event)
+        attributes['returncode'] = result['returncode']
+        attributes['aborted'] = result['aborted']
+        return result
+
+def _run_command(command, cwd, timeout, parsers, grace_period, cancel_event):
+    """
+    Runs a command, streaming its output line by line to the given parsers.
+    When a parser reports a fatal line, the process is killed after grace_period seconds,
+    so that a stuck build or test doesn't burn the full timeout.
+    Returns a dictionary containing 'stdout', 'stderr', 'returncode', 'aborted', 'abort_reason'
+    and 'findings' (the structured result of each parser).
     """
     logger.info(f"Running command: {' '.join(command)}")
+    parsers = parsers or []
+    output = {'stdout': [], 'stderr': []}
+    abort_reason = None
+    abort_deadline = None
+    timed_out = False
     try:
-        result = subprocess.run(
+        process = subprocess.Popen(
             command,
             cwd=cwd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
             encoding='utf-8',
-            timeout=timeout
+            errors='replace',
+            bufsize=1,
+            start_new_session=(os.name != 'nt')
         )
-        return {'stdout': result.stdout, 'stderr': result.stderr, 'returncode': result.returncode}
-    except subprocess.TimeoutExpired as e:
-        error_output = f"TimeoutExpired: Command execution timed out after {timeout} seconds.\n"
-        error_output += f"STDOUT:\n{e.stdout}\n\nSTDERR:\n{e.stderr}"
-        return {'stdout': e.stdout or "", 'stderr': error_output, 'returncode': -1}
     except Exception as e:
-        return {'stdout': '', 'stderr': f"An unexpected error occurred: {e}", 'returncode': -1}
+        return {'stdout': '', 'stderr': f"An unexpected error occurred: {e}", 'returncode': -1, 'aborted': False, 'abort_reason': None, 'findings': {}}
+
+    lines_queue = queue.Queue()
+    readers = [threading.Thread(target=_read_stream, args=(getattr(process, name), name, lines_queue), daemon=True) for name in ('stdout', 'stderr')]
+    for reader in readers:
+        reader.start()
+
+    deadline = time.monotonic() + timeout
+    open_streams = 2
+    killed = False
+    while open_streams:
+        try:
+            name, line = lines_queue.get(timeout=0.1)
+        except queue.Empty:
+            name, line = None, None
+        if name is not None:
+            if line is None:
+                open_streams -= 1
+            else:
+                output[name].append(line)
+                for parser in parsers:
+                    reason = parser.feed(line.rstrip('\n'), name)
+                    if reason and not abort_reason:
+                        abort_reason = reason
+                        abort_deadline = time.monotonic() + grace_period
+                        logger.warning(f"Fatal output detected ({reason}), stopping in {grace_period}s...")
+
+        if killed:
+            continue
+        now = time.monotonic()
+        if cancel_event is not None and cancel_event.is_set():
+            abort_reason = abort_reason or "Cancelled"
+            abort_deadline = now
+        if now >= deadline:
+            timed_out = True
+        if timed_out or (abort_deadline is not None and now >= abort_deadline):
+            _kill_process_tree(process)
+            killed = True
+            # Children holding the pipes open may keep the readers blocked; don't wait on them forever
+            for reader in readers:
+                reader.join(timeout=5)
+            while not lines_queue.empty():
+                name, line = lines_queue.get_nowait()
+                if line is not None:
+                    output[name].append(line)
+            break
+
+    returncode = process.wait()
+    stdout = ''.join(output['stdout'])
+    stderr = ''.join(output['stderr'])
+    if timed_out:
+        error_output = f"TimeoutExpired: Command execution timed out after {timeout} seconds.\n"
+        error_output += f"STDOUT:\n{stdout}\n\nSTDERR:\n{stderr}"
+        stderr, returncode = error_output, -1
+    elif killed:
+        stderr += f"\nAborted early: {abort_reason}"
+        returncode = returncode if returncode else -1
+    return {
+        'stdout': stdout,
+        'stderr': stderr,
+        'returncode': returncode,
+        'aborted': killed,
+        'abort_reason': abort_reason if killed else None,
+        'findings': {parser.name: parser.result() for parser in parsers},
+    }
 
 
 def run_python_script(script_path: str, timeout: int = 120):
@@ -94,55 +198,233 @@ def write_file(file_path: str, content: str, with_line_numbers: bool = False) ->
     return f"File '{file_path}' written successfully."
 
 
-def upload_file(client, file_path):
-    """
-    Uploads a file using the Gemini client, handles .json renaming, and waits for processing.
-    Returns the uploaded file object or None if failed.
-    """
+def _prepare_upload_path(file_path):
     # If ends with .json, rename to .json.txt
     if file_path.endswith('.json'):
         new_path = file_path + '.txt'
         os.rename(file_path, new_path)
         file_path = new_path
-    try:
-        logger.info(f"Uploading {os.path.basename(file_path)}...")
-        uploaded_file = client.files.upload(file=file_path)
-        # Wait for the file to be processed.
-        while uploaded_file.state.name == "PROCESSING":
-            logger.info("\tWaiting for file to be processed...")
-            time.sleep(2)
-            uploaded_file = client.files.get(name=uploaded_file.name)
+    return file_path
+
+def _start_upload(client, file_path, cache: UploadCache = None, mime_type: str = None):
+    """
+    Starts uploading a file without waiting for it to be processed.
+    Handles .json renaming and cache lookups. mime_type overrides the type guessed from the extension.
+    Returns (file_path, file object, content hash, whether it came from the cache).
+    """
+    from google.genai import types
+    file_path = _prepare_upload_path(file_path)
+    content_hash = file_hash(file_path)
+    if cache:
+        entry = cache.get(UploadCache.make_key(content_hash, file_path))
+        if entry:
+            logger.info(f"Reusing uploaded {os.path.basename(file_path)} ({entry['name']})")
+            cached_file = types.File(
+                name=entry['name'],
+                uri=entry['uri'],
+                mime_type=entry['mime_type'],
+                sha256_hash=entry['sha256_hash'],
+                state='ACTIVE'
+            )
+            return file_path, cached_file, content_hash, True
+    logger.info(f"Uploading {os.path.basename(file_path)}...")
+    config = types.UploadFileConfig(mime_type=mime_type, display_name=os.path.basename(file_path)) if mime_type else None
+    return file_path, client.files.upload(file=file_path, config=config), content_hash, False
+
+def upload_files(client, file_paths, cache: UploadCache = None, max_workers=4, min_poll_interval=0.5, max_poll_interval=5.0, mime_type: str = None):
+    """
+    Uploads files concurrently on a bounded thread pool.
+    A single poller checks the processing state of all in-flight files, backing off
+    while nothing changes.
+    Returns a list of (file_path, uploaded file or None, error or None) in the order of file_paths.
+    """
+    with span("upload_files", count=len(file_paths)):
+        return _upload_files(client, file_paths, cache, max_workers, min_poll_interval, max_poll_interval, mime_type)
+
+def _upload_files(client, file_paths, cache, max_workers, min_poll_interval, max_poll_interval, mime_type):
+    results = [(file_path, None, None) for file_path in file_paths]
+    if not file_paths:
+        return results
+
+    in_flight = {}  # index -> (file_path, file object, content hash)
+
+    def finish(index, file_path, uploaded_file, content_hash, cached=False):
         if uploaded_file.state.name == "FAILED":
-            logger.error(f"Error: File upload failed for {file_path}. Uploading the next file.")
-            return None
-        return uploaded_file
-    except Exception as e:
-        logger.error(f"\nError uploading file {file_path}: {e}")
-        return None
+            logger.error(f"Error: File upload failed for {file_path}.")
+            results[index] = (file_path, None, "Processing failed")
+            return
+        # Normalize to the local hex digest so prompt parts hash the same whether uploaded, cached or replayed
+        uploaded_file.sha256_hash = content_hash
+        if cache and not cached:
+            cache.put(UploadCache.make_key(content_hash, file_path), uploaded_file, file_path)
+        results[index] = (file_path, uploaded_file, None)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_start_upload, client, file_path, cache, mime_type): i for i, file_path in enumerate(file_paths)}
+        poll_interval = min_poll_interval
+        while futures or in_flight:
+            # Collect uploads that have finished transferring
+            done = [future for future in futures if future.done()]
+            for future in done:
+                index = futures.pop(future)
+                try:
+                    file_path, uploaded_file, content_hash, cached = future.result()
+                except Exception as e:
+                    logger.error(f"Error uploading file {file_paths[index]}: {e}")
+                    results[index] = (file_paths[index], None, str(e))
+                    continue
+                if uploaded_file.state.name == "PROCESSING":
+                    in_flight[index] = (file_path, uploaded_file, content_hash)
+                else:
+                    finish(index, file_path, uploaded_file, content_hash, cached)
+
+            # Check the state of every file still being processed in one pass
+            changed = bool(done)
+            for index, (file_path, uploaded_file, content_hash) in list(in_flight.items()):
+                try:
+                    uploaded_file = client.files.get(name=uploaded_file.name)
+                except Exception as e:
+                    logger.error(f"Error checking state of {file_path}: {e}")
+                    results[index] = (file_path, None, str(e))
+                    del in_flight[index]
+                    changed = True
+                    continue
+                if uploaded_file.state.name != "PROCESSING":
+                    del in_flight[index]
+                    finish(index, file_path, uploaded_file, content_hash)
+                    changed = True
+
+            if futures or in_flight:
+                if in_flight:
+                    logger.info(f"\tWaiting for {len(in_flight)} file(s) to be processed...")
+                poll_interval = min_poll_interval if changed else min(poll_interval * 1.5, max_poll_interval)
+                time.sleep(poll_interval)
+
+    failures = [(file_path, error) for file_path, _, error in results if error]
+    if failures:
+        logger.warning(f"{len(failures)}/{len(file_paths)} file(s) failed to upload: " + ", ".join(os.path.basename(f) for f, _ in failures))
+    return results
+
+def upload_file(client, file_path, cache: UploadCache = None):
+    """
+    Uploads a file using the Gemini client, handles .json renaming, and waits for processing.
+    If a cache is given, a still valid handle for identical content is reused instead of uploading.
+    Returns the uploaded file object or None if failed.
+    """
+    _, uploaded_file, _ = upload_files(client, [file_path], cache=cache, max_workers=1)[0]
+    return uploaded_file
+
+def is_stale_file_error(error):
+    """
+    Whether a request failed on an attached file the files API no longer serves:
+    expired, deleted, or uploaded under another API key.
+    """
+    return get_status_code(error) in STALE_FILE_STATUS_CODES and 'file' in str(error).lower()
 
-def upload_dir_files(client, dir_path, extensions=(".mp4", ".png", ".txt")):
+def reupload_stale_files(client, prompt_parts, cache: UploadCache = None):
     """
-    Uploads all files in a directory (recursively) matching the given extensions.
-    Returns a list of uploaded file objects.
+    Checks the uploaded files in prompt_parts and re-uploads the ones the files API no longer
+    serves from the local file they were uploaded from, replacing their cache entries.
+    Returns the prompt parts with the stale files replaced.
     """
-    uploaded_files = []
-    files_to_upload = []
-    for dirpath, _, filenames in os.walk(dir_path):
-        for filename in filenames:
+    from google.genai import types
+    parts = list(prompt_parts)
+    stale = {}  # part index -> (local path, mime type)
+    for i, part in enumerate(parts):
+        if not isinstance(part, types.File):
+            continue
+        try:
+            client.files.get(name=part.name)
+            continue
+        except Exception as e:
+            if get_status_code(e) not in STALE_FILE_STATUS_CODES:
+                raise
+        found = cache.find(part.name) if cache else None
+        if not found:
+            logger.warning(f"Uploaded file {part.name} is gone and its local copy is unknown.")
+            continue
+        key, entry = found
+        cache.invalidate(key)
+        file_path = entry.get('path')
+        if file_path and os.path.exists(file_path) and file_hash(file_path) == entry['sha256_hash']:
+            stale[i] = (file_path, entry['mime_type'])
+        else:
+            logger.warning(f"Uploaded file {part.name} is gone and {file_path} changed since, it can't be re-uploaded.")
+    if stale:
+        logger.info(f"Re-uploading {len(stale)} expired file(s)...")
+    # Keep the mime types they were uploaded with (e.g. sources uploaded as text/plain)
+    for mime_type in {mime_type for _, mime_type in stale.values()}:
+        indices = [i for i, (_, m) in stale.items() if m == mime_type]
+        results = upload_files(client, [stale[i][0] for i in indices], cache=cache, mime_type=mime_type)
+        for i, (_, uploaded_file, _) in zip(indices, results):
+            if uploaded_file:
+                parts[i] = uploaded_file
+    return parts
+
+def collect_dir_files(dir_path, extensions=(".mp4", ".png", ".txt"), skip_dirs=()):
+    """
+    Returns all files in a directory (recursively) matching the given extensions, in sorted path order.
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(dir_path):
+        dirnames[:] = sorted(d for d in dirnames if d not in skip_dirs)
+        for filename in sorted(filenames):
             if filename.endswith(extensions):
-                files_to_upload.append(os.path.join(dirpath, filename))
+                files.append(os.path.join(dirpath, filename))
+    return files
+
+def plan_dir_files(dir_path, extensions=(".mp4", ".png", ".txt"), planner=None, plan_file=None):
+    """
+    Returns the files of a directory to send to the LLM: all of them, or the ones the
+    context planner (see context_planner.ContextPlanner) selects within its budget.
+    """
+    file_paths = collect_dir_files(dir_path, extensions)
+    if planner is None:
+        return file_paths
+    return planner.select(file_paths, plan_file)
+
+def upload_dir_files(client, dir_path, extensions=(".mp4", ".png", ".txt"), cache: UploadCache = None, max_workers=4, planner=None, plan_file=None):
+    """
+    Uploads all files in a directory (recursively) matching the given extensions, concurrently.
+    Files whose content was already uploaded are served from the cache, if given.
+    With a planner, only the files it selects within its budget are uploaded, and the plan
+    (including what was dropped) is written to plan_file.
+    Returns a list of uploaded file objects, in a deterministic (sorted path) order.
+    """
+    results = upload_files(client, plan_dir_files(dir_path, extensions, planner, plan_file), cache=cache, max_workers=max_workers)
+    return [uploaded_file for _, uploaded_file, _ in results if uploaded_file]
 
-    
+def local_files(file_paths, mime_type: str = None):
+    """
+    Offline counterpart of upload_files: returns local placeholder file objects carrying
+    the content hash, without any network access. Used to replay cached LLM responses.
+    """
+    from google.genai import types
+    placeholders = []
+    for file_path in file_paths:
+        file_path = _prepare_upload_path(file_path)
+        content_hash = file_hash(file_path)
+        placeholders.append(types.File(
+            name=f"local/{content_hash}",
+            display_name=os.path.basename(file_path),
+            mime_type=mime_type or mimetypes.guess_type(file_path)[0] or 'text/plain',
+            sha256_hash=content_hash,
+            state='ACTIVE'
+        ))
+    return placeholders
 
-    for file_path in files_to_upload:
-        uploaded_file = upload_file(client, file_path)
-        if uploaded_file:
-            uploaded_files.append(uploaded_file)
-    return uploaded_files
+def local_dir_files(dir_path, extensions=(".mp4", ".png", ".txt"), planner=None, plan_file=None):
+    """
+    Offline counterpart of upload_dir_files, see local_files.
+    """
+    return local_files(plan_dir_files(dir_path, extensions, planner, plan_file))
 
-def dump_ui_tree(process_name: str = None, window_title: str = None, output_file: str = None, whitelist: list[str] = None, screenshots: bool = False) -> str:
+def dump_ui_tree(process_name: str = None, window_title: str = None, output_file: str = None, whitelist: list[str] = None, screenshots: bool = False, profile: str = 'full',
+                 atlas: bool = False) -> str:
     """
     Dumps the UI Automation tree for a given process or window to a JSON file.
+    profile selects the element properties written (see uia.PROFILES).
+    With atlas, screenshots are packed into atlas images instead of one file per element.
     """
     from python.common.uia import dump_ui
 
@@ -153,12 +435,15 @@ def dump_ui_tree(process_name: str = None, window_title: str = None, output_file
             window_title=window_title,
             output_file=output_file,
             whitelist=whitelist,
-            screenshots=screenshots
+            screenshots=screenshots,
+            profile=profile,
+            atlas=atlas
         )
 
-    thread = threading.Thread(target=dump_ui_wrapper, daemon=True)
-    thread.start()
-    thread.join(timeout=10)
+    with span("dump_ui_tree"):
+        thread = threading.Thread(target=dump_ui_wrapper, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
 
     if thread.is_alive():
         return "Error: UI dump timed out after 10 seconds."
@@ -0,0 +1,233 @@
+import os
+import re
+import json
+import struct
+from python.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --- Cost Model ---
+# Gemini token costs: an image up to 384px is 258 tokens, larger ones are tiled in 768px tiles of
+# 258 tokens each; video is 263 tokens per second (1 fps frames plus audio); text is ~4 characters per token.
+TOKENS_PER_IMAGE_TILE = 258
+IMAGE_TILE_SIZE = 768
+SMALL_IMAGE_SIZE = 384
+TOKENS_PER_VIDEO_SECOND = 263
+CHARS_PER_TOKEN = 4
+# Used when an mp4 duration can't be read
+BYTES_PER_VIDEO_SECOND = 250 * 1024
+
+# --- Relevance ---
+# Base relevance by kind of artifact, boosted by the signals below
+KIND_WEIGHTS = {
+    'summary': 1.0,
+    'annotations': 0.9,
+    'video': 0.7,
+    'code': 0.6,
+    'ui_dump': 0.5,
+    'text': 0.4,
+    'screenshot': 0.3,
+}
+# Always kept, whatever the budget: the LLM can't act without the failure summary
+PINNED_KINDS = ('summary',)
+MENTION_BOOST = 0.5
+TOUCHED_BOOST = 0.3
+RECENCY_BOOST = 0.2
+
+SCREENSHOT_NAME_PATTERN = re.compile(r'^(?P<element_id>.+)__(?P<timestamp>\d+)\.png$')
+
+def artifact_kind(file_path):
+    name = os.path.basename(file_path)
+    if name.endswith('_summary.txt'):
+        return 'summary'
+    if name.startswith('annotations') and name.endswith('.json.txt'):
+        return 'annotations'
+    if name.startswith('ui_dump'):
+        return 'ui_dump'
+    if name.endswith('.mp4'):
+        return 'video'
+    if name.endswith('.png'):
+        return 'screenshot'
+    if name.endswith('.cs.txt'):
+        return 'code'
+    return 'text'
+
+def _png_size(file_path):
+    with open(file_path, 'rb') as f:
+        header = f.read(24)
+    if len(header) < 24 or header[:8] != b'\x89PNG\r\n\x1a\n':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+def _mp4_duration(file_path):
+    """
+    Reads the duration of an mp4 from its movie header (moov/mvhd), without decoding anything.
+    """
+    def find(f, end, box_type):
+        while f.tell() + 8 <= end:
+            size, kind = struct.unpack('>I4s', f.read(8))
+            header = 8
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+                header = 16
+            elif size == 0:
+                size = end - f.tell() + 8
+            if kind == box_type:
+                return f.tell(), f.tell() - header + size
+            f.seek(size - header, os.SEEK_CUR)
+        return None
+
+    with open(file_path, 'rb') as f:
+        moov = find(f, os.path.getsize(file_path), b'moov')
+        if not moov:
+            return None
+        f.seek(moov[0])
+        mvhd = find(f, moov[1], b'mvhd')
+        if not mvhd:
+            return None
+        f.seek(mvhd[0])
+        version = f.read(4)[0]
+        if version == 1:
+            timescale, duration = struct.unpack('>16xIQ', f.read(28))
+        else:
+            timescale, duration = struct.unpack('>8xII', f.read(16))
+        return duration / timescale if timescale else None
+
+def estimate_tokens(file_path, size):
+    kind = artifact_kind(file_path)
+    try:
+        if kind == 'video':
+            duration = _mp4_duration(file_path)
+            if duration is None:
+                duration = size / BYTES_PER_VIDEO_SECOND
+            return int(duration * TOKENS_PER_VIDEO_SECOND)
+        if kind == 'screenshot':
+            dimensions = _png_size(file_path)
+            if dimensions is None or max(dimensions) <= SMALL_IMAGE_SIZE:
+                return TOKENS_PER_IMAGE_TILE
+            tiles = -(-dimensions[0] // IMAGE_TILE_SIZE) * -(-dimensions[1] // IMAGE_TILE_SIZE)
+            return tiles * TOKENS_PER_IMAGE_TILE
+    except (OSError, struct.error, IndexError) as e:
+        logger.warning(f"Could not read {file_path} to estimate its cost: {e}")
+    return size // CHARS_PER_TOKEN
+
+# --- Planner ---
+
+class ContextPlanner:
+    """
+    Picks the artifacts sent to the LLM under a token (and optionally byte) budget.
+    Each artifact is costed and ranked by relevance: its kind, whether the build/test logs mention
+    it, whether the recorded events touched its element, and how recent it is. Artifacts are then
+    taken by decreasing relevance while they fit; the failure summaries are always kept.
+    """
+    def __init__(self, token_budget=None, byte_budget=None):
+        self.token_budget = token_budget
+        self.byte_budget = byte_budget
+
+    def _error_text(self, file_paths):
+        # The distilled summaries, plus the raw logs next to the artifacts (.log files are never uploaded)
+        sources = {p for p in file_paths if artifact_kind(p) == 'summary'}
+        for dir_path in {os.path.dirname(p) for p in file_paths}:
+            sources.update(os.path.join(dir_path, name) for name in os.listdir(dir_path) if name.endswith('.log'))
+        text = []
+        for source in sorted(sources):
+            try:
+                with open(source, 'r', encoding='utf-8', errors='replace') as f:
+                    text.append(f.read())
+            except OSError:
+                continue
+        return "\n".join(text)
+
+    def _touched_elements(self, file_paths):
+        """
+        Returns {element id: index of the last event that touched it} over the annotation files.
+        """
+        from python.recorder.element_table import load_annotations
+        touched = {}
+        for file_path in file_paths:
+            if artifact_kind(file_path) != 'annotations':
+                continue
+            try:
+                events = load_annotations(file_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not read annotations {file_path}: {e}")
+                continue
+            for index, event in enumerate(events):
+                for element_info in event.get('element_hierarchy') or ():
+                    touched[element_info['id']] = index
+        return touched
+
+    def plan(self, file_paths):
+        """
+        Returns the plan: {'budget': ..., 'selected': [...], 'dropped': [...], 'tokens': ..., 'bytes': ...},
+        each artifact entry having its path, kind, cost, relevance score and reasons.
+        """
+        error_text = self._error_text(file_paths)
+        touched = self._touched_elements(file_paths)
+        last_touch = max(touched.values(), default=0)
+        mtimes = {p: os.path.getmtime(p) for p in file_paths}
+        age_rank = {p: i for i, p in enumerate(sorted(file_paths, key=lambda p: mtimes[p]))}
+
+        artifacts = []
+        for file_path in file_paths:
+            kind = artifact_kind(file_path)
+            size = os.path.getsize(file_path)
+            score = KIND_WEIGHTS[kind]
+            reasons = [kind]
+            name = os.path.basename(file_path)
+            match = SCREENSHOT_NAME_PATTERN.match(name)
+            subject = match.group('element_id') if match else name.split('.')[0]
+            if subject and re.search(r'(?<!\w)' + re.escape(subject) + r'(?!\w)', error_text):
+                score += MENTION_BOOST
+                reasons.append('mentioned in logs')
+            if match and match.group('element_id') in touched:
+                # Elements touched by the last events matter most
+                score += TOUCHED_BOOST * (0.5 + 0.5 * touched[match.group('element_id')] / max(last_touch, 1))
+                reasons.append('element touched')
+            if len(file_paths) > 1:
+                score += RECENCY_BOOST * age_rank[file_path] / (len(file_paths) - 1)
+            artifacts.append({
+                'path': file_path,
+                'kind': kind,
+                'bytes': size,
+                'tokens': estimate_tokens(file_path, size),
+                'score': round(score, 3),
+                'reasons': reasons,
+            })
+
+        selected, dropped = [], []
+        tokens = size = 0
+        # Pinned artifacts first, then by decreasing relevance; ties go to the cheaper artifact
+        for artifact in sorted(artifacts, key=lambda a: (a['kind'] not in PINNED_KINDS, -a['score'], a['tokens'], a['path'])):
+            pinned = artifact['kind'] in PINNED_KINDS
+            if not pinned and self.token_budget is not None and tokens + artifact['tokens'] > self.token_budget:
+                dropped.append({**artifact, 'dropped_because': 'token budget'})
+            elif not pinned and self.byte_budget is not None and size + artifact['bytes'] > self.byte_budget:
+                dropped.append({**artifact, 'dropped_because': 'byte budget'})
+            else:
+                selected.append(artifact)
+                tokens += artifact['tokens']
+                size += artifact['bytes']
+        order = {p: i for i, p in enumerate(file_paths)}
+        return {
+            'budget': {'tokens': self.token_budget, 'bytes': self.byte_budget},
+            # In the input order, so that prompts (and LLM cache keys) stay deterministic
+            'selected': sorted(selected, key=lambda a: order[a['path']]),
+            'dropped': dropped,
+            'tokens': tokens,
+            'bytes': size,
+        }
+
+    def select(self, file_paths, plan_file=None):
+        """
+        Returns the selected file paths, in their input order. Writes the plan to plan_file if given.
+        """
+        plan = self.plan(file_paths)
+        if plan['dropped']:
+            logger.info(f"Context plan: {len(plan['selected'])} artifact(s), ~{plan['tokens']} tokens; dropped {len(plan['dropped'])}: "
+                        + ", ".join(os.path.basename(a['path']) for a in plan['dropped']))
+        if plan_file:
+            os.makedirs(os.path.dirname(plan_file) or '.', exist_ok=True)
+            with open(plan_file, 'w', encoding='utf-8') as f:
+                json.dump(plan, f, indent=2)
+        return [a['path'] for a in plan['selected']]
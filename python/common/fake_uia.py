@@ -0,0 +1,275 @@
+import os
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# Patterns available per control type, and the values their properties return
+CONTROL_TYPE_PATTERNS = {
+    'WindowControl': ('Window', 'Transform'),
+    'PaneControl': ('Scroll',),
+    'ButtonControl': ('Invoke',),
+    'EditControl': ('Value', 'Text'),
+    'CheckBoxControl': ('Toggle',),
+    'ListControl': ('Selection', 'Scroll'),
+    'ListItemControl': ('SelectionItem', 'ScrollItem'),
+    'TreeItemControl': ('ExpandCollapse', 'SelectionItem'),
+    'TextControl': (),
+}
+CONTROL_TYPES = tuple(CONTROL_TYPE_PATTERNS)
+PATTERN_VALUES = {
+    'Dock': {'DockPosition': 'None'},
+    'ExpandCollapse': {'ExpandCollapseState': 'Collapsed'},
+    'Grid': {'RowCount': 1, 'ColumnCount': 1},
+    'GridItem': {'Row': 0, 'Column': 0, 'RowSpan': 1, 'ColumnSpan': 1},
+    'Invoke': {},
+    'MultipleView': {'CurrentView': 0, 'GetSupportedViews': lambda: []},
+    'RangeValue': {'Value': 0, 'IsReadOnly': False, 'LargeChange': 10, 'SmallChange': 1, 'Maximum': 100, 'Minimum': 0},
+    'ScrollItem': {},
+    'Scroll': {'HorizontalScrollPercent': -1, 'VerticalScrollPercent': 0, 'HorizontalViewSize': 100, 'VerticalViewSize': 50, 'HorizontallyScrollable': False, 'VerticallyScrollable': True},
+    'Selection': {'CanSelectMultiple': False, 'IsSelectionRequired': False, 'GetSelection': lambda: []},
+    'SelectionItem': {'IsSelected': False},
+    'Table': {'RowCount': 1, 'ColumnCount': 1, 'RowOrColumnMajor': 'RowMajor'},
+    'TableItem': {'Row': 0, 'Column': 0, 'RowSpan': 1, 'ColumnSpan': 1},
+    'Text': {'DocumentRange': None},
+    'Toggle': {'ToggleState': 'Off'},
+    'Transform': {'CanMove': True, 'CanResize': True, 'CanRotate': False},
+    'Value': {'Value': 'text', 'IsReadOnly': False},
+    'Window': {'CanMaximize': True, 'CanMinimize': True, 'IsModal': False, 'IsTopmost': False, 'WindowVisualState': 'Normal', 'WindowInteractionState': 'ReadyForUserInteraction'},
+}
+
+class FakeRect:
+    def __init__(self, left, top, right, bottom):
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+
+    def width(self):
+        return self.right - self.left
+
+    def height(self):
+        return self.bottom - self.top
+
+    def contains(self, x, y):
+        return self.left <= x < self.right and self.top <= y < self.bottom
+
+class FakeTextRange:
+    def __init__(self, backend, text):
+        self.backend = backend
+        self.text = text
+
+    def GetText(self, max_length=-1):
+        self.backend.call('TextRange.GetText')
+        return self.text if max_length < 0 else self.text[:max_length]
+
+class FakePattern:
+    def __init__(self, backend, name, values):
+        self.backend = backend
+        self.pattern_name = name
+        self.values = values
+
+    def __getattr__(self, name):
+        values = self.__dict__.get('values', {})
+        if name not in values:
+            raise AttributeError(name)
+        self.backend.call(f"{self.pattern_name}Pattern.{name}")
+        if name == 'DocumentRange':
+            return FakeTextRange(self.backend, "Lorem ipsum dolor sit amet")
+        return values[name]
+
+class FakeBitmap:
+    def __init__(self, rect):
+        self.rect = rect
+
+    def ToFile(self, path):
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+        return True
+
+class _Property:
+    """
+    A control property whose every read goes through the backend, like a cross-process UIA call.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, control, owner=None):
+        if control is None:
+            return self
+        control.backend.call(self.name)
+        return control.properties[self.name]
+
+class FakeControl:
+    Name = _Property()
+    AutomationId = _Property()
+    ClassName = _Property()
+    ControlTypeName = _Property()
+    BoundingRectangle = _Property()
+    IsOffscreen = _Property()
+    ProcessId = _Property()
+
+    def __init__(self, backend, runtime_id, properties, patterns=(), parent=None):
+        self.backend = backend
+        self.runtime_id = runtime_id
+        self.properties = properties
+        self.patterns = set(patterns)
+        self.parent = parent
+        self.children = []
+
+    def GetRuntimeId(self):
+        self.backend.call('GetRuntimeId')
+        return self.runtime_id
+
+    def GetChildren(self):
+        self.backend.call('GetChildren')
+        return list(self.children)
+
+    def GetParentControl(self):
+        self.backend.call('GetParentControl')
+        return self.parent
+
+    def SetActive(self):
+        self.backend.call('SetActive')
+        return True
+
+    def ToBitmap(self):
+        self.backend.call('ToBitmap')
+        return FakeBitmap(self.properties['BoundingRectangle'])
+
+    def _get_pattern(self, name):
+        self.backend.call(f"Get{name}Pattern")
+        if name not in self.patterns:
+            return None
+        return FakePattern(self.backend, name, PATTERN_VALUES.get(name, {}))
+
+    def _is_pattern_available(self, name):
+        self.backend.call(f"Is{name}PatternAvailable")
+        return name in self.patterns
+
+    def __getattr__(self, name):
+        # Get<X>Pattern() and Is<X>PatternAvailable() for every UIA pattern
+        if name.startswith('Get') and name.endswith('Pattern'):
+            pattern = name[3:-len('Pattern')]
+            return lambda: self._get_pattern(pattern)
+        if name.startswith('Is') and name.endswith('PatternAvailable'):
+            pattern = name[2:-len('PatternAvailable')]
+            return lambda: self._is_pattern_available(pattern)
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return f"FakeControl({self.properties['ControlTypeName']} {self.properties['Name']!r})"
+
+class FakeUIA:
+    """
+    Drop-in for the parts of the uiautomation module used by python.common.uia, backed by a
+    generated control tree. Every call is counted and can be slowed down to model
+    cross-process latency. Install it with python.common.uia.set_backend(fake).
+    """
+    Rect = FakeRect
+
+    def __init__(self, latency=0.0, call_latencies=None):
+        self.latency = latency
+        self.call_latencies = call_latencies or {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.root = self._create(None, 'PaneControl', 'Desktop', FakeRect(0, 0, 1920, 1080))
+        self.focused = None
+
+    def call(self, name):
+        with self.lock:
+            self.calls[name] += 1
+        latency = self.call_latencies.get(name, self.latency)
+        if latency:
+            time.sleep(latency)
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls = Counter()
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def _create(self, parent, control_type, name, rect, process_id=None, patterns=None):
+        runtime_id = (42, self.next_id)
+        self.next_id += 1
+        properties = {
+            'Name': name,
+            'AutomationId': f"auto_{runtime_id[1]}",
+            'ClassName': control_type.replace('Control', ''),
+            'ControlTypeName': control_type,
+            'BoundingRectangle': rect,
+            'IsOffscreen': rect.width() <= 0 or rect.height() <= 0,
+            'ProcessId': os.getpid() if process_id is None else process_id,
+        }
+        control = FakeControl(self, runtime_id, properties, CONTROL_TYPE_PATTERNS.get(control_type, ()) if patterns is None else patterns, parent)
+        if parent:
+            parent.children.append(control)
+        return control
+
+    def add_window(self, name="Fake Window", depth=3, fan_out=10, max_nodes=None, with_patterns=True):
+        """
+        Adds a top-level window with a generated subtree of the given depth and fan-out, at most
+        max_nodes controls (window included). Children split their parent's rectangle in columns.
+        """
+        window = self._create(self.root, 'WindowControl', name, FakeRect(0, 0, 1920, 1080), patterns=None if with_patterns else ())
+        count = 1
+        level = [window]
+        for current_depth in range(depth):
+            next_level = []
+            for parent in level:
+                parent_rect = parent.properties['BoundingRectangle']
+                width = max(1, parent_rect.width() // fan_out)
+                for i in range(fan_out):
+                    if max_nodes and count >= max_nodes:
+                        break
+                    control_type = CONTROL_TYPES[(count + current_depth) % len(CONTROL_TYPES)]
+                    rect = FakeRect(parent_rect.left + i * width, parent_rect.top + 10, parent_rect.left + (i + 1) * width, parent_rect.bottom)
+                    child = self._create(parent, control_type, f"{control_type[:-len('Control')]} {count}", rect, patterns=None if with_patterns else ())
+                    next_level.append(child)
+                    count += 1
+            if not next_level:
+                break
+            level = next_level
+        self.focused = level[-1]
+        return window
+
+    def node_count(self, control=None):
+        control = control or self.root
+        return 1 + sum(self.node_count(child) for child in control.children)
+
+    # --- uiautomation API ---
+
+    def GetRootControl(self):
+        self.call('GetRootControl')
+        return self.root
+
+    def ControlFromPoint(self, x, y):
+        self.call('ControlFromPoint')
+        control = self.root
+        while True:
+            child = next((c for c in control.children if c.properties['BoundingRectangle'].contains(x, y)), None)
+            if child is None:
+                return control
+            control = child
+
+    def GetFocusedControl(self):
+        self.call('GetFocusedControl')
+        return self.focused
+
+    @contextmanager
+    def UIAutomationInitializerInThread(self):
+        yield
+
+def build_tree(node_count, fan_out=10, latency=0.0, call_latencies=None, window_name="Fake Window"):
+    """
+    Returns a FakeUIA with one window of exactly node_count controls.
+    """
+    depth = 1
+    while sum(fan_out ** level for level in range(depth + 1)) < node_count:
+        depth += 1
+    fake = FakeUIA(latency=latency, call_latencies=call_latencies)
+    fake.add_window(window_name, depth=depth, fan_out=fan_out, max_nodes=node_count)
+    return fake
@@ -0,0 +1,240 @@
+import threading
+import importlib.util
+from python.common.logger import get_logger
+from python.common.uia import get_backend, get_runtime_id, get_process_name, LazyPatterns, PATTERN_PROPERTIES
+
+logger = get_logger(__name__)
+
+# UIA TreeScope_Subtree
+TREE_SCOPE_SUBTREE = 7
+
+# --- Event Sources ---
+# A source calls on_focus_changed(element) and on_structure_changed(element) from any thread
+# between start() and stop().
+
+class UIAEventSource:
+    """
+    Subscribes to UIA focus-changed and structure-changed events through comtypes.
+    Handlers run on a dedicated MTA thread, as UIA requires for event subscriptions.
+    """
+    def __init__(self):
+        self.thread = None
+        self.ready = threading.Event()
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def start(self, on_focus_changed, on_structure_changed):
+        self.thread = threading.Thread(target=self._run, args=(on_focus_changed, on_structure_changed), daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error:
+            raise self.error
+
+    def _run(self, on_focus_changed, on_structure_changed):
+        import comtypes
+        auto = get_backend()
+        comtypes.CoInitializeEx(comtypes.COINIT_MULTITHREADED)
+        try:
+            client = auto.uiautomation._AutomationClient.instance()
+            core = client.UIAutomationCore
+
+            class FocusHandler(comtypes.COMObject):
+                _com_interfaces_ = [core.IUIAutomationFocusChangedEventHandler]
+
+                def HandleFocusChangedEvent(self, sender):
+                    on_focus_changed(auto.Control.CreateControlFromElement(sender))
+
+            class StructureHandler(comtypes.COMObject):
+                _com_interfaces_ = [core.IUIAutomationStructureChangedEventHandler]
+
+                def HandleStructureChangedEvent(self, sender, change_type, runtime_id):
+                    on_structure_changed(auto.Control.CreateControlFromElement(sender))
+
+            focus_handler, structure_handler = FocusHandler(), StructureHandler()
+            client.IUIAutomation.AddFocusChangedEventHandler(None, focus_handler)
+            client.IUIAutomation.AddStructureChangedEventHandler(client.IUIAutomation.GetRootElement(), TREE_SCOPE_SUBTREE, None, structure_handler)
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+            comtypes.CoUninitialize()
+            return
+        self.ready.set()
+        self.stop_event.wait()
+        try:
+            client.IUIAutomation.RemoveAllEventHandlers()
+        finally:
+            comtypes.CoUninitialize()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+class PollingEventSource:
+    """
+    Fallback source polling the focused element. It can't see structure changes.
+    """
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self, on_focus_changed, on_structure_changed):
+        def poll():
+            focused_id = None
+            while not self.stop_event.wait(self.interval):
+                try:
+                    element = get_backend().GetFocusedControl()
+                    runtime_id = get_runtime_id(element) if element else None
+                except Exception:
+                    continue
+                if runtime_id != focused_id:
+                    focused_id = runtime_id
+                    on_focus_changed(element)
+        self.thread = threading.Thread(target=poll, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+class ScriptedEventSource:
+    """
+    Source driven by calls to focus() and structure_changed(), for tests and load replays.
+    """
+    def __init__(self):
+        self.on_focus_changed = None
+        self.on_structure_changed = None
+
+    def start(self, on_focus_changed, on_structure_changed):
+        self.on_focus_changed = on_focus_changed
+        self.on_structure_changed = on_structure_changed
+
+    def stop(self):
+        self.on_focus_changed = None
+        self.on_structure_changed = None
+
+    def focus(self, element):
+        if self.on_focus_changed:
+            self.on_focus_changed(element)
+
+    def structure_changed(self, element=None):
+        if self.on_structure_changed:
+            self.on_structure_changed(element)
+
+def create_event_source():
+    """
+    Returns the UIA event source, or the polling fallback where comtypes is unavailable.
+    """
+    if importlib.util.find_spec('comtypes') is not None:
+        return UIAEventSource()
+    logger.warning("comtypes not available, polling for focus changes.")
+    return PollingEventSource()
+
+# --- Tracker ---
+
+class FocusTracker:
+    """
+    Caches the focused element, its process name and its hierarchy, invalidated by focus and
+    structure change notifications instead of being queried on every key event.
+    The hierarchy is walked outside the lock, so notifications are never blocked behind UIA calls;
+    a walk overtaken by a notification is returned but not cached.
+    With refresh_element, the focused element's bounding rectangle and Value pattern (the text
+    being typed) are re-read on every call while the rest of the hierarchy comes from the cache.
+    """
+    def __init__(self, uia_helper, source=None, process_names=None, refresh_element=False):
+        self.uia_helper = uia_helper
+        self.source = source or create_event_source()
+        self.process_names = process_names
+        self.refresh_element = refresh_element
+        self.lock = threading.Lock()
+        self.element = None
+        self.process_name = None
+        self.hierarchy = None
+        # None while a walk is in progress: any structure change then invalidates it
+        self.hierarchy_ids = set()
+        self.dirty = True
+        # Incremented on every invalidation, to detect the walks they overtook
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        try:
+            self.source.start(self._on_focus_changed, self._on_structure_changed)
+        except Exception as e:
+            logger.warning(f"UIA event subscription failed ({e}), polling for focus changes.")
+            self.source = PollingEventSource()
+            self.source.start(self._on_focus_changed, self._on_structure_changed)
+
+    def stop(self):
+        self.source.stop()
+
+    def _invalidate(self):
+        self.dirty = True
+        self.generation += 1
+
+    def _on_focus_changed(self, element):
+        with self.lock:
+            self.element = element
+            self._invalidate()
+
+    def _on_structure_changed(self, element):
+        try:
+            runtime_id = get_runtime_id(element) if element else None
+        except Exception:
+            runtime_id = None
+        with self.lock:
+            # Only changes to the cached elements matter, the rest of the desktop is noise
+            if runtime_id is None or self.hierarchy_ids is None or runtime_id in self.hierarchy_ids:
+                self._invalidate()
+
+    def current(self):
+        """
+        Returns (element, process_name, hierarchy) of the focused element.
+        """
+        with self.lock:
+            hit = not self.dirty
+            if hit:
+                self.hits += 1
+                element, process_name, hierarchy = self.element, self.process_name, self.hierarchy
+            else:
+                self.misses += 1
+                element, generation = self.element, self.generation
+                self.hierarchy_ids = None
+        if hit:
+            if self.refresh_element and hierarchy:
+                hierarchy = self._refresh_element(element, hierarchy)
+            return element, process_name, hierarchy
+
+        element = element or self.uia_helper.get_focused_element()
+        process_name = get_process_name(element) if element else None
+        hierarchy = self.uia_helper.get_element_hierarchy(element, self.process_names)
+        with self.lock:
+            if self.generation == generation:
+                self.element = element
+                self.process_name = process_name
+                self.hierarchy = hierarchy
+                self.hierarchy_ids = {info['id'] for info in hierarchy or ()}
+                self.dirty = False
+        return element, process_name, hierarchy
+
+    @staticmethod
+    def _refresh_element(element, hierarchy):
+        info = dict(hierarchy[0])
+        try:
+            info['bounding_rectangle'] = element.BoundingRectangle
+        except Exception:
+            pass
+        patterns = info['patterns']
+        if patterns.get('ValuePattern') is not None:
+            try:
+                value = PATTERN_PROPERTIES['Value'](element.GetValuePattern())
+            except Exception:
+                value = None
+            if value is not None and isinstance(patterns, LazyPatterns):
+                info['patterns'] = LazyPatterns(patterns.element, {**patterns.patterns, 'ValuePattern': value}, patterns.pending)
+            elif value is not None:
+                info['patterns'] = {**patterns, 'ValuePattern': value}
+        return [info] + hierarchy[1:]
@@ -0,0 +1,70 @@
+import sys
+import re
+import argparse
+import subprocess
+from python.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Cumulative import time allowed per entry point module, in milliseconds
+DEFAULT_BUDGETS_MS = {
+    "python.agent.flaui_flow": 500,
+    "python.recorder.recorder_tool": 300,
+}
+# Modules that must not be imported at startup, they are deferred to first use
+HEAVY_MODULES = ("cv2", "scipy", "sounddevice", "pyautogui", "uiautomation", "comtypes", "google.genai")
+
+IMPORTTIME_PATTERN = re.compile(r'^import time:\s+(?P<self>\d+)\s+\|\s+(?P<cumulative>\d+)\s+\|(?P<indent>\s*)(?P<module>\S+)\s*$')
+
+def measure_import(module):
+    """
+    Imports module in a fresh interpreter with -X importtime.
+    Returns a list of (module, self µs, cumulative µs, nesting level), in import order.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            level = (len(match.group('indent')) - 1) // 2
+            imports.append((match.group('module'), int(match.group('self')), int(match.group('cumulative')), level))
+    return imports
+
+def check_module(module, budget_ms, top=10):
+    """
+    Logs the heaviest imports of a module. Returns False if it is over budget or imports a heavy module.
+    """
+    imports = measure_import(module)
+    total_ms = next((cumulative for name, _, cumulative, _ in imports if name == module), 0) / 1000
+    heavy = sorted({name for name, _, _, _ in imports if name in HEAVY_MODULES})
+    ok = total_ms <= budget_ms and not heavy
+    logger.info(f"{module}: {total_ms:.1f} ms (budget {budget_ms} ms) {'OK' if ok else 'OVER BUDGET'}")
+    if heavy:
+        logger.error(f"{module} eagerly imports: {', '.join(heavy)}")
+    # Direct imports of the module are listed right before it, one level deeper
+    names = [name for name, _, _, _ in imports]
+    direct = []
+    for entry in reversed(imports[:names.index(module)] if module in names else []):
+        if entry[3] == 0:
+            break
+        if entry[3] == 1:
+            direct.append(entry)
+    for name, _, cumulative, _ in sorted(direct, key=lambda i: i[2], reverse=True)[:top]:
+        logger.info(f"    {cumulative / 1000:8.1f} ms  {name}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the CLI entry points against a budget.")
+    parser.add_argument('modules', nargs='*', help='Modules to check (default: the agent and recorder entry points).')
+    parser.add_argument('--budget-ms', type=float, help='Budget for every checked module, overriding the defaults.')
+    parser.add_argument('--top', type=int, default=10, help='Number of heaviest imports to show.')
+    args = parser.parse_args()
+
+    modules = args.modules or list(DEFAULT_BUDGETS_MS)
+    results = [check_module(module, args.budget_ms or DEFAULT_BUDGETS_MS.get(module, 500), args.top) for module in modules]
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from python.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+class ReplayMissError(KeyError):
+    """
+    Raised in replay mode when a request has no cached response.
+    """
+
+def _sha256(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+def _json_default(obj):
+    # Response schemas are passed as pydantic classes
+    if isinstance(obj, type):
+        if hasattr(obj, 'model_json_schema'):
+            return obj.model_json_schema()
+        return f"{obj.__module__}.{obj.__qualname__}"
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump(exclude_none=True)
+    return repr(obj)
+
+def config_digest(config):
+    """
+    Hashes a GenerateContentConfig (including its system instruction and response schema).
+    """
+    if config is None:
+        return _sha256('null')
+    data = config.model_dump(exclude_none=True) if hasattr(config, 'model_dump') else vars(config)
+    # Keep the schema class itself, model_dump may already have turned it into something else
+    if getattr(config, 'response_schema', None) is not None:
+        data['response_schema'] = config.response_schema
+    return _sha256(json.dumps(data, sort_keys=True, default=_json_default))
+
+def part_digest(part):
+    """
+    Hashes a prompt part: text by value, files by their content hash.
+    """
+    if isinstance(part, str):
+        return _sha256(part)
+    content_hash = getattr(part, 'sha256_hash', None)
+    if content_hash:
+        return content_hash
+    uri = getattr(part, 'uri', None)
+    if uri:
+        return _sha256(uri)
+    return _sha256(json.dumps(part, sort_keys=True, default=_json_default))
+
+class CachedResponse:
+    """
+    Minimal stand-in for a GenerateContentResponse served from the cache.
+    """
+    def __init__(self, text, response_schema=None):
+        self.text = text
+        self.usage_metadata = None
+        self.parsed = None
+        if response_schema is not None and hasattr(response_schema, 'model_validate_json'):
+            self.parsed = response_schema.model_validate_json(text)
+
+class ResponseCache:
+    """
+    On-disk cache of LLM response texts, one JSON file per request key.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)['text']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, text, model=None):
+        temp_file = self._path(key) + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({'model': model, 'created': time.time(), 'text': text}, f, ensure_ascii=False)
+        os.replace(temp_file, self._path(key))
+
+class CachedChat:
+    """
+    Chat session that serves responses from a ResponseCache.
+    The key of each turn covers the model, config, prompt parts and every previous turn,
+    so a cached conversation is replayed deterministically.
+    The live chat is only created on the first cache miss, seeded with the turns served so far.
+    With replay=True no live chat is ever created and a miss raises ReplayMissError.
+    """
+    def __init__(self, model, cache: ResponseCache = None, chat_factory=None, send=None, replay=False):
+        self.model = model
+        self.cache = cache
+        self.chat_factory = chat_factory
+        self.send = send
+        self.replay = replay
+        self.live_chat = None
+        self.live_turns = 0  # how many of self.turns the live chat has in its history
+        self.turns = []  # (prompt_parts, response text) of every turn so far
+        self.history_digest = _sha256(model)
+        self.hits = 0
+        self.misses = 0
+        # Guards the counters, forks may report theirs from another thread
+        self.counters_lock = threading.Lock()
+
+    def merge_counts(self, other):
+        """
+        Adds the cache hits and misses of another chat, e.g. a fork that finished in the background.
+        """
+        with self.counters_lock:
+            self.hits += other.hits
+            self.misses += other.misses
+
+    def fork(self, salt):
+        """
+        Returns an independent copy of this chat, e.g. to request several candidate answers
+        to the same turn. The salt keeps the cached responses of each fork apart.
+        """
+        forked = CachedChat(self.model, self.cache, self.chat_factory, self.send, self.replay)
+        forked.turns = list(self.turns)
+        forked.history_digest = _sha256(f"{self.history_digest}:{salt}")
+        return forked
+
+    def adopt(self, other):
+        """
+        Continues the conversation of another chat, typically the fork whose answer was kept.
+        """
+        self.turns = list(other.turns)
+        self.history_digest = other.history_digest
+        self.live_chat = other.live_chat
+        self.live_turns = other.live_turns
+
+    def _key(self, prompt_parts, config):
+        parts = [part_digest(p) for p in prompt_parts]
+        return _sha256(json.dumps([self.history_digest, self.model, config_digest(config), parts]))
+
+    def _get_live_chat(self):
+        # (Re)create the live chat whenever turns were served from the cache behind its back
+        if self.live_chat is None or self.live_turns != len(self.turns):
+            from google.genai import types
+            history = []
+            for prompt_parts, text in self.turns:
+                parts = [types.Part.from_text(text=p) if isinstance(p, str) else types.Part.from_uri(file_uri=p.uri, mime_type=p.mime_type) for p in prompt_parts]
+                history.append(types.UserContent(parts=parts))
+                history.append(types.ModelContent(parts=[types.Part.from_text(text=text)]))
+            self.live_chat = self.chat_factory(history)
+            self.live_turns = len(self.turns)
+        return self.live_chat
+
+    def send_message(self, prompt_parts, config=None):
+        key = self._key(prompt_parts, config)
+        text = self.cache.get(key) if self.cache else None
+        if text is not None:
+            with self.counters_lock:
+                self.hits += 1
+            logger.info(f"LLM response served from cache ({key[:12]})")
+            response = CachedResponse(text, getattr(config, 'response_schema', None))
+        elif self.replay:
+            raise ReplayMissError(f"No cached LLM response for request {key} (replay mode).")
+        else:
+            with self.counters_lock:
+                self.misses += 1
+            live_chat = self._get_live_chat()
+            response = self.send(live_chat, prompt_parts, config) if self.send else live_chat.send_message(prompt_parts, config=config)
+            text = response.text
+            if self.cache:
+                self.cache.put(key, text, model=self.model)
+            self.live_turns += 1
+        self.turns.append((prompt_parts, text))
+        self.history_digest = _sha256(self.history_digest + key + _sha256(text))
+        return response
@@ -0,0 +1,273 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from python.common.logger import get_logger
+from python.common.tracing import span
+
+logger = get_logger(__name__)
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+RATE_LIMIT_DIR = "generated_scripts/.rate_limits"
+DEFAULT_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_RPM", "60"))
+# Per-call metrics also reported as attributes of the call's trace span
+SPAN_ATTRIBUTES = ('attempts', 'prompt_tokens', 'output_tokens', 'throttle_wait')
+
+# --- Rate Limiting ---
+
+class TokenBucket:
+    """
+    Thread-safe token bucket for a single process.
+    clock and sleep can be replaced, e.g. by a simulated clock in tests.
+    """
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _try_take(self, tokens):
+        """
+        Takes tokens if available. Returns 0 on success, or the seconds to wait otherwise.
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until the tokens are available. Returns the time spent waiting.
+        """
+        waited = 0
+        while True:
+            wait = self._try_take(tokens)
+            if not wait:
+                return waited
+            self.sleep(wait)
+            waited += wait
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket whose state lives in a file, so that several processes
+    (e.g. parallel generation runs on one API key) share the same budget.
+    The clock is the wall clock, the only one processes have in common.
+    A lock file older than stale_lock_seconds is left by a crashed process and is broken.
+    """
+    def __init__(self, state_file, rate, capacity, stale_lock_seconds=10, clock=time.time, sleep=time.sleep):
+        super().__init__(rate, capacity, clock, sleep)
+        self.state_file = state_file
+        self.lock_file = state_file + '.lock'
+        self.stale_lock_seconds = stale_lock_seconds
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+
+    def _lock(self):
+        while True:
+            try:
+                fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return
+            except FileExistsError:
+                # Break locks left behind by crashed processes, going by the lock file's age on disk
+                try:
+                    if time.time() - os.path.getmtime(self.lock_file) > self.stale_lock_seconds:
+                        os.remove(self.lock_file)
+                        continue
+                except OSError:
+                    pass
+                self.sleep(0.01)
+
+    def _unlock(self):
+        try:
+            os.remove(self.lock_file)
+        except OSError:
+            pass
+
+    def _try_take(self, tokens):
+        with self.lock:
+            self._lock()
+            try:
+                now = self.clock()
+                state = {'tokens': self.capacity, 'updated': now}
+                try:
+                    with open(self.state_file, 'r') as f:
+                        state = json.load(f)
+                except (OSError, ValueError):
+                    pass
+                available = min(self.capacity, state['tokens'] + max(0, now - state['updated']) * self.rate)
+                wait = 0
+                if available >= tokens:
+                    available -= tokens
+                else:
+                    wait = (tokens - available) / self.rate
+                with open(self.state_file, 'w') as f:
+                    json.dump({'tokens': available, 'updated': now}, f)
+                return wait
+            finally:
+                self._unlock()
+
+_shared_buckets = {}
+_shared_buckets_lock = threading.Lock()
+
+def api_key_id(api_key=None):
+    """
+    Returns a short fingerprint of the API key (GEMINI_API_KEY by default), safe to use in file names.
+    """
+    api_key = api_key or os.getenv("GEMINI_API_KEY") or ""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+def get_shared_bucket(api_key=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=None):
+    """
+    Returns the rate limiter shared by every run using the given API key.
+    """
+    key_id = api_key_id(api_key)
+    with _shared_buckets_lock:
+        if key_id not in _shared_buckets:
+            rate = requests_per_minute / 60.0
+            capacity = burst or max(1, requests_per_minute / 10.0)
+            _shared_buckets[key_id] = FileTokenBucket(os.path.join(RATE_LIMIT_DIR, f"{key_id}.json"), rate, capacity)
+        return _shared_buckets[key_id]
+
+# --- Error Classification ---
+
+def get_status_code(error):
+    """
+    Extracts the HTTP status code from an API error, or None.
+    """
+    for attr in ('code', 'status_code'):
+        code = getattr(error, attr, None)
+        if isinstance(code, int):
+            return code
+    response = getattr(error, 'response', None)
+    code = getattr(response, 'status_code', None)
+    if isinstance(code, int):
+        return code
+    match = re.match(r'\s*(\d{3})\b', str(error))
+    return int(match.group(1)) if match else None
+
+def is_timeout(error):
+    return isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__
+
+def get_retry_after(error):
+    """
+    Returns the server requested delay in seconds (Retry-After header or RetryInfo detail), or None.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            pass
+    # Gemini reports throttling delays as RetryInfo details, e.g. "retryDelay": "17s"
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(getattr(error, 'details', None) or error))
+    return float(match.group(1)) if match else None
+
+# --- Client ---
+
+class LLMClient:
+    """
+    Sends chat messages through a shared rate limiter, retrying throttling, server
+    errors and timeouts with exponential backoff and full jitter.
+    Per-call latency, token usage and retries are kept in self.metrics.
+    """
+    def __init__(self, rate_limiter=None, max_retries=5, base_delay=1.0, max_delay=60.0, sleep=time.sleep):
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.metrics = []
+        self.metrics_lock = threading.Lock()
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _record(self, entry):
+        with self.metrics_lock:
+            self.metrics.append(entry)
+
+    def send_message(self, chat, prompt_parts, config):
+        """
+        Sends a message using chat.send_message. Returns the response or raises the last exception.
+        """
+        entry = {'started': time.time(), 'attempts': 0, 'retries': [], 'throttle_wait': 0.0}
+        with span("llm.send_message") as attributes:
+            try:
+                return self._send_message(chat, prompt_parts, config, entry)
+            finally:
+                # From this call's own entry: other threads may be appending to self.metrics
+                attributes.update({k: entry[k] for k in SPAN_ATTRIBUTES if k in entry})
+
+    def _send_message(self, chat, prompt_parts, config, entry):
+        call_start = time.perf_counter()
+        for attempt in range(1, self.max_retries + 2):
+            if self.rate_limiter:
+                entry['throttle_wait'] += self.rate_limiter.acquire()
+            entry['attempts'] = attempt
+            try:
+                response = chat.send_message(prompt_parts, config=config)
+            except Exception as e:
+                status_code = get_status_code(e)
+                retryable = status_code in RETRYABLE_STATUS_CODES or is_timeout(e)
+                if not retryable or attempt > self.max_retries:
+                    entry.update(status='error', error=str(e)[:500], latency=time.perf_counter() - call_start)
+                    self._record(entry)
+                    raise
+                delay = self._backoff(attempt, e)
+                entry['retries'].append({'status_code': status_code, 'timeout': is_timeout(e), 'delay': delay})
+                logger.warning(f"LLM call failed ({status_code or type(e).__name__}). Retry {attempt}/{self.max_retries} in {delay:.1f}s...")
+                self.sleep(delay)
+                continue
+
+            usage = getattr(response, 'usage_metadata', None)
+            entry.update(
+                status='ok',
+                latency=time.perf_counter() - call_start,
+                prompt_tokens=getattr(usage, 'prompt_token_count', None),
+                output_tokens=getattr(usage, 'candidates_token_count', None),
+                total_tokens=getattr(usage, 'total_token_count', None),
+            )
+            self._record(entry)
+            return response
+
+    def summary(self):
+        """
+        Aggregates the recorded metrics.
+        """
+        with self.metrics_lock:
+            metrics = list(self.metrics)
+        latencies = sorted(m['latency'] for m in metrics)
+        return {
+            'calls': len(metrics),
+            'errors': sum(1 for m in metrics if m['status'] != 'ok'),
+            'retries': sum(len(m['retries']) for m in metrics),
+            'throttle_wait': sum(m['throttle_wait'] for m in metrics),
+            'total_latency': sum(latencies),
+            'max_latency': latencies[-1] if latencies else 0,
+            'prompt_tokens': sum(m.get('prompt_tokens') or 0 for m in metrics),
+            'output_tokens': sum(m.get('output_tokens') or 0 for m in metrics),
+        }
+
+    def write_metrics(self, file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with self.metrics_lock:
+            metrics = list(self.metrics)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({'summary': self.summary(), 'calls': metrics}, f, indent=2)
+        logger.info(f"LLM metrics written to {file_path}")
@@ -0,0 +1,175 @@
+import os
+import re
+from python.common.output_parsers import MSBuildErrorParser
+
+# --- MSTest Patterns ---
+TEST_RESULT_PATTERN = re.compile(r'^\s*(?P<outcome>Passed|Failed|Skipped)\s+(?P<test>[\w.<>`]+)\s*(?:\[(?P<duration>[^\]]+)\])?\s*$')
+TEST_SUMMARY_PATTERN = re.compile(r'^\s*(?P<result>Passed|Failed)!\s+-\s+(?P<counts>.+)$')
+STACK_FRAME_PATTERN = re.compile(r'^\s*at (?P<method>.+?)(?: in (?P<file>.+?):line (?P<line>\d+))?\s*$')
+# Lines written by the template's Logger class, e.g. `2025-01-01 10:00:00.000 TestClass.cs:42 ERROR ...`
+TEST_LOGGER_PATTERN = re.compile(r'^\s*\d{4}-\d{2}-\d{2} [\d:.]+ \S+:\d+ (?:INFO|WARNING|ERROR|!Passed!|Failed) ')
+SECTION_HEADERS = ('Error Message:', 'Stack Trace:', 'Standard Output Messages:', 'Standard Error Messages:')
+
+# Lines kept from a raw log when nothing structured was found
+FALLBACK_TAIL_LINES = 40
+# Stack frames from the framework are noise for the LLM
+MAX_FRAMES_PER_TEST = 8
+# Last Logger lines kept, they show where the test stopped
+MAX_TEST_LOGGER_LINES = 20
+
+def parse_msbuild_diagnostics(text):
+    """
+    Returns the de-duplicated MSBuild/compiler diagnostics found in a build log, errors first.
+    MSBuild repeats every diagnostic in its final summary, so duplicates are common.
+    """
+    diagnostics = {}
+    for line in text.splitlines():
+        match = MSBuildErrorParser.diagnostic_pattern.match(line.strip())
+        if not match:
+            continue
+        diagnostic = match.groupdict()
+        key = (diagnostic['file'], diagnostic['line'], diagnostic['column'], diagnostic['code'], diagnostic['message'])
+        if key in diagnostics:
+            diagnostics[key]['count'] += 1
+        else:
+            diagnostic['count'] = 1
+            diagnostics[key] = diagnostic
+    return sorted(diagnostics.values(), key=lambda d: (d['severity'] != 'error', d['file'], int(d['line'])))
+
+def parse_test_results(text):
+    """
+    Parses detailed MSTest console output into a summary line and the failed tests,
+    each with its error message and stack frames.
+    """
+    summary = None
+    failed_tests = []
+    current = None
+    section = None
+    for line in text.splitlines():
+        summary_match = TEST_SUMMARY_PATTERN.match(line)
+        if summary_match:
+            summary = line.strip()
+            current, section = None, None
+            continue
+        result_match = TEST_RESULT_PATTERN.match(line)
+        if result_match:
+            current, section = None, None
+            if result_match.group('outcome') == 'Failed':
+                current = {'test': result_match.group('test'), 'duration': result_match.group('duration'), 'message': [], 'frames': []}
+                failed_tests.append(current)
+            continue
+        if current is None:
+            continue
+        stripped = line.strip()
+        if stripped in SECTION_HEADERS:
+            section = stripped
+            continue
+        if not stripped:
+            continue
+        if section == 'Error Message:':
+            current['message'].append(stripped)
+        elif section == 'Stack Trace:':
+            frame_match = STACK_FRAME_PATTERN.match(line)
+            if frame_match:
+                current['frames'].append(frame_match.groupdict())
+    return {'summary': summary, 'failed_tests': failed_tests}
+
+def _resolve_source(file_path, project_dir):
+    if not file_path:
+        return None
+    candidates = [file_path]
+    if project_dir:
+        candidates.append(os.path.join(project_dir, file_path))
+        # Paths in logs can be absolute paths of another machine or workspace, fall back to the file name
+        candidates.append(os.path.join(project_dir, _file_name(file_path)))
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def source_snippet(file_path, line_number, project_dir=None, context=2):
+    """
+    Returns the source lines around line_number, with the offending line marked, or None.
+    """
+    source = _resolve_source(file_path, project_dir)
+    if not source:
+        return None
+    try:
+        with open(source, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    line_number = int(line_number)
+    start = max(1, line_number - context)
+    end = min(len(lines), line_number + context)
+    return "\n".join(f"{'>' if i == line_number else ' '} {i:04d}: {lines[i - 1]}" for i in range(start, end + 1))
+
+def _file_name(path):
+    # Logs may come from Windows, split on both separators
+    return re.split(r'[\\/]', path)[-1]
+
+def _tail(text, count=FALLBACK_TAIL_LINES):
+    lines = [line for line in text.splitlines() if line.strip()]
+    return "\n".join(lines[-count:])
+
+def distill_build_log(stdout, stderr, project_dir=None):
+    """
+    Compact summary of a `dotnet build` run: unique diagnostics with their source lines.
+    """
+    text = f"{stdout}\n{stderr}"
+    diagnostics = parse_msbuild_diagnostics(text)
+    errors = [d for d in diagnostics if d['severity'] == 'error']
+    warnings = [d for d in diagnostics if d['severity'] == 'warning']
+    out = [f"BUILD SUMMARY: {len(errors)} error(s), {len(warnings)} warning(s)"]
+    for diagnostic in diagnostics:
+        file_name = _file_name(diagnostic['file'])
+        repeated = f" (x{diagnostic['count']})" if diagnostic['count'] > 1 else ""
+        out.append(f"\n{diagnostic['severity'].upper()} {diagnostic['code']} {file_name}:{diagnostic['line']}:{diagnostic['column']}{repeated}")
+        out.append(f"  {diagnostic['message']}")
+        if diagnostic['severity'] == 'error':
+            snippet = source_snippet(diagnostic['file'], diagnostic['line'], project_dir)
+            if snippet:
+                out.append(snippet)
+    if not errors and 'error' in text.lower():
+        out.append("\nNo compiler diagnostics found, last lines of the log:")
+        out.append(_tail(text))
+    return "\n".join(out)
+
+def distill_test_log(stdout, stderr, project_dir=None):
+    """
+    Compact summary of a `dotnet test` run: failed tests, their messages and the
+    project's own stack frames with source lines.
+    """
+    text = f"{stdout}\n{stderr}"
+    results = parse_test_results(text)
+    out = [f"TEST SUMMARY: {results['summary'] or 'no summary found'}"]
+    build_diagnostics = [d for d in parse_msbuild_diagnostics(text) if d['severity'] == 'error']
+    if build_diagnostics:
+        out.append(distill_build_log(stdout, stderr, project_dir))
+    for test in results['failed_tests']:
+        out.append(f"\nFAILED {test['test']}" + (f" [{test['duration']}]" if test['duration'] else ""))
+        for message_line in dict.fromkeys(test['message']):
+            out.append(f"  {message_line}")
+        # Frames with a source location are the project's own code
+        frames = [frame for frame in test['frames'] if frame['file']] or test['frames']
+        for frame in frames[:MAX_FRAMES_PER_TEST]:
+            location = f" ({_file_name(frame['file'])}:{frame['line']})" if frame['file'] else ""
+            out.append(f"  at {frame['method']}{location}")
+        # Show the source of the innermost frame that belongs to the project
+        for frame in frames:
+            snippet = source_snippet(frame['file'], frame['line'], project_dir) if frame['file'] else None
+            if snippet:
+                out.append(snippet)
+                break
+    logger_lines = list(dict.fromkeys(line.strip() for line in text.splitlines() if TEST_LOGGER_PATTERN.match(line)))
+    if logger_lines:
+        out.append(f"\nTEST LOG (last {min(len(logger_lines), MAX_TEST_LOGGER_LINES)} of {len(logger_lines)} lines):")
+        out.extend(f"  {line}" for line in logger_lines[-MAX_TEST_LOGGER_LINES:])
+    if not results['failed_tests'] and not results['summary']:
+        out.append("\nNo test results found, last lines of the log:")
+        out.append(_tail(text))
+    # A summary without failed tests leaves the failure unexplained, the end of STDERR shows what went wrong
+    if stderr.strip() and results['summary'] and not results['failed_tests']:
+        out.append("\nSTDERR:")
+        out.append(_tail(stderr))
+    return "\n".join(out)
@@ -1,44 +1,71 @@
 import sys
 import os
+import queue
+import atexit
 import logging
+import logging.handlers
+import threading
 import colorlog
 
-class IndentFormatter(logging.Formatter):
-    def __init__(self, fmt=None, indent_char=' ', indent_level=0):
-        super().__init__(fmt)
+# Every logger only enqueues records; a single listener thread does the formatting and the
+# console/file I/O, so recording threads never block on stdout or disk.
+_log_queue = queue.SimpleQueue()
+_listener = None
+_console_handler = None
+_file_handlers = {}
+_indent_levels = {}
+_lock = threading.Lock()
+
+class IndentFilter(logging.Filter):
+    """
+    Sets record.indent from the indent level of the logger that emitted the record.
+    """
+    def __init__(self, indent_char=' '):
+        super().__init__()
         self.indent_char = indent_char
-        self.indent_level = indent_level
 
-    def format(self, record):
-        indentation = self.indent_char * self.indent_level
-        record.msg = indentation + str(record.msg)
-        return super().format(record)
+    def filter(self, record):
+        record.indent = self.indent_char * _indent_levels.get(record.name, 0)
+        return True
 
-class IndentAndColorFormatter(colorlog.ColoredFormatter):
-    def __init__(self, *args, indent_char=' ', indent_level=0, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.indent_char = indent_char
-        self.indent_level = indent_level
+class LoggerNameFilter(logging.Filter):
+    """
+    Passes only records of the given loggers, e.g. for a file handler shared by the listener.
+    """
+    def __init__(self):
+        super().__init__()
+        self.names = set()
 
-    def format(self, record):
-        indentation = self.indent_char * self.indent_level
-        record.msg = indentation + str(record.msg)
-        return super().format(record)
+    def filter(self, record):
+        return record.name in self.names
 
-def get_logger(name, level=logging.INFO, log_file=None, indent_level=0):
+class IndentMixin:
     """
-    Initializes and returns a logger.
+    Prefixes the message with record.indent (see IndentFilter), formatting a copy so the
+    record itself is never mutated and every handler indents exactly once.
     """
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
+    def formatMessage(self, record):
+        indent = getattr(record, 'indent', self.indent_char * self.indent_level)
+        if indent:
+            record = logging.makeLogRecord(record.__dict__)
+            record.message = indent + record.message
+        return super().formatMessage(record)
 
-    # Avoid adding handlers multiple times
-    if logger.hasHandlers():
-        logger.handlers.clear()
+class IndentFormatter(IndentMixin, logging.Formatter):
+    def __init__(self, fmt=None, datefmt=None, indent_char=' ', indent_level=0):
+        super().__init__(fmt, datefmt)
+        self.indent_char = indent_char
+        self.indent_level = indent_level
 
-    # Console handler with color and indentation
+class IndentAndColorFormatter(IndentMixin, colorlog.ColoredFormatter):
+    def __init__(self, *args, indent_char=' ', indent_level=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.indent_char = indent_char
+        self.indent_level = indent_level
+
+def _create_console_handler():
     ch = colorlog.StreamHandler(sys.stdout)
-    console_formatter = IndentAndColorFormatter(
+    ch.setFormatter(IndentAndColorFormatter(
         '%(asctime)s - %(filename)s:%(lineno)d - %(log_color)s%(levelname)s%(reset)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S',
         reset=True,
@@ -50,23 +77,73 @@ def get_logger(name, level=logging.INFO, log_file=None, indent_level=0):
             'CRITICAL': 'red,bg_white',
         },
         secondary_log_colors={},
-        style='%',
-        indent_level=indent_level
-    )
-    ch.setFormatter(console_formatter)
-    logger.addHandler(ch)
-
-    # File handler with indentation but no color
-    if log_file:
-        log_dir = os.path.dirname(log_file)
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-        fh = logging.FileHandler(log_file)
-        file_formatter = IndentFormatter(
-            '%(asctime)s - %(filename)s:%(lineno)d - %(levelname)s - %(message)s',
-            indent_level=indent_level
-        )
-        fh.setFormatter(file_formatter)
-        logger.addHandler(fh)
+        style='%'
+    ))
+    return ch
+
+def _create_file_handler(log_file):
+    log_dir = os.path.dirname(log_file)
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    fh = logging.FileHandler(log_file)
+    fh.setFormatter(IndentFormatter('%(asctime)s - %(filename)s:%(lineno)d - %(levelname)s - %(message)s'))
+    fh.addFilter(LoggerNameFilter())
+    return fh
+
+def _restart_listener():
+    """
+    (Re)starts the listener with the current handlers. Must be called with _lock held.
+    """
+    global _listener
+    if _listener:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(_log_queue, _console_handler, *_file_handlers.values(), respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging():
+    """
+    Flushes the queued records and stops the listener thread.
+    """
+    global _listener
+    with _lock:
+        if _listener:
+            _listener.stop()
+            _listener = None
+        for handler in _file_handlers.values():
+            handler.close()
+
+atexit.register(shutdown_logging)
+
+def get_logger(name, level=logging.INFO, log_file=None, indent_level=0):
+    """
+    Initializes and returns a logger.
+    Records are put on a queue and written to the console (and log_file) by a background thread.
+    """
+    global _console_handler
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    _indent_levels[name] = indent_level
+
+    # Avoid adding handlers multiple times
+    if logger.hasHandlers():
+        logger.handlers.clear()
+
+    queue_handler = logging.handlers.QueueHandler(_log_queue)
+    queue_handler.addFilter(IndentFilter())
+    logger.addHandler(queue_handler)
+
+    with _lock:
+        restart = _listener is None
+        if _console_handler is None:
+            _console_handler = _create_console_handler()
+        if log_file and log_file not in _file_handlers:
+            _file_handlers[log_file] = _create_file_handler(log_file)
+            restart = True
+        if log_file:
+            for handler_filter in _file_handlers[log_file].filters:
+                if isinstance(handler_filter, LoggerNameFilter):
+                    handler_filter.names.add(name)
+        if restart:
+            _restart_listener()
 
     return logger
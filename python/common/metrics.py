@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from python.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Values are bucketed HDR style: exact below 2**SUB_BUCKET_BITS, then log-linear with
+# 2**(SUB_BUCKET_BITS - 1) buckets per power of two, i.e. under 1% relative error.
+SUB_BUCKET_BITS = 7
+PERCENTILES = (50, 90, 99, 99.9)
+
+def _bucket_key(value):
+    if value < (1 << SUB_BUCKET_BITS):
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return (shift << SUB_BUCKET_BITS) | (value >> shift)
+
+def _bucket_value(key):
+    shift = key >> SUB_BUCKET_BITS
+    return (key & ((1 << SUB_BUCKET_BITS) - 1)) << shift
+
+class Histogram:
+    """
+    Latency histogram with constant memory and cheap recording, durations are kept in microseconds.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1e6))
+        key = _bucket_key(value)
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+            self.min = value if self.min is None else min(self.min, value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def percentile(self, percent):
+        """
+        Returns the value in seconds below which `percent` of the recorded values fall.
+        """
+        with self.lock:
+            items = sorted(self.counts.items())
+            count = self.count
+        if not count:
+            return 0.0
+        threshold = count * percent / 100.0
+        seen = 0
+        for key, bucket_count in items:
+            seen += bucket_count
+            if seen >= threshold:
+                return _bucket_value(key) / 1e6
+        return self.max / 1e6
+
+    def merge(self, other):
+        with self.lock:
+            for key, bucket_count in other.counts.items():
+                self.counts[key] = self.counts.get(key, 0) + bucket_count
+            self.count += other.count
+            self.total += other.total
+            self.max = max(self.max, other.max)
+            if other.min is not None:
+                self.min = other.min if self.min is None else min(self.min, other.min)
+
+    # Metrics are pickled without their lock, to be sent back from worker processes
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        snapshot = {
+            'type': 'histogram',
+            'count': self.count,
+            'min': (self.min or 0) / 1e6,
+            'max': self.max / 1e6,
+            'mean': self.total / self.count / 1e6 if self.count else 0.0,
+        }
+        for percent in PERCENTILES:
+            snapshot[f'p{percent:g}'] = self.percentile(percent)
+        return snapshot
+
+class Counter:
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def merge(self, other):
+        self.inc(other.value)
+
+    __getstate__ = Histogram.__getstate__
+    __setstate__ = Histogram.__setstate__
+
+    def snapshot(self):
+        return {'type': 'counter', 'value': self.value}
+
+class Gauge:
+    """
+    Last set value, plus the maximum seen (e.g. for queue and buffer sizes).
+    """
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self.max = 0
+
+    def set(self, value):
+        self.value = value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self.value = other.value
+        self.max = max(self.max, other.max)
+
+    def snapshot(self):
+        return {'type': 'gauge', 'value': self.value, 'max': self.max}
+
+class MetricsRegistry:
+    """
+    Named histograms, counters and gauges, created on first use and written to a JSON file.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.sampler_thread = None
+        self.sampler_stop = threading.Event()
+
+    def _get(self, name, metric_class):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.setdefault(name, metric_class(name))
+        return metric
+
+    def histogram(self, name):
+        return self._get(name, Histogram)
+
+    def counter(self, name):
+        return self._get(name, Counter)
+
+    def gauge(self, name):
+        return self._get(name, Gauge)
+
+    def merge(self, metrics):
+        """
+        Adds metrics recorded elsewhere (e.g. the `metrics` dict of a worker process's registry).
+        """
+        for name, metric in metrics.items():
+            self._get(name, type(metric)).merge(metric)
+
+    def snapshot(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        return {
+            'started': self.started,
+            'elapsed': time.time() - self.started,
+            'metrics': {name: metrics[name].snapshot() for name in sorted(metrics)},
+        }
+
+    def write(self, file_path):
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        # Replace atomically, so a live reader never sees a partial file
+        os.replace(temp_path, file_path)
+
+    def start_sampling(self, file_path, interval):
+        """
+        Rewrites file_path every `interval` seconds until stop_sampling() is called.
+        """
+        def sample():
+            while not self.sampler_stop.wait(interval):
+                try:
+                    self.write(file_path)
+                except OSError as e:
+                    logger.warning(f"Could not write live metrics to {file_path}: {e}")
+        self.sampler_stop.clear()
+        self.sampler_thread = threading.Thread(target=sample, daemon=True)
+        self.sampler_thread.start()
+
+    def stop_sampling(self):
+        if self.sampler_thread:
+            self.sampler_stop.set()
+            self.sampler_thread.join()
+            self.sampler_thread = None
@@ -0,0 +1,112 @@
+import re
+from collections import Counter
+
+class OutputParser:
+    """
+    Base class for parsers fed line by line by run_command.
+    feed() returns a reason string when the process should be aborted, otherwise None.
+    """
+    name = "output"
+
+    def feed(self, line: str, stream: str):
+        return None
+
+    def result(self) -> dict:
+        return {}
+
+class PatternParser(OutputParser):
+    """
+    Aborts once max_matches lines have matched one of the fatal patterns.
+    """
+    def __init__(self, name, fatal_patterns, streams=("stdout", "stderr"), max_matches=1):
+        self.name = name
+        self.fatal_patterns = [re.compile(p, re.IGNORECASE) for p in fatal_patterns]
+        self.streams = streams
+        self.max_matches = max_matches
+        self.matches = []
+
+    def feed(self, line, stream):
+        if stream not in self.streams:
+            return None
+        for pattern in self.fatal_patterns:
+            if pattern.search(line):
+                self.matches.append(line.strip())
+                if len(self.matches) == self.max_matches:
+                    return f"{self.name}: {line.strip()}"
+                return None
+        return None
+
+    def result(self):
+        return {'matches': self.matches}
+
+EXCEPTION_TYPE = r'(?:[A-Za-z_]\w*\.)*[A-Z]\w*Exception'
+
+class RepeatedExceptionParser(OutputParser):
+    """
+    Aborts once the same exception type has been thrown max_repeats times.
+    Only exceptions reported as thrown count: MSTest's "Test method ... threw exception:",
+    "Unhandled exception." and lines starting with the exception type (the headline .NET prints,
+    inner exceptions included), not exception names merely mentioned in log messages.
+    """
+    name = "repeated_exceptions"
+    thrown_pattern = re.compile(r'(?:threw exception|Unhandled exception)[.:]?\s*(?P<type>' + EXCEPTION_TYPE + r')?', re.IGNORECASE)
+    headline_pattern = re.compile(r'^\s*(?:-+>\s*)?(?P<type>' + EXCEPTION_TYPE + r')(?::|\s*$)')
+
+    def __init__(self, max_repeats=3):
+        self.max_repeats = max_repeats
+        self.counts = Counter()
+
+    def feed(self, line, stream):
+        match = self.thrown_pattern.search(line) or self.headline_pattern.match(line)
+        # "threw exception:" without a type is followed by the headline on the next line
+        if not match or not match.group('type'):
+            return None
+        exception_type = match.group('type')
+        self.counts[exception_type] += 1
+        if self.counts[exception_type] == self.max_repeats:
+            return f"{self.name}: {exception_type} raised {self.max_repeats} times"
+        return None
+
+    def result(self):
+        return {'exceptions': dict(self.counts)}
+
+class MSBuildErrorParser(PatternParser):
+    """
+    Aborts on MSBuild/compiler errors, e.g. `Foo.cs(12,5): error CS0103: ...`.
+    """
+    diagnostic_pattern = re.compile(r'^(?P<file>.+?)\((?P<line>\d+),(?P<column>\d+)\): (?P<severity>error|warning) (?P<code>[A-Z]+\d+): (?P<message>.+?)(?: \[(?P<project>[^\]]+)\])?$')
+
+    def __init__(self):
+        super().__init__("build_error", [r': error [A-Z]+\d+:', r'^\s*Build FAILED\.'])
+        self.diagnostics = []
+
+    def feed(self, line, stream):
+        match = self.diagnostic_pattern.match(line.strip())
+        if match:
+            self.diagnostics.append(match.groupdict())
+        return super().feed(line, stream)
+
+    def result(self):
+        result = super().result()
+        result['diagnostics'] = self.diagnostics
+        return result
+
+def build_parsers():
+    """
+    Parsers for `dotnet build`.
+    """
+    return [MSBuildErrorParser()]
+
+def dotnet_test_parsers(max_repeated_exceptions=3, max_element_not_found=1):
+    """
+    Parsers for `dotnet test` runs of FlaUI tests.
+    Element lookups only count as failures when reported in an exception, not in the test's own logs.
+    """
+    return [
+        MSBuildErrorParser(),
+        PatternParser("element_not_found", [
+            r'Exception: .*(?:element (?:was )?not found|could not find (?:the )?element|No element found)',
+            r'^\s*(?:-+>\s*)?(?:\w+\.)*ElementNotAvailableException\b',
+        ], max_matches=max_element_not_found),
+        RepeatedExceptionParser(max_repeated_exceptions),
+    ]
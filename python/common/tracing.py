@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from python.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+class Tracer:
+    """
+    Collects nested, timed spans and writes them as a Chrome trace (chrome://tracing, Perfetto)
+    plus a per-phase summary table. When disabled, span() only costs a flag check.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def enable(self):
+        self.enabled = True
+        self.events = []
+        self.origin = time.perf_counter()
+
+    def disable(self):
+        self.enabled = False
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Times the enclosed block. Attributes show up as args in the trace; an `iteration`
+        attribute is inherited by nested spans so each iteration can be grouped.
+        """
+        if not self.enabled:
+            yield attributes
+            return
+        stack = self._stack()
+        if stack and 'iteration' in stack[-1] and 'iteration' not in attributes:
+            attributes['iteration'] = stack[-1]['iteration']
+        stack.append(attributes)
+        start = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            event = {
+                'name': name,
+                'ph': 'X',
+                'ts': (start - self.origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': self.pid,
+                'tid': threading.get_ident(),
+                'args': attributes,
+                'depth': len(stack),
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def summary(self):
+        """
+        Aggregates spans by name: count, total, mean and max duration in seconds.
+        """
+        with self.lock:
+            events = list(self.events)
+        rows = {}
+        for event in events:
+            row = rows.setdefault(event['name'], {'name': event['name'], 'count': 0, 'total': 0.0, 'max': 0.0, 'depth': event['depth']})
+            duration = event['dur'] / 1e6
+            row['count'] += 1
+            row['total'] += duration
+            row['max'] = max(row['max'], duration)
+            row['depth'] = min(row['depth'], event['depth'])
+        for row in rows.values():
+            row['mean'] = row['total'] / row['count']
+        return sorted(rows.values(), key=lambda r: r['total'], reverse=True)
+
+    def write(self, output_dir):
+        """
+        Writes trace.json and trace_summary.txt to output_dir.
+        """
+        if not self.enabled:
+            return
+        os.makedirs(output_dir, exist_ok=True)
+        with self.lock:
+            events = [{k: v for k, v in event.items() if k != 'depth'} for event in self.events]
+        trace_path = os.path.join(output_dir, "trace.json")
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+        lines = [f"{'Span':<48} {'Count':>6} {'Total (s)':>10} {'Mean (s)':>10} {'Max (s)':>10}"]
+        for row in self.summary():
+            name = '  ' * row['depth'] + row['name']
+            lines.append(f"{name:<48} {row['count']:>6} {row['total']:>10.2f} {row['mean']:>10.2f} {row['max']:>10.2f}")
+        # Per-iteration breakdown of the spans that carry an iteration attribute
+        iterations = {}
+        for event in events:
+            iteration = event['args'].get('iteration')
+            if iteration is None:
+                continue
+            key = (str(iteration), event['name'])
+            iterations[key] = iterations.get(key, 0.0) + event['dur'] / 1e6
+        if iterations:
+            lines.append("")
+            lines.append(f"{'Iteration':<16} {'Span':<32} {'Total (s)':>10}")
+            for (iteration, name), total in sorted(iterations.items()):
+                lines.append(f"{iteration:<16} {name:<32} {total:>10.2f}")
+        summary_path = os.path.join(output_dir, "trace_summary.txt")
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        logger.info(f"Trace written to {trace_path}")
+
+# Process wide tracer, disabled until enable_tracing() is called.
+tracer = Tracer()
+
+def enable_tracing():
+    tracer.enable()
+
+def span(name, **attributes):
+    """
+    Shortcut for tracer.span() that skips the generator entirely while tracing is disabled.
+    """
+    if not tracer.enabled:
+        return nullcontext(attributes)
+    return tracer.span(name, **attributes)
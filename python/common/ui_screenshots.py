@@ -0,0 +1,141 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from python.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+ATLAS_INDEX_FILE = "atlas.json"
+ATLAS_MAX_SIZE = 4096
+ATLAS_PADDING = 2
+
+def grab_screen(bbox):
+    """
+    Captures the (left, top, right, bottom) screen region as a PIL image.
+    """
+    from PIL import ImageGrab
+    return ImageGrab.grab(bbox=bbox, all_screens=True)
+
+class ScreenshotBatch:
+    """
+    Element screenshots for a UI dump, taken from a single capture per root window:
+    capture() grabs a root window once, add() records an element's crop during the traversal,
+    and write() crops and encodes all of them on a thread pool once the traversal is done.
+    With atlas, the crops are packed into a few atlas images with a JSON index instead of
+    one file per element.
+    """
+    def __init__(self, output_dir, atlas=False, max_workers=4, grab=grab_screen):
+        self.output_dir = output_dir
+        self.atlas = atlas
+        self.max_workers = max_workers
+        self.grab = grab
+        self.image = None
+        self.origin = (0, 0)
+        # (element id, source image, crop box in the source image, destination)
+        self.crops = []
+        # Shelf packing state: current page, shelf top, shelf height and x position in the shelf
+        self.page = 0
+        self.shelf_top = 0
+        self.shelf_height = 0
+        self.shelf_x = 0
+        # Atlas file name -> (width, height)
+        self.page_sizes = {}
+
+    def capture(self, rect):
+        """
+        Captures the screen region of a root window, the source of the crops added after it.
+        """
+        self.image = None
+        if not rect or rect.right <= rect.left or rect.bottom <= rect.top:
+            return
+        try:
+            self.image = self.grab((rect.left, rect.top, rect.right, rect.bottom))
+            self.origin = (rect.left, rect.top)
+        except Exception as e:
+            logger.warning(f"Screen capture failed, no screenshots for this window: {e}")
+
+    def add(self, element_id, rect):
+        """
+        Records the screenshot of an element and returns where it will be written:
+        a file path, or {'atlas': file name, 'rect': [x, y, width, height], 'scale': factor} with an atlas,
+        where scale is the factor applied to crops too large for an atlas page.
+        Returns None when the element is not visible in the captured window.
+        """
+        if self.image is None or not rect:
+            return None
+        left = max(rect.left - self.origin[0], 0)
+        top = max(rect.top - self.origin[1], 0)
+        right = min(rect.right - self.origin[0], self.image.width)
+        bottom = min(rect.bottom - self.origin[1], self.image.height)
+        if right <= left or bottom <= top:
+            return None
+        box = (left, top, right, bottom)
+        if self.atlas:
+            destination = self._place(right - left, bottom - top)
+        else:
+            destination = os.path.join(self.output_dir, f'{element_id}.png')
+        self.crops.append((element_id, self.image, box, destination))
+        return destination
+
+    def _place(self, width, height):
+        # Next-fit shelf packing, crops larger than a page are scaled down to fit, keeping their aspect ratio
+        scale = min(1.0, ATLAS_MAX_SIZE / max(width, height))
+        width = max(1, min(round(width * scale), ATLAS_MAX_SIZE))
+        height = max(1, min(round(height * scale), ATLAS_MAX_SIZE))
+        if self.shelf_x + width > ATLAS_MAX_SIZE:
+            self.shelf_top += self.shelf_height + ATLAS_PADDING
+            self.shelf_x = 0
+            self.shelf_height = 0
+        if self.shelf_top + height > ATLAS_MAX_SIZE:
+            self.page += 1
+            self.shelf_top = 0
+            self.shelf_x = 0
+            self.shelf_height = 0
+        x, y = self.shelf_x, self.shelf_top
+        self.shelf_x += width + ATLAS_PADDING
+        self.shelf_height = max(self.shelf_height, height)
+        atlas_file = f'atlas_{self.page}.png'
+        page_width, page_height = self.page_sizes.get(atlas_file, (0, 0))
+        self.page_sizes[atlas_file] = (max(page_width, x + width), max(page_height, y + height))
+        return {'atlas': atlas_file, 'rect': [x, y, width, height], 'scale': scale}
+
+    def write(self):
+        """
+        Crops and encodes the recorded screenshots, in parallel. Returns the number written.
+        """
+        if not self.crops:
+            return 0
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.atlas:
+            return self._write_atlas()
+
+        def save(crop):
+            _, image, box, path = crop
+            # PIL releases the GIL while encoding, so the pool encodes in parallel
+            image.crop(box).save(path, format='PNG')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(save, self.crops))
+        return len(self.crops)
+
+    def _write_atlas(self):
+        from PIL import Image
+        pages = {atlas_file: Image.new('RGB', size) for atlas_file, size in self.page_sizes.items()}
+        index = {}
+        for element_id, image, box, destination in self.crops:
+            x, y, width, height = destination['rect']
+            crop = image.crop(box)
+            if crop.size != (width, height):
+                crop = crop.resize((width, height))
+            pages[destination['atlas']].paste(crop, (x, y))
+            index[element_id] = destination
+
+        def save(item):
+            atlas_file, image = item
+            image.save(os.path.join(self.output_dir, atlas_file), format='PNG')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(save, pages.items()))
+        with open(os.path.join(self.output_dir, ATLAS_INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        return len(self.crops)
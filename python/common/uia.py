@@ -4,14 +4,29 @@ import json
 import argparse
 import threading
 import time
+from collections.abc import Mapping
 
-import uiautomation as auto
 import psutil
-import pyautogui
 from python.common.logger import get_logger
+from python.common.metrics import MetricsRegistry
 
 logger = get_logger(__name__)
 
+# uiautomation (and comtypes behind it) is slow to import, it is loaded on first use.
+# set_backend() swaps it for any module exposing the same API.
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        import uiautomation
+        _backend = uiautomation
+    return _backend
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
 
 # --- Core Functions ---
 
@@ -23,25 +38,115 @@ def get_process_name(element):
     if not element:
         return None
     try:
-        logger.debug(f"get_process_name: element={element}, ProcessId={element.ProcessId}")
-        process = psutil.Process(element.ProcessId)
-        logger.debug(f"get_process_name: process={process}")
+        process_id = element.ProcessId
+        logger.debug("get_process_name: element=%s, ProcessId=%s", element, process_id)
+        process = psutil.Process(process_id)
+        logger.debug("get_process_name: process=%s", process)
         name = process.name()
-        logger.debug(f"get_process_name: name={name}")
+        logger.debug("get_process_name: name=%s", name)
         return name
     except psutil.NoSuchProcess:
         return None
 
-def get_element_info(element, element_ids=None, screenshot_dir=None):
+# --- Element Properties ---
+
+# Pattern name -> properties read from the pattern, None for patterns only checked for availability
+PATTERN_PROPERTIES = {
+    'Dock': lambda p: {'DockPosition': str(p.DockPosition)},
+    'ExpandCollapse': lambda p: {'ExpandCollapseState': str(p.ExpandCollapseState)},
+    'Grid': lambda p: {'RowCount': p.RowCount, 'ColumnCount': p.ColumnCount},
+    'GridItem': lambda p: {'Row': p.Row, 'Column': p.Column, 'RowSpan': p.RowSpan, 'ColumnSpan': p.ColumnSpan},
+    'Invoke': None,
+    'MultipleView': lambda p: {'CurrentView': p.CurrentView, 'SupportedViews': p.GetSupportedViews()},
+    'RangeValue': lambda p: {'Value': p.Value, 'IsReadOnly': p.IsReadOnly, 'LargeChange': p.LargeChange, 'SmallChange': p.SmallChange, 'Maximum': p.Maximum, 'Minimum': p.Minimum},
+    'ScrollItem': None,
+    'Scroll': lambda p: {'HorizontalScrollPercent': p.HorizontalScrollPercent, 'VerticalScrollPercent': p.VerticalScrollPercent, 'HorizontalViewSize': p.HorizontalViewSize, 'VerticalViewSize': p.VerticalViewSize, 'HorizontallyScrollable': p.HorizontallyScrollable, 'VerticallyScrollable': p.VerticallyScrollable},
+    'Selection': lambda p: {'CanSelectMultiple': p.CanSelectMultiple, 'IsSelectionRequired': p.IsSelectionRequired, 'Selection': [item.Name for item in p.GetSelection()]},
+    'SelectionItem': lambda p: {'IsSelected': p.IsSelected},
+    'Table': lambda p: {'RowCount': p.RowCount, 'ColumnCount': p.ColumnCount, 'RowOrColumnMajor': str(p.RowOrColumnMajor)},
+    'TableItem': lambda p: {'Row': p.Row, 'Column': p.Column, 'RowSpan': p.RowSpan, 'ColumnSpan': p.ColumnSpan},
+    'Text': lambda p: {'Text': p.DocumentRange.GetText(256)},
+    'Toggle': lambda p: {'ToggleState': str(p.ToggleState)},
+    'Transform': lambda p: {'CanMove': p.CanMove, 'CanResize': p.CanResize, 'CanRotate': p.CanRotate},
+    'Value': lambda p: {'Value': p.Value, 'IsReadOnly': p.IsReadOnly},
+    'Window': lambda p: {'CanMaximize': p.CanMaximize, 'CanMinimize': p.CanMinimize, 'IsModal': p.IsModal, 'IsTopmost': p.IsTopmost, 'WindowVisualState': str(p.WindowVisualState), 'WindowInteractionState': str(p.WindowInteractionState)},
+}
+# Patterns that can take long on rich text and large lists
+EXPENSIVE_PATTERNS = ('MultipleView', 'Selection', 'Text')
+
+# minimal: cheap state patterns only, for the ancestors of recorded elements
+# standard: every pattern, the expensive ones only resolved when accessed or serialized
+# full: every pattern, resolved immediately, for UI dumps
+PROFILES = {
+    'minimal': {'patterns': ('ExpandCollapse', 'Invoke', 'SelectionItem', 'Toggle', 'Window'), 'lazy': ()},
+    'standard': {'patterns': tuple(PATTERN_PROPERTIES), 'lazy': EXPENSIVE_PATTERNS},
+    'full': {'patterns': tuple(PATTERN_PROPERTIES), 'lazy': ()},
+}
+
+def _probe_pattern(element, pattern_name, patterns):
+    getter_func = PATTERN_PROPERTIES[pattern_name]
+    try:
+        if getter_func is None:
+            if getattr(element, f'Is{pattern_name}PatternAvailable')():
+                patterns[pattern_name + 'Pattern'] = {'Available': True}
+        else:
+            p = getattr(element, f'Get{pattern_name}Pattern')()
+            patterns[pattern_name + 'Pattern'] = getter_func(p)
+    except Exception:
+        pass
+
+class LazyPatterns(Mapping):
+    """
+    Read-only patterns mapping that queries its lazy patterns on first access, or all of them
+    when iterated (e.g. by dict() or serialize_rects before writing JSON).
+    """
+    def __init__(self, element, patterns, lazy):
+        self.element = element
+        self.patterns = patterns
+        self.pending = list(lazy)
+
+    def _resolve(self, pattern_name):
+        self.pending.remove(pattern_name)
+        _probe_pattern(self.element, pattern_name, self.patterns)
+        if not self.pending:
+            # Release the element once everything is resolved
+            self.element = None
+
+    def _resolve_all(self):
+        for pattern_name in list(self.pending):
+            self._resolve(pattern_name)
+
+    def __getitem__(self, key):
+        pattern_name = key[:-len('Pattern')] if key.endswith('Pattern') else key
+        if pattern_name in self.pending:
+            self._resolve(pattern_name)
+        return self.patterns[key]
+
+    def __iter__(self):
+        self._resolve_all()
+        return iter(self.patterns)
+
+    def __len__(self):
+        self._resolve_all()
+        return len(self.patterns)
+
+    def __repr__(self):
+        return f"LazyPatterns({self.patterns!r}, pending={self.pending!r})"
+
+def get_runtime_id(element):
+    runtime_id = element.GetRuntimeId()
+    return '_'.join(str(i) for i in runtime_id) if isinstance(runtime_id, tuple) else str(runtime_id)
+
+def get_element_info(element, element_ids=None, screenshot_dir=None, profile='full'):
     """
     Extracts comprehensive information from a UI Automation element.
+    The profile (see PROFILES) selects which patterns are queried, and which only on access.
     """
     if not element:
         return None
 
     try:
-        runtime_id = element.GetRuntimeId()
-        runtime_id = '_'.join(str(i) for i in runtime_id) if isinstance(runtime_id, tuple) else str(runtime_id)
+        runtime_id = get_runtime_id(element)
     except Exception:
         return None
 
@@ -61,40 +166,13 @@ def get_element_info(element, element_ids=None, screenshot_dir=None):
     info['is_offscreen'] = get_prop('IsOffscreen', lambda: element.IsOffscreen)
     info['process_name'] = get_process_name(element)
 
+    profile = PROFILES[profile]
     patterns = {}
-    def get_pattern(pattern_name, getter_func):
-        try:
-            p = getattr(element, f'Get{pattern_name}Pattern')()
-            patterns[pattern_name + 'Pattern'] = getter_func(p)
-        except Exception:
-            pass
-
-    def get_simple_pattern(pattern_name):
-         try:
-            if getattr(element, f'Is{pattern_name}PatternAvailable')():
-                patterns[pattern_name + 'Pattern'] = {'Available': True}
-         except Exception: pass
-
-    get_pattern('Dock', lambda p: {'DockPosition': str(p.DockPosition)})
-    get_pattern('ExpandCollapse', lambda p: {'ExpandCollapseState': str(p.ExpandCollapseState)})
-    get_pattern('Grid', lambda p: {'RowCount': p.RowCount, 'ColumnCount': p.ColumnCount})
-    get_pattern('GridItem', lambda p: {'Row': p.Row, 'Column': p.Column, 'RowSpan': p.RowSpan, 'ColumnSpan': p.ColumnSpan})
-    get_simple_pattern('Invoke')
-    get_pattern('MultipleView', lambda p: {'CurrentView': p.CurrentView, 'SupportedViews': p.GetSupportedViews()})
-    get_pattern('RangeValue', lambda p: {'Value': p.Value, 'IsReadOnly': p.IsReadOnly, 'LargeChange': p.LargeChange, 'SmallChange': p.SmallChange, 'Maximum': p.Maximum, 'Minimum': p.Minimum})
-    get_simple_pattern('ScrollItem')
-    get_pattern('Scroll', lambda p: {'HorizontalScrollPercent': p.HorizontalScrollPercent, 'VerticalScrollPercent': p.VerticalScrollPercent, 'HorizontalViewSize': p.HorizontalViewSize, 'VerticalViewSize': p.VerticalViewSize, 'HorizontallyScrollable': p.HorizontallyScrollable, 'VerticallyScrollable': p.VerticallyScrollable})
-    get_pattern('Selection', lambda p: {'CanSelectMultiple': p.CanSelectMultiple, 'IsSelectionRequired': p.IsSelectionRequired, 'Selection': [item.Name for item in p.GetSelection()]})
-    get_pattern('SelectionItem', lambda p: {'IsSelected': p.IsSelected})
-    get_pattern('Table', lambda p: {'RowCount': p.RowCount, 'ColumnCount': p.ColumnCount, 'RowOrColumnMajor': str(p.RowOrColumnMajor)})
-    get_pattern('TableItem', lambda p: {'Row': p.Row, 'Column': p.Column, 'RowSpan': p.RowSpan, 'ColumnSpan': p.ColumnSpan})
-    get_pattern('Text', lambda p: {'Text': p.DocumentRange.GetText(256)})
-    get_pattern('Toggle', lambda p: {'ToggleState': str(p.ToggleState)})
-    get_pattern('Transform', lambda p: {'CanMove': p.CanMove, 'CanResize': p.CanResize, 'CanRotate': p.CanRotate})
-    get_pattern('Value', lambda p: {'Value': p.Value, 'IsReadOnly': p.IsReadOnly})
-    get_pattern('Window', lambda p: {'CanMaximize': p.CanMaximize, 'CanMinimize': p.CanMinimize, 'IsModal': p.IsModal, 'IsTopmost': p.IsTopmost, 'WindowVisualState': str(p.WindowVisualState), 'WindowInteractionState': str(p.WindowInteractionState)})
-
-    info['patterns'] = patterns
+    for pattern_name in profile['patterns']:
+        if pattern_name not in profile['lazy']:
+            _probe_pattern(element, pattern_name, patterns)
+    lazy = [pattern_name for pattern_name in profile['patterns'] if pattern_name in profile['lazy']]
+    info['patterns'] = LazyPatterns(element, patterns, lazy) if lazy else patterns
 
     if screenshot_dir:
         try:
@@ -113,35 +191,49 @@ def get_element_info(element, element_ids=None, screenshot_dir=None):
 # --- UIA Helper Class (for Recorder) ---
 
 class UIAHelper:
-    def __init__(self):
+    def __init__(self, metrics=None, profile='standard', ancestor_profile='minimal'):
         self.element_ids = {}
+        self.metrics = metrics or MetricsRegistry()
+        # Property profiles of the recorded element and of its ancestors, see PROFILES
+        self.profile = profile
+        self.ancestor_profile = ancestor_profile
 
     def get_element_from_point(self, x, y):
-        try:
-            return auto.ControlFromPoint(x, y)
-        except Exception:
-            return None
+        with self.metrics.histogram('uia.element_from_point').time():
+            try:
+                return get_backend().ControlFromPoint(x, y)
+            except Exception:
+                self.metrics.counter('uia.errors').inc()
+                return None
 
     def get_focused_element(self):
-        try:
-            return auto.GetFocusedControl()
-        except Exception:
-            return None
+        with self.metrics.histogram('uia.focused_element').time():
+            try:
+                return get_backend().GetFocusedControl()
+            except Exception:
+                self.metrics.counter('uia.errors').inc()
+                return None
 
     def get_element_hierarchy(self, element, process_names=None):
         if not element:
             return None
         hierarchy = []
         current = element
-        while current:
-            info = get_element_info(current, element_ids=self.element_ids)
-            if info:
-                if not process_names or (info.get('process_name') and info['process_name'].lower() in [p.lower() for p in process_names]):
-                    hierarchy.append(info)
-            try:
-                current = current.GetParentControl()
-            except Exception:
-                current = None
+        profile = self.profile
+        element_info_time = self.metrics.histogram('uia.element_info')
+        with self.metrics.histogram('uia.hierarchy').time():
+            while current:
+                with element_info_time.time():
+                    info = get_element_info(current, element_ids=self.element_ids, profile=profile)
+                profile = self.ancestor_profile
+                if info:
+                    if not process_names or (info.get('process_name') and info['process_name'].lower() in [p.lower() for p in process_names]):
+                        hierarchy.append(info)
+                try:
+                    current = current.GetParentControl()
+                except Exception:
+                    current = None
+        self.metrics.gauge('uia.hierarchy_depth').set(len(hierarchy))
         return hierarchy
 
 # --- UI Dumper Functionality (for Agent) ---
@@ -150,25 +242,27 @@ def serialize_rects(obj):
     """
     Recursively convert Rect objects to dictionaries in the given object.
     """
-    if isinstance(obj, auto.Rect):
+    if isinstance(obj, get_backend().Rect):
         return {'left': obj.left, 'top': obj.top, 'right': obj.right, 'bottom': obj.bottom}
-    elif isinstance(obj, dict):
+    elif isinstance(obj, (dict, LazyPatterns)):
         return {k: serialize_rects(v) for k, v in obj.items()}
     elif isinstance(obj, list):
         return [serialize_rects(v) for v in obj]
     else:
         return obj
 
-def traverse_element_tree(element, whitelist=None, screenshot_dir=None):
+def traverse_element_tree(element, whitelist=None, screenshot_dir=None, profile='full', screenshots=None):
     """
     Recursively traverses the UI Automation tree and builds a dictionary representation.
+    With a ScreenshotBatch (see ui_screenshots), element screenshots are only recorded during the
+    traversal, to be cropped from the captured window and encoded afterwards.
     """
     if not element:
         return None
 
     children = []
     for child in element.GetChildren():
-        child_tree = traverse_element_tree(child, whitelist, screenshot_dir)
+        child_tree = traverse_element_tree(child, whitelist, screenshot_dir, profile, screenshots)
         if child_tree:
             children.append(child_tree)
 
@@ -181,23 +275,34 @@ def traverse_element_tree(element, whitelist=None, screenshot_dir=None):
         is_match = True
 
     if is_match or children:
-        tree = get_element_info(element, screenshot_dir=screenshot_dir)
+        tree = get_element_info(element, screenshot_dir=screenshot_dir, profile=profile)
         if not tree:
             return None
+        if screenshots:
+            rect = tree['bounding_rectangle']
+            visible = not tree['is_offscreen'] and rect != 'N/A'
+            tree['screenshot'] = screenshots.add(tree['id'], rect) if visible else None
         tree['children'] = children
         return tree
 
     return None
 
-def dump_ui(process_name=None, window_title=None, output_file=None, whitelist=None, screenshots=False):
+def dump_ui(process_name=None, window_title=None, output_file=None, whitelist=None, screenshots=False, profile='full', atlas=False):
     """
     Dumps the UI Automation tree for a given process or window to a JSON file.
+    With screenshots, each root window is captured once and every element is cropped from it;
+    with atlas, the crops are packed into atlas images indexed by screenshots/atlas.json.
     """
+    from python.common.ui_screenshots import ScreenshotBatch
+
+    auto = get_backend()
     with auto.UIAutomationInitializerInThread():
         screenshot_dir = None
+        batch = None
         if screenshots:
             screenshot_dir = os.path.join(os.path.dirname(os.path.abspath(output_file)), 'screenshots')
             os.makedirs(screenshot_dir, exist_ok=True)
+            batch = ScreenshotBatch(screenshot_dir, atlas=atlas)
 
         roots = []
         root_control = auto.GetRootControl()
@@ -219,9 +324,13 @@ def dump_ui(process_name=None, window_title=None, output_file=None, whitelist=No
 
         trees = []
         for root in roots:
-            tree = traverse_element_tree(root, whitelist=whitelist, screenshot_dir=screenshot_dir)
+            if batch:
+                batch.capture(root.BoundingRectangle)
+            tree = traverse_element_tree(root, whitelist=whitelist, profile=profile, screenshots=batch)
             if tree:
                 trees.append(tree)
+        if batch:
+            batch.write()
         trees_serialized = serialize_rects(trees)
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(trees_serialized, f, ensure_ascii=False, indent=2)
@@ -242,6 +351,8 @@ def main():
     parser.add_argument('-o', '--output', type=str, required=True, help='Output JSON file.')
     parser.add_argument('-wh', '--whitelist', type=str, nargs='+', help='Process whitelist.')
     parser.add_argument('-s', '--screenshots', action='store_true', help='Enable screenshots.')
+    parser.add_argument('--atlas', action='store_true', help='Pack the screenshots into atlas images with a JSON index.')
+    parser.add_argument('--profile', choices=PROFILES, default='full', help='Element property profile.')
     args = parser.parse_args()
 
     result_container = [None]
@@ -251,7 +362,9 @@ def main():
             args.window,
             args.output,
             args.whitelist,
-            args.screenshots
+            args.screenshots,
+            args.profile,
+            args.atlas
         )
 
     thread = threading.Thread(target=dump_ui_wrapper, daemon=True)
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from python.common import uia
+from python.common.fake_uia import build_tree
+from python.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+WINDOW_NAME = "Benchmark Window"
+# Absolute noise allowed on top of the relative tolerance, for the very small measurements
+ABSOLUTE_SLACK = {'wall_time': 0.01, 'peak_memory_mb': 0.1}
+
+def _count_nodes(trees):
+    return sum(1 + _count_nodes(tree.get('children', ())) for tree in trees)
+
+def benchmark_cases(fake, output_file, hierarchy_repeats=100):
+    """
+    Returns the benchmark cases {name: func} for a fake backend built by build_tree and installed
+    with uia.set_backend(). Each func returns the number of elements it visited.
+    dump_ui writes its output to output_file.
+    """
+    window = fake.root.children[0]
+    leaf = fake.focused
+    helper = uia.UIAHelper()
+
+    def dump_ui():
+        uia.dump_ui(window_title=WINDOW_NAME, output_file=output_file)
+        with open(output_file, 'r', encoding='utf-8') as f:
+            return _count_nodes(json.load(f))
+
+    return {
+        'get_element_info': lambda: len([uia.get_element_info(control) for control in window.children]),
+        'get_element_hierarchy': lambda: sum(len(helper.get_element_hierarchy(leaf) or ()) for _ in range(hierarchy_repeats)),
+        'traverse_element_tree': lambda: _count_nodes([uia.traverse_element_tree(window)]),
+        'dump_ui': dump_ui,
+    }
+
+def _measure(fake, func, memory=True):
+    """
+    Runs func against the fake backend; func returns the number of elements it visited.
+    Returns wall time, backend calls per visited element and, with memory, peak memory.
+    """
+    fake.reset_calls()
+    start = time.perf_counter()
+    elements = func()
+    wall_time = time.perf_counter() - start
+    calls = fake.total_calls()
+    measurement = {
+        'wall_time': wall_time,
+        'calls': calls,
+        'elements': elements,
+        'calls_per_element': calls / max(elements, 1),
+    }
+    if memory:
+        # Second run for memory, tracemalloc slows everything down too much to time the same run
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        measurement['peak_memory_mb'] = peak / (1024 * 1024)
+    return measurement
+
+def run_benchmarks(sizes=DEFAULT_SIZES, fan_out=10, latency=0.0, hierarchy_repeats=100, memory=True):
+    """
+    Benchmarks the UIA layer against generated trees of the given sizes.
+    Returns {size: {case: measurement}}. Without memory, peak memory is not measured, which
+    halves the run time.
+    """
+    results = {}
+    previous_backend = uia._backend
+    try:
+        for size in sizes:
+            fake = build_tree(size, fan_out=fan_out, latency=latency, window_name=WINDOW_NAME)
+            uia.set_backend(fake)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                cases = benchmark_cases(fake, os.path.join(tmp_dir, "ui_dump.json"), hierarchy_repeats)
+                results[size] = {name: _measure(fake, func, memory) for name, func in cases.items()}
+    finally:
+        uia.set_backend(previous_backend)
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the regressions of results against a baseline: calls per visited element must not grow
+    at all (it is deterministic), wall time and peak memory may grow by `tolerance` (a ratio).
+    Figures missing from either side are not compared, so a baseline may hold calls per element only.
+    """
+    regressions = []
+    for size, cases in results.items():
+        for name, measurement in cases.items():
+            reference = baseline.get(str(size), {}).get(name)
+            if not reference:
+                continue
+            # Baselines from before calls were normalised by visited elements have no comparable figure
+            if 'calls_per_element' in reference and measurement['calls_per_element'] > reference['calls_per_element'] + 1e-9:
+                regressions.append(f"{name} @ {size}: calls per element {reference['calls_per_element']:.2f} -> {measurement['calls_per_element']:.2f}")
+            for key, slack in ABSOLUTE_SLACK.items():
+                if key in measurement and key in reference and measurement[key] > reference[key] * (1 + tolerance) + slack:
+                    regressions.append(f"{name} @ {size}: {key} {reference[key]:.3f} -> {measurement[key]:.3f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the UIA layer against a synthetic UIA backend.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Tree sizes, in nodes.')
+    parser.add_argument('--fan-out', type=int, default=10, help='Children per control.')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latency injected into every UIA call.')
+    parser.add_argument('-o', '--output', type=str, help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', type=str, help='Fail if the results regress against this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed wall time and memory growth against the baseline.')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.fan_out, args.latency_ms / 1000)
+    logger.info(f"{'Case':<24} {'Nodes':>8} {'Visited':>8} {'Wall (s)':>10} {'Calls/elem':>11} {'Peak (MB)':>10}")
+    for size, cases in results.items():
+        for name, m in cases.items():
+            logger.info(f"{name:<24} {size:>8} {m['elements']:>8} {m['wall_time']:>10.3f} {m['calls_per_element']:>11.2f} {m['peak_memory_mb']:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
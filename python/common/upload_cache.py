@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from python.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Gemini keeps uploaded files for 48 hours, stay a bit below that when the expiry is unknown.
+DEFAULT_TTL_SECONDS = 47 * 60 * 60
+# Don't hand out handles that are about to expire during a run.
+EXPIRY_MARGIN_SECONDS = 30 * 60
+
+def file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    Returns the SHA-256 hex digest of a file's content.
+    """
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class UploadCache:
+    """
+    Persistent map from file content hash to a previously uploaded remote file handle.
+    Uploaded files are only visible to the API key's project, keep one cache file per key.
+    """
+    def __init__(self, cache_file, ttl=DEFAULT_TTL_SECONDS):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable upload cache {self.cache_file}: {e}")
+            self.entries = {}
+
+    def _save(self):
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        temp_file = self.cache_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(temp_file, self.cache_file)
+
+    @staticmethod
+    def make_key(content_hash, file_path):
+        """
+        Cache key of a file: its content hash plus extension, since the extension drives the mime type.
+        """
+        return f"{content_hash}{os.path.splitext(file_path)[1].lower()}"
+
+    @staticmethod
+    def key_for(file_path):
+        return UploadCache.make_key(file_hash(file_path), file_path)
+
+    def get(self, key):
+        """
+        Returns the cached entry for key if it is still valid, otherwise None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            if entry['expiration_time'] - EXPIRY_MARGIN_SECONDS <= time.time():
+                del self.entries[key]
+                self._save()
+                return None
+            return entry
+
+    def find(self, name):
+        """
+        Returns (key, entry) of the cached remote file name, or None.
+        """
+        with self.lock:
+            return next(((key, entry) for key, entry in self.entries.items() if entry['name'] == name), None)
+
+    def put(self, key, uploaded_file, file_path=None):
+        """
+        Stores the handle of a successfully uploaded file, and the local path it was uploaded from.
+        """
+        expiration_time = getattr(uploaded_file, 'expiration_time', None)
+        expiration_time = expiration_time.timestamp() if expiration_time else time.time() + self.ttl
+        entry = {
+            'name': uploaded_file.name,
+            'uri': uploaded_file.uri,
+            'mime_type': uploaded_file.mime_type,
+            'sha256_hash': key.split('.')[0],
+            'expiration_time': expiration_time,
+            'path': file_path,
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self._save()
+        return entry
+
+    def invalidate(self, key):
+        with self.lock:
+            if self.entries.pop(key, None):
+                self._save()
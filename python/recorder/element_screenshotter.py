@@ -3,14 +3,16 @@ import os
 
 import pyautogui
 from python.common.logger import get_logger
+from python.common.metrics import MetricsRegistry
 
 logger = get_logger(__name__)
 
 class ElementScreenshotter:
-    def __init__(self, output_folder):
+    def __init__(self, output_folder, metrics=None):
         self.output_folder = output_folder
         self.images_folder = f"{self.output_folder}/images"
         self.seen_element_ids = set()
+        self.metrics = metrics or MetricsRegistry()
 
     def capture_element_screenshot(self, element_info, timestamp):
         if not element_info or element_info.get('is_offscreen', True):
@@ -18,6 +20,7 @@ class ElementScreenshotter:
 
         element_id = element_info['id']
         if element_id in self.seen_element_ids:
+            self.metrics.counter('screenshot.skipped_seen').inc()
             return
 
         rect = element_info['bounding_rectangle']
@@ -30,9 +33,12 @@ class ElementScreenshotter:
         screenshot_path = f"{self.images_folder}/{element_id}__{int(timestamp * 1000)}.png"
 
         try:
-            img = pyautogui.screenshot(region=(rect.left, rect.top, width, height))
-            img.save(screenshot_path)
+            with self.metrics.histogram('screenshot.capture').time():
+                img = pyautogui.screenshot(region=(rect.left, rect.top, width, height))
+                img.save(screenshot_path)
             self.seen_element_ids.add(element_id)
-            logger.info(f"Captured screenshot for element {element_id} at {screenshot_path}")
+            self.metrics.counter('screenshot.captured').inc()
+            logger.info("Captured screenshot for element %s at %s", element_id, screenshot_path)
         except Exception as e:
-            logger.error(f"Error capturing screenshot for element {element_id}: {e}")
+            self.metrics.counter('screenshot.errors').inc()
+            logger.error("Error capturing screenshot for element %s: %s", element_id, e)
@@ -0,0 +1,60 @@
+import json
+
+# Annotation files are either a plain list of events (format 1), or a dict with an element table
+# and events referring to it (format 2):
+#   {"format": 2,
+#    "elements": {"<runtime id>": [{...version 0 properties...}, {...version 1...}]},
+#    "events": [{"timestamp": ..., "element_hierarchy": [["<runtime id>", 0], ...], ...}]}
+FORMAT_VERSION = 2
+
+class ElementTable:
+    """
+    Stores each element once per distinct set of properties. A new version is added when an
+    element's properties change (e.g. a toggled checkbox), an earlier one is reused when they change back.
+    """
+    def __init__(self):
+        self.elements = {}
+        self.versions = {}
+
+    def ref(self, element_info):
+        """
+        Adds element_info if needed and returns its [id, version] reference.
+        """
+        element_id = element_info['id']
+        properties = {k: v for k, v in element_info.items() if k != 'id'}
+        key = json.dumps(properties, sort_keys=True, default=str)
+        versions = self.versions.setdefault(element_id, {})
+        if key not in versions:
+            versions[key] = len(versions)
+            self.elements.setdefault(element_id, []).append(properties)
+        return [element_id, versions[key]]
+
+    def get(self, element_id, version):
+        return {'id': element_id, **self.elements[element_id][version]}
+
+def serialize_annotations(events, element_table):
+    return {'format': FORMAT_VERSION, 'elements': element_table.elements, 'events': events}
+
+def expand_annotations(data):
+    """
+    Returns the events of an annotation file in the format 1 shape, with the full element
+    hierarchy embedded in each event. Format 1 data is returned unchanged.
+    """
+    if isinstance(data, list):
+        return data
+    elements = data['elements']
+    events = []
+    for event in data['events']:
+        event = dict(event)
+        hierarchy = event.get('element_hierarchy')
+        if hierarchy:
+            event['element_hierarchy'] = [{'id': element_id, **elements[element_id][version]} for element_id, version in hierarchy]
+        events.append(event)
+    return events
+
+def load_annotations(file_path):
+    """
+    Loads an annotation file of either format as a list of events with embedded hierarchies.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return expand_annotations(json.load(f))
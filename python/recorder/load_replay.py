@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import psutil
+from python.common import uia
+from python.common.fake_uia import build_tree
+from python.common.logger import get_logger
+from python.common.metrics import MetricsRegistry
+from python.recorder.main_recorder import Recorder
+from python.recorder.element_table import load_annotations
+from python.common.focus_tracker import ScriptedEventSource
+
+logger = get_logger(__name__)
+
+# Windows silently skips low level hook callbacks that take longer than this (LowLevelHooksTimeout)
+DEFAULT_HOOK_TIMEOUT = 0.3
+KEYS = "abcdefghijklmnopqrstuvwxyz "
+
+# --- Stand-ins ---
+
+class StubMediaRecorder:
+    """
+    MediaRecorder stand-in: keeps the overlay API, records nothing.
+    """
+    def __init__(self):
+        self.overlays = []
+        self.click_overlay = None
+        self.overlay_count = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def save(self):
+        return None
+
+    def add_overlay(self, bounding_box, element_id, color):
+        self.overlays.append({"bounding_box": bounding_box, "element_id": element_id, "color": color, "ttl": 40})
+        self.overlay_count += 1
+
+    def clear_overlays(self):
+        self.overlays.clear()
+
+    def set_clickoverlay(self, x, y, button):
+        self.click_overlay = {"x": x, "y": y, "button": button, "ttl": 40}
+
+class NullInputListener:
+    """
+    InputListener stand-in, events are injected by replay() instead of OS hooks.
+    """
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+# --- Event Streams ---
+
+def synthesize_events(duration=10.0, rate=20.0, burst_rate=150.0, burst_every=2.0, burst_length=0.5, click_ratio=0.2, screen=(1920, 1080), seed=0):
+    """
+    Generates a deterministic stream of clicks and key releases: `rate` events/s, with bursts of
+    `burst_rate` events/s lasting burst_length seconds every burst_every seconds (fast typing).
+    Returns a list of events {'time', 'event_type', ...} sorted by time.
+    """
+    rng = random.Random(seed)
+    events = []
+    t = 0.0
+    while t < duration:
+        in_burst = burst_every and (t % burst_every) < burst_length
+        if rng.random() < click_ratio and not in_burst:
+            x, y = rng.randrange(screen[0]), rng.randrange(screen[1])
+            for pressed in (True, False):
+                events.append({'time': t, 'event_type': 'mouse_click', 'x': x, 'y': y, 'button': 'Button.left', 'pressed': pressed})
+        else:
+            events.append({'time': t, 'event_type': 'key_release', 'key': repr(rng.choice(KEYS))})
+        t += rng.expovariate(burst_rate if in_burst else rate)
+    return events
+
+def load_recorded_events(annotations_file, speed=1.0):
+    """
+    Turns a recorded annotations file back into an event stream, `speed` times faster.
+    """
+    annotations = load_annotations(annotations_file)
+    events = []
+    for annotation in annotations:
+        data = annotation['event_data']
+        event = {'time': annotation['timestamp'] / speed, 'event_type': annotation['event_type']}
+        if annotation['event_type'] == 'mouse_click':
+            event.update(x=data['x'], y=data['y'], button=data['button'], pressed=data['action'] == 'pressed')
+        elif annotation['event_type'] == 'key_release':
+            event['key'] = data
+        else:
+            continue
+        events.append(event)
+    return sorted(events, key=lambda e: e['time'])
+
+# --- Replay ---
+
+def _dispatch(recorder, events, origin, hook_timeout, latencies, queue_delays, dropped):
+    # Like pynput, each input source is delivered sequentially on its own thread
+    for event in events:
+        scheduled = origin + event['time']
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        queue_delay = time.perf_counter() - scheduled
+        queue_delays.record(max(0.0, queue_delay))
+        if queue_delay > hook_timeout:
+            # The OS would have skipped this event, the hook being blocked for too long
+            dropped.inc()
+            continue
+        if event['event_type'] == 'mouse_click':
+            recorder._handle_click(event['x'], event['y'], event['button'], event['pressed'])
+        else:
+            recorder._handle_release(event['key'])
+        latencies.record(time.perf_counter() - scheduled)
+
+def replay(recorder, events, hook_timeout=DEFAULT_HOOK_TIMEOUT, memory_interval=0.2):
+    """
+    Feeds events into a started recorder at their scheduled times and measures how it keeps up.
+    Returns a report with end-to-end latency, annotation throughput, memory growth and drops.
+    """
+    metrics = MetricsRegistry()
+    latencies = metrics.histogram('replay.event_latency')
+    queue_delays = metrics.histogram('replay.queue_delay')
+    dropped = metrics.counter('replay.dropped')
+    process = psutil.Process()
+    memory = [process.memory_info().rss]
+    done = threading.Event()
+
+    def sample_memory():
+        while not done.wait(memory_interval):
+            memory.append(process.memory_info().rss)
+
+    sources = {
+        'keyboard': [e for e in events if e['event_type'] != 'mouse_click'],
+        'mouse': [e for e in events if e['event_type'] == 'mouse_click'],
+    }
+    annotations_before = len(recorder.annotations)
+    memory_thread = threading.Thread(target=sample_memory, daemon=True)
+    memory_thread.start()
+    origin = time.perf_counter()
+    threads = [threading.Thread(target=_dispatch, args=(recorder, source_events, origin, hook_timeout, latencies, queue_delays, dropped), name=name)
+               for name, source_events in sources.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - origin
+    done.set()
+    memory_thread.join()
+    memory.append(process.memory_info().rss)
+
+    annotations = len(recorder.annotations) - annotations_before
+    return {
+        'events': len(events),
+        'offered_rate': len(events) / max(events[-1]['time'], 1e-6) if events else 0.0,
+        'elapsed': elapsed,
+        'annotations': annotations,
+        'annotations_per_second': annotations / elapsed if elapsed else 0.0,
+        'dropped': dropped.value,
+        # Events the recorder handled but did not annotate (filtered out or lost to errors)
+        'unannotated': len(events) - dropped.value - annotations,
+        'memory_start_mb': memory[0] / (1024 * 1024),
+        'memory_peak_mb': max(memory) / (1024 * 1024),
+        'memory_growth_mb': (memory[-1] - memory[0]) / (1024 * 1024),
+        'metrics': metrics.snapshot()['metrics'],
+    }
+
+def run_load_test(events, node_count=1000, fan_out=10, uia_latency=0.0, whitelist=None, hook_timeout=DEFAULT_HOOK_TIMEOUT, output_folder=None, track_focus=False):
+    """
+    Replays events into a Recorder wired to a synthetic UIA tree, a stub media recorder and no
+    input hooks. With track_focus, focus tracking runs on a scripted event source.
+    Returns the replay report, including the recorder's own metrics.
+    """
+    fake = build_tree(node_count, fan_out=fan_out, latency=uia_latency)
+    previous_backend = uia._backend
+    uia.set_backend(fake)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            recorder = Recorder(
+                output_folder=output_folder or os.path.join(tmp_dir, "recording"),
+                whitelist=whitelist,
+                media_recorder=StubMediaRecorder(),
+                input_listener=NullInputListener(),
+                track_focus=track_focus,
+                focus_source=ScriptedEventSource()
+            )
+            recorder.start()
+            report = replay(recorder, events, hook_timeout)
+            recorder.stop()
+            report['recorder_metrics'] = recorder.metrics.snapshot()['metrics']
+            report['uia_calls'] = fake.total_calls()
+    finally:
+        uia.set_backend(previous_backend)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a high-rate input stream into the Recorder, headless.")
+    parser.add_argument('-a', '--annotations', type=str, help='Replay a recorded annotations file instead of a synthetic stream.')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay a recorded stream this many times faster.')
+    parser.add_argument('--duration', type=float, default=10.0, help='Duration of the synthetic stream, in seconds.')
+    parser.add_argument('--rate', type=float, default=20.0, help='Base event rate of the synthetic stream, in events/s.')
+    parser.add_argument('--burst-rate', type=float, default=150.0, help='Event rate during bursts, in events/s.')
+    parser.add_argument('--nodes', type=int, default=1000, help='Size of the synthetic UIA tree.')
+    parser.add_argument('--uia-latency-ms', type=float, default=0.0, help='Latency injected into every UIA call.')
+    parser.add_argument('--hook-timeout-ms', type=float, default=DEFAULT_HOOK_TIMEOUT * 1000, help='Events delayed longer than this count as dropped.')
+    parser.add_argument('--track-focus', action='store_true', help='Use the focus tracker for key events.')
+    parser.add_argument('-o', '--output', type=str, help='Write the report to this JSON file.')
+    args = parser.parse_args()
+
+    if args.annotations:
+        events = load_recorded_events(args.annotations, args.speed)
+    else:
+        events = synthesize_events(args.duration, args.rate, args.burst_rate)
+    report = run_load_test(events, node_count=args.nodes, uia_latency=args.uia_latency_ms / 1000, hook_timeout=args.hook_timeout_ms / 1000, track_focus=args.track_focus)
+
+    latency = report['metrics']['replay.event_latency']
+    logger.info(f"Events: {report['events']} ({report['offered_rate']:.0f}/s offered), dropped: {report['dropped']}, unannotated: {report['unannotated']}")
+    logger.info(f"Annotations: {report['annotations']} ({report['annotations_per_second']:.1f}/s)")
+    logger.info(f"Latency: p50 {latency['p50'] * 1000:.1f} ms, p99 {latency['p99'] * 1000:.1f} ms, max {latency['max'] * 1000:.1f} ms")
+    logger.info(f"Memory: {report['memory_start_mb']:.1f} MB at start, +{report['memory_growth_mb']:.1f} MB, peak {report['memory_peak_mb']:.1f} MB")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -4,50 +4,105 @@ import os
 import shutil
 import time
 import json
+from collections import deque
 import psutil
 from python.common.logger import get_logger
-from python.recorder.element_screenshotter import ElementScreenshotter
-from python.recorder.events import InputListener
-from python.recorder.media import MediaRecorder
-from python.common.uia import UIAHelper
+from python.common.metrics import MetricsRegistry
+from python.recorder.element_table import ElementTable, serialize_annotations
 
 class Recorder:
-    def __init__(self, output_folder="generated_scripts/user_recording", whitelist=None, take_screenshots=False):
+    def __init__(self, output_folder="generated_scripts/user_recording", whitelist=None, take_screenshots=False, segment_duration=None, max_total_size=None, metrics_interval=None,
+                 media_recorder=None, uia_helper=None, input_listener=None, element_profile='standard', ancestor_profile='minimal',
+                 track_focus=False, focus_source=None, buffer_seconds=None, isolated_capture=False):
+        """
+        media_recorder, uia_helper and input_listener replace the real components when given,
+        e.g. deterministic stand-ins for headless load tests (see load_replay).
+        element_profile and ancestor_profile select the properties recorded for the event's
+        element and for its ancestors (see uia.PROFILES).
+        With track_focus, key events use the focused element cached by a FocusTracker fed by
+        focus_source (UIA events by default) instead of querying UIA on every key release.
+        With buffer_seconds (failure capture), only the last buffer_seconds of low fps video and
+        events are kept in memory, without audio, and nothing is written unless save() is called.
+        With isolated_capture, video is captured and encoded in worker processes (see media_worker).
+        """
         self.logger = get_logger(__name__)
         self.output_folder = output_folder
         self.images_folder = f"{self.output_folder}/images"
         self.json_file = f"{self.output_folder}/annotations.json.txt"
+        self.metrics_file = f"{self.output_folder}/metrics.json"
         self.logger.info(f"Output folder set to: {self.output_folder}")
         self.take_screenshots = take_screenshots
+        # In segmented mode the output folder is kept between sessions and media rolls over in segments
+        self.segment_duration = segment_duration
 
         self.whitelist = whitelist
         if self.whitelist:
             self.logger.info(f"Filtering by process names: {self.whitelist}")
         self.is_recording = False
         self.start_time = None
-        self.annotations = []
+        self.buffer_seconds = buffer_seconds
+        self.annotations = self._new_annotations()
+        # Elements are stored once in the table, the written annotations refer to them by [id, version].
+        # It is built when the annotations are written: until then events hold their elements inline,
+        # with patterns that are only queried at that point (see uia.LazyPatterns)
+        self.element_table = ElementTable()
 
-        self.element_screenshotter = ElementScreenshotter(self.output_folder)
-        self.media_recorder = MediaRecorder(self.output_folder)
-        self.uia_helper = UIAHelper()
-        self.input_listener = InputListener(
-            on_press_callback=self._handle_press,
-            on_click_callback=self._handle_click,
-            on_release_callback=self._handle_release
-        )
+        # Hot path metrics, written next to the annotations at stop and every metrics_interval seconds if set
+        self.metrics_interval = metrics_interval
+        self.metrics = MetricsRegistry()
+
+        # Imported on first use: these pull in cv2, scipy, sounddevice, pyautogui, pynput and uiautomation
+        self.element_screenshotter = None
+        if self.take_screenshots:
+            from python.recorder.element_screenshotter import ElementScreenshotter
+            self.element_screenshotter = ElementScreenshotter(self.output_folder, metrics=self.metrics)
+        if media_recorder is None and self.buffer_seconds:
+            from python.recorder.media import BufferedMediaRecorder
+            media_recorder = BufferedMediaRecorder(self.output_folder, duration=self.buffer_seconds, metrics=self.metrics)
+        elif media_recorder is None:
+            from python.recorder.media import MediaRecorder
+            media_recorder = MediaRecorder(self.output_folder, segment_duration=segment_duration, max_total_size=max_total_size, metrics=self.metrics, isolated=isolated_capture)
+        self.media_recorder = media_recorder
+        if uia_helper is None:
+            from python.common.uia import UIAHelper
+            uia_helper = UIAHelper(metrics=self.metrics, profile=element_profile, ancestor_profile=ancestor_profile)
+        self.uia_helper = uia_helper
+        if input_listener is None:
+            from python.recorder.events import InputListener
+            input_listener = InputListener(
+                on_press_callback=self._handle_press,
+                on_click_callback=self._handle_click,
+                on_release_callback=self._handle_release
+            )
+        self.input_listener = input_listener
+        self.focus_tracker = None
+        if track_focus:
+            from python.common.focus_tracker import FocusTracker
+            self.focus_tracker = FocusTracker(self.uia_helper, focus_source, process_names=self.whitelist, refresh_element=True)
 
     def start(self):
-        if os.path.exists(self.output_folder):
+        if self.segment_duration:
+            # Keep previous segments, but give each session its own annotations file
+            session = time.strftime('%Y%m%d-%H%M%S')
+            self.json_file = f"{self.output_folder}/annotations_{session}.json.txt"
+            self.metrics_file = f"{self.output_folder}/metrics_{session}.json"
+        elif os.path.exists(self.output_folder):
             shutil.rmtree(self.output_folder)
-        os.makedirs(self.images_folder, exist_ok=True)
+        if not self.buffer_seconds:
+            os.makedirs(self.images_folder, exist_ok=True)
 
         self.logger.info("Starting recording...")
         self.is_recording = True
         self.start_time = time.time()
-        self.annotations = []
+        self.annotations = self._new_annotations()
+        self.element_table = ElementTable()
 
         self.media_recorder.start()
+        if self.focus_tracker:
+            self.focus_tracker.start()
         self.input_listener.start()
+        if self.metrics_interval:
+            self.metrics.start_sampling(self.metrics_file, self.metrics_interval)
 
         self.logger.info("Recording started.")
 
@@ -60,12 +115,52 @@ class Recorder:
 
         self.media_recorder.stop()
         self.input_listener.stop()
+        if self.focus_tracker:
+            self.focus_tracker.stop()
+            self.metrics.counter('recorder.focus_cache_hits').inc(self.focus_tracker.hits)
+            self.metrics.counter('recorder.focus_cache_misses').inc(self.focus_tracker.misses)
+        self.metrics.stop_sampling()
+
+        if self.buffer_seconds:
+            self.logger.info("Recording stopped, buffers kept in memory.")
+            return
+        self._write_outputs()
+        self.logger.info("Recording stopped.")
 
+    def _new_annotations(self):
+        return deque() if self.buffer_seconds else []
+
+    def _element_ref(self, element_info):
+        if 'patterns' in element_info:
+            # Resolves lazily evaluated patterns, here rather than in the input hooks
+            element_info = {**element_info, 'patterns': dict(element_info['patterns'])}
+        return self.element_table.ref(element_info)
+
+    def _write_outputs(self):
+        # Only the elements of the kept events go into the table
+        self.element_table = ElementTable()
+        annotations = [{**annotation, 'element_hierarchy': [self._element_ref(element_info) for element_info in annotation['element_hierarchy']]}
+                       if annotation['element_hierarchy'] else annotation
+                       for annotation in self.annotations]
+        os.makedirs(self.output_folder, exist_ok=True)
         with open(self.json_file, 'w') as f:
-            json.dump(self.annotations, f, indent=4)
+            json.dump(serialize_annotations(annotations, self.element_table), f, indent=4)
         self.logger.info(f"Annotations saved to {self.json_file}")
 
-        self.logger.info("Recording stopped.")
+        self.metrics.gauge('recorder.annotations').set(len(annotations))
+        self.metrics.write(self.metrics_file)
+        self.logger.info(f"Metrics saved to {self.metrics_file}")
+
+    def save(self):
+        """
+        Failure capture: writes the buffered video and events (the last buffer_seconds before stop)
+        to the output folder. Returns the path of the video file, or None if none was produced.
+        """
+        self.stop()
+        video_file = self.media_recorder.save()
+        self._write_outputs()
+        self.logger.info(f"Failure capture saved to {self.output_folder}")
+        return video_file
 
     def _get_process_name(self, element):
         if not element:
@@ -80,17 +175,20 @@ class Recorder:
 
         # Take screenshots of new elements
         if self.take_screenshots and element_hierarchy:
-            for element_info in element_hierarchy:
-                self.element_screenshotter.capture_element_screenshot(element_info, timestamp)
+            with self.metrics.histogram('recorder.element_screenshots').time():
+                for element_info in element_hierarchy:
+                    self.element_screenshotter.capture_element_screenshot(element_info, timestamp)
 
-        # Serialize bounding_rectangle for JSON output
-        import copy
-        log_hierarchy = copy.deepcopy(element_hierarchy)
-        if log_hierarchy:
-            for element_info in log_hierarchy:
+        # Serialize bounding_rectangle for JSON output, lazy patterns stay unresolved until written
+        log_hierarchy = None
+        if element_hierarchy:
+            log_hierarchy = []
+            for element_info in element_hierarchy:
+                element_info = dict(element_info)
                 rect = element_info.get('bounding_rectangle')
                 if rect:
-                    element_info['bounding_rectangle'] = (rect.left, rect.top, rect.right, rect.bottom)
+                    element_info['bounding_rectangle'] = [rect.left, rect.top, rect.right, rect.bottom]
+                log_hierarchy.append(element_info)
 
         annotation = {
             "timestamp": timestamp,
@@ -99,18 +197,31 @@ class Recorder:
             "element_hierarchy": log_hierarchy
         }
         self.annotations.append(annotation)
+        if self.buffer_seconds:
+            while self.annotations and self.annotations[0]['timestamp'] < timestamp - self.buffer_seconds:
+                self.annotations.popleft()
 
     def _handle_press(self, key):
         pass
 
     def _handle_release(self, key):
+        with self.metrics.histogram('recorder.handle_release').time():
+            self._on_release(key)
+
+    def _on_release(self, key):
         try:
-            element = self.uia_helper.get_focused_element()
-            process_name = self._get_process_name(element)
+            if self.focus_tracker:
+                element, process_name, hierarchy = self.focus_tracker.current()
+            else:
+                element = self.uia_helper.get_focused_element()
+                process_name = self._get_process_name(element)
+                hierarchy = None
             if self.whitelist and (not process_name or process_name.lower() not in [p.lower() for p in self.whitelist]):
+                self.metrics.counter('recorder.events_filtered').inc()
                 return
-            self.media_recorder.overlays.clear()
-            hierarchy = self.uia_helper.get_element_hierarchy(element, self.whitelist)
+            self.media_recorder.clear_overlays()
+            if hierarchy is None:
+                hierarchy = self.uia_helper.get_element_hierarchy(element, self.whitelist)
             colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
             if hierarchy:
                 for i, element_info in enumerate(hierarchy):
@@ -120,17 +231,23 @@ class Recorder:
                         self.media_recorder.add_overlay((rect.left, rect.top, rect.right, rect.bottom), element_info['id'], color)
             self._log_annotation("key_release", str(key), hierarchy)
         except Exception as e:
-            self.logger.error(f"Error in _handle_release: {e}")
+            self.metrics.counter('recorder.handler_errors').inc()
+            self.logger.error("Error in _handle_release: %s", e)
             self._log_annotation("key_release", str(key), None)
 
     def _handle_click(self, x, y, button, pressed):
+        with self.metrics.histogram('recorder.handle_click').time():
+            self._on_click(x, y, button, pressed)
+
+    def _on_click(self, x, y, button, pressed):
         action = 'pressed' if pressed else 'released'
         try:
             element = self.uia_helper.get_element_from_point(x, y)
             process_name = self._get_process_name(element)
             if self.whitelist and (not process_name or process_name.lower() not in [p.lower() for p in self.whitelist]):
+                self.metrics.counter('recorder.events_filtered').inc()
                 return
-            self.media_recorder.overlays.clear()
+            self.media_recorder.clear_overlays()
             hierarchy = self.uia_helper.get_element_hierarchy(element, self.whitelist)
             colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
             if hierarchy:
@@ -143,5 +260,6 @@ class Recorder:
             self.media_recorder.set_clickoverlay(x, y, str(button))
             self._log_annotation("mouse_click", {"x": x, "y": y, "button": str(button), "action": action}, hierarchy)
         except Exception as e:
-            self.logger.error(f"Error in _handle_click: {e}")
+            self.metrics.counter('recorder.handler_errors').inc()
+            self.logger.error("Error in _handle_click: %s", e)
             self._log_annotation("mouse_click", {"x": x, "y": y, "button": str(button), "action": action}, None)
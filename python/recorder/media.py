@@ -3,6 +3,7 @@ import os
 
 import threading
 import time
+from collections import deque
 import pyautogui
 import numpy as np
 import cv2
@@ -10,130 +11,238 @@ import sounddevice as sd
 from scipy.io.wavfile import write as write_wav
 import subprocess
 from python.recorder import overlay_drawer
+from python.recorder.segments import SegmentStore
 from python.common.logger import get_logger
+from python.common.metrics import MetricsRegistry
 
 logger = get_logger(__name__)
 
 class MediaRecorder:
-    def __init__(self, output_folder, record_audio=True):
+    def __init__(self, output_folder, record_audio=True, segment_duration=None, max_total_size=None, metrics=None, isolated=False):
+        """
+        With isolated, screen capture, overlay drawing and encoding run in worker processes
+        (see media_worker), off the recording process's GIL. Audio stays in this process.
+        """
+        if isolated and segment_duration:
+            raise ValueError("Isolated capture does not support segmented recording.")
         self.output_folder = output_folder
+        self.metrics = metrics or MetricsRegistry()
         self.video_file = f"{self.output_folder}/video.mp4"
         self.temp_video_file = f"{self.output_folder}/temp_video.avi"
         self.temp_audio_file = f"{self.output_folder}/temp_audio.wav"
         self.record_audio = record_audio
 
+        # Rolling segment output: fixed-length segments with a manifest and bounded disk use
+        self.segment_duration = segment_duration
+        self.segment_store = None
+        self.open_segment = None
+        if self.segment_duration:
+            self.segment_store = SegmentStore(f"{self.output_folder}/segments", self._finalize_files, max_total_size)
+
         self.is_recording = False
         self.screen_size = pyautogui.size()
         self.fourcc = cv2.VideoWriter_fourcc(*'XVID')
         self.video_writer = None
         self.audio_frames = []
+        self.audio_lock = threading.Lock()
         self.video_thread = None
         self.audio_thread = None
         self.overlays = []
         self.click_overlay = None
+        # Overlays are shown for this many frames
+        self.overlay_ttl = 40
+        self.recording_started = None
+        self.isolated = isolated
+        self.capture = None
 
     def start(self):
         self.is_recording = True
-        self.video_thread = threading.Thread(target=self._record_video)
-        self.video_thread.start()
+        self.recording_started = time.perf_counter()
+        if self.segment_store:
+            self.segment_store.start()
+        if self.isolated:
+            from python.recorder.media_worker import IsolatedCapture
+            self.capture = IsolatedCapture(self.temp_video_file, (self.screen_size.width, self.screen_size.height), overlay_ttl=self.overlay_ttl)
+            self.capture.start()
+        else:
+            self.video_thread = threading.Thread(target=self._record_video)
+            self.video_thread.start()
         if self.record_audio:
             self.audio_thread = threading.Thread(target=self._record_audio)
             self.audio_thread.start()
 
     def stop(self):
         self.is_recording = False
+        if self.capture:
+            self.metrics.merge(self.capture.stop())
+            self.capture = None
         if self.video_thread:
             self.video_thread.join()
         if self.record_audio and self.audio_thread:
             self.audio_thread.join()
+        if self.recording_started:
+            frames = self.metrics.counter('media.frames').value
+            self.metrics.gauge('media.fps').set(frames / max(time.perf_counter() - self.recording_started, 1e-6))
+
+        if self.segment_store:
+            # Closed here rather than by the video thread, once the audio thread has stopped,
+            # so that the last segment gets all of the remaining audio
+            if self.open_segment:
+                self._rotate_segment(self.open_segment)
+                self.open_segment = None
+            self.segment_store.close()
+            return
 
         if self.video_writer:
             self.video_writer.release()
 
-        if self.record_audio and self.audio_frames:
+        self._finalize_files(self.temp_video_file, self.temp_audio_file, self.video_file, self.audio_frames)
+
+    def _take_audio_frames(self):
+        with self.audio_lock:
+            frames, self.audio_frames = self.audio_frames, []
+        return frames
+
+    def _finalize_files(self, temp_video_file, temp_audio_file, video_file, audio_frames):
+        """
+        Muxes or converts the temp video (and audio) into the final video file.
+        Returns the path of the resulting file, or None if nothing was produced.
+        """
+        with self.metrics.histogram('media.finalize').time():
+            return self._finalize(temp_video_file, temp_audio_file, video_file, audio_frames)
+
+    def _finalize(self, temp_video_file, temp_audio_file, video_file, audio_frames):
+        output_file = None
+        if self.record_audio and audio_frames:
             samplerate = 44100
-            write_wav(self.temp_audio_file, samplerate, np.concatenate(self.audio_frames, axis=0))
+            write_wav(temp_audio_file, samplerate, np.concatenate(audio_frames, axis=0))
 
             cmd = [
-                'ffmpeg', '-y', '-i', self.temp_video_file, '-i', self.temp_audio_file,
-                '-c:v', 'copy', '-c:a', 'aac', '-strict', 'experimental', self.video_file
+                'ffmpeg', '-y', '-i', temp_video_file, '-i', temp_audio_file,
+                '-c:v', 'copy', '-c:a', 'aac', '-strict', 'experimental', video_file
             ]
             try:
                 subprocess.run(cmd, check=True, capture_output=True, text=True)
-            except subprocess.CalledProcessError as e:
-                logger.error(f"ffmpeg error: {e.stderr}")
+                output_file = video_file
+            except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                stderr = e.stderr if hasattr(e, 'stderr') else "ffmpeg not found"
+                logger.error(f"ffmpeg error: {stderr}")
 
-            if os.path.exists(self.temp_video_file):
-                os.remove(self.temp_video_file)
-            if os.path.exists(self.temp_audio_file):
-                os.remove(self.temp_audio_file)
+            if os.path.exists(temp_video_file):
+                os.remove(temp_video_file)
+            if os.path.exists(temp_audio_file):
+                os.remove(temp_audio_file)
         else:
-            if os.path.exists(self.temp_video_file):
+            if os.path.exists(temp_video_file):
                 # Convert AVI to MP4 using ffmpeg
                 cmd = [
-                    'ffmpeg', '-y', '-i', self.temp_video_file,
+                    'ffmpeg', '-y', '-i', temp_video_file,
                     '-c:v', 'libx264', '-preset', 'fast', '-crf', '22',
-                    self.video_file
+                    video_file
                 ]
                 try:
                     logger.info("Converting video to MP4...")
                     subprocess.run(cmd, check=True, capture_output=True, text=True)
+                    output_file = video_file
                 except (subprocess.CalledProcessError, FileNotFoundError) as e:
                     stderr = e.stderr if hasattr(e, 'stderr') else "ffmpeg not found"
                     logger.error(f"ffmpeg error: {stderr}")
                     logger.warning("Falling back to renaming AVI file.")
                     # Fallback to renaming if ffmpeg fails or is not installed
-                    os.rename(self.temp_video_file, f"{self.output_folder}/video.avi")
+                    output_file = os.path.splitext(video_file)[0] + ".avi"
+                    os.rename(temp_video_file, output_file)
                 finally:
-                    if os.path.exists(self.temp_video_file):
-                        os.remove(self.temp_video_file)
+                    if os.path.exists(temp_video_file):
+                        os.remove(temp_video_file)
+        return output_file
 
     def add_overlay(self, bounding_box, element_id, color):
+        if self.capture:
+            self.capture.send('overlay', bounding_box, element_id, color)
+            return
         self.overlays.append({
             "bounding_box": bounding_box,
             "element_id": element_id,
             "color": color,
-            "ttl": 40
+            "ttl": self.overlay_ttl
         })
 
     def set_clickoverlay(self, x, y, button):
+        if self.capture:
+            self.capture.send('click', x, y, button)
+            return
         self.click_overlay = {
             "x": x,
             "y": y,
             "button": button,
-            "ttl": 40
+            "ttl": self.overlay_ttl
         }
 
+    def clear_overlays(self):
+        if self.capture:
+            self.capture.send('clear')
+            return
+        self.overlays.clear()
+
+    def _compose_frame(self, capture_time):
+        """
+        Captures the screen and draws the element overlays, the mouse cursor and the click on it.
+        """
+        with capture_time.time():
+            img = pyautogui.screenshot()
+        frame = np.array(img)
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame, self.overlays, self.click_overlay = overlay_drawer.draw_overlays(frame, self.overlays, self.click_overlay, pyautogui.position())
+        return frame
+
+    def _open_writer(self, path):
+        return cv2.VideoWriter(path, self.fourcc, 20.0, (self.screen_size.width, self.screen_size.height))
+
+    def _rotate_segment(self, segment):
+        """
+        Closes the current segment, queues it for finalization and opens the next one.
+        """
+        self.video_writer.release()
+        self.segment_store.submit(segment, self._take_audio_frames() if self.record_audio else None)
+        if not self.is_recording:
+            self.video_writer = None
+            return None
+        segment = self.segment_store.new_segment()
+        self.video_writer = self._open_writer(segment['temp_video_file'])
+        return segment
+
     def _record_video(self):
         logger.info("Video recording thread started.")
-        self.video_writer = cv2.VideoWriter(self.temp_video_file, self.fourcc, 20.0, (self.screen_size.width, self.screen_size.height))
+        segment = None
+        if self.segment_store:
+            segment = self.segment_store.new_segment()
+            self.video_writer = self._open_writer(segment['temp_video_file'])
+        else:
+            self.video_writer = self._open_writer(self.temp_video_file)
+        frame_time = self.metrics.histogram('media.frame')
+        capture_time = self.metrics.histogram('media.capture')
+        frame_interval = self.metrics.histogram('media.frame_interval')
+        frames = self.metrics.counter('media.frames')
+        last_frame = None
         while self.is_recording:
+            frame_start = time.perf_counter()
+            if last_frame is not None:
+                frame_interval.record(frame_start - last_frame)
+            last_frame = frame_start
             try:
-                img = pyautogui.screenshot()
-                frame = np.array(img)
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-                # Draw overlays
-                for overlay in self.overlays:
-                    frame = overlay_drawer.draw_rectangle(frame, overlay["bounding_box"], overlay["color"], 2, overlay["element_id"])
-                # Draw mouse cursor
-                mouse_x, mouse_y = pyautogui.position()
-                frame = overlay_drawer.draw_cursor(frame, (mouse_x, mouse_y))
-                # Draw click overlay if exists
-                if self.click_overlay:
-                    frame = overlay_drawer.draw_circle(frame, (self.click_overlay["x"], self.click_overlay["y"]), 15, (0, 255, 0) if self.click_overlay["button"] == 'Button.left' else (255, 0, 0))
-                    self.click_overlay["ttl"] -= 1
-                    if self.click_overlay["ttl"] <= 0:
-                        self.click_overlay = None
-                # Update overlays TTL
-                self.overlays = [overlay for overlay in self.overlays if overlay["ttl"] > 0]
-                for overlay in self.overlays:
-                    overlay["ttl"] -= 1
-
+                frame = self._compose_frame(capture_time)
                 self.video_writer.write(frame)
+                frames.inc()
+                frame_time.record(time.perf_counter() - frame_start)
+
+                if segment and time.time() - segment['start_time'] >= self.segment_duration:
+                    segment = self._rotate_segment(segment)
             except Exception as e:
-                logger.error(f"Error during video frame capture: {e}")
+                self.metrics.counter('media.frame_errors').inc()
+                logger.error("Error during video frame capture: %s", e)
                 time.sleep(0.1)
+        # The last segment is closed by stop(), after the audio thread
+        self.open_segment = segment
         logger.info("Video recording thread stopped.")
 
     def _record_audio(self):
@@ -142,11 +251,15 @@ class MediaRecorder:
             samplerate = 44100
             channels = 1
             self.audio_frames = []
+            audio_buffer = self.metrics.gauge('media.audio_buffer_frames')
 
             def callback(indata, frames, time, status):
                 if status:
-                    logger.warning(f"Audio status: {status}")
-                self.audio_frames.append(indata.copy())
+                    self.metrics.counter('media.audio_status_warnings').inc()
+                    logger.warning("Audio status: %s", status)
+                with self.audio_lock:
+                    self.audio_frames.append(indata.copy())
+                    audio_buffer.set(len(self.audio_frames))
 
             with sd.InputStream(samplerate=samplerate, channels=channels, callback=callback):
                 while self.is_recording:
@@ -154,3 +267,85 @@ class MediaRecorder:
         except Exception as e:
             logger.error(f"Audio recording failed: {e}")
         logger.info("Audio recording thread stopped.")
+
+
+class BufferedMediaRecorder(MediaRecorder):
+    """
+    Failure capture: keeps only the last `duration` seconds of low fps, downscaled frames in memory
+    (JPEG encoded), without audio. Nothing touches the disk unless save() is called.
+    """
+    def __init__(self, output_folder, duration=30.0, fps=4.0, scale=0.5, jpeg_quality=70, metrics=None):
+        super().__init__(output_folder, record_audio=False, metrics=metrics)
+        self.duration = duration
+        self.fps = fps
+        self.scale = scale
+        self.jpeg_quality = jpeg_quality
+        # Same on-screen time as at the full recorder's 20 fps
+        self.overlay_ttl = max(1, round(self.overlay_ttl * fps / 20.0))
+        self.frames = deque()
+        self.frames_lock = threading.Lock()
+        self.frame_size = None
+
+    def start(self):
+        with self.frames_lock:
+            self.frames.clear()
+        super().start()
+
+    def stop(self):
+        self.is_recording = False
+        if self.video_thread:
+            self.video_thread.join()
+        if self.recording_started:
+            frames = self.metrics.counter('media.frames').value
+            self.metrics.gauge('media.fps').set(frames / max(time.perf_counter() - self.recording_started, 1e-6))
+
+    def _record_video(self):
+        logger.info("Buffered video recording thread started.")
+        frame_time = self.metrics.histogram('media.frame')
+        capture_time = self.metrics.histogram('media.capture')
+        frames = self.metrics.counter('media.frames')
+        buffer_bytes = self.metrics.gauge('media.buffer_bytes')
+        interval = 1.0 / self.fps
+        next_frame = time.perf_counter()
+        size = 0
+        while self.is_recording:
+            frame_start = time.perf_counter()
+            try:
+                frame = self._compose_frame(capture_time)
+                if self.scale != 1.0:
+                    frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+                self.frame_size = (frame.shape[1], frame.shape[0])
+                _, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                encoded = encoded.tobytes()
+                with self.frames_lock:
+                    self.frames.append((time.time(), encoded))
+                    size += len(encoded)
+                    while self.frames and self.frames[0][0] < self.frames[-1][0] - self.duration:
+                        size -= len(self.frames.popleft()[1])
+                buffer_bytes.set(size)
+                frames.inc()
+                frame_time.record(time.perf_counter() - frame_start)
+            except Exception as e:
+                self.metrics.counter('media.frame_errors').inc()
+                logger.error("Error during video frame capture: %s", e)
+            next_frame = max(next_frame + interval, time.perf_counter())
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+        logger.info("Buffered video recording thread stopped.")
+
+    def save(self, video_file=None):
+        """
+        Writes the buffered frames to video_file (video.mp4 in the output folder by default).
+        Returns the path of the resulting file, or None if there was nothing to write.
+        """
+        with self.frames_lock:
+            frames = list(self.frames)
+        if not frames or not self.frame_size:
+            return None
+        os.makedirs(self.output_folder, exist_ok=True)
+        writer = cv2.VideoWriter(self.temp_video_file, self.fourcc, self.fps, self.frame_size)
+        try:
+            for _, encoded in frames:
+                writer.write(cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), cv2.IMREAD_COLOR))
+        finally:
+            writer.release()
+        return self._finalize_files(self.temp_video_file, None, video_file or self.video_file, None)
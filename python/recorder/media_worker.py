@@ -0,0 +1,201 @@
+import time
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+from python.common.logger import get_logger
+from python.common.metrics import MetricsRegistry
+
+logger = get_logger(__name__)
+
+FRAME_SLOTS = 8
+CHANNELS = 3
+
+# Frames travel from the capture process to the encoder process through shared memory slots.
+# Slot indices circulate between two queues: `free` (writable) and `filled` (ready to encode),
+# so each frame is copied once into shared memory and never pickled.
+# Messages on the control queue: ('overlay', bounding_box, element_id, color), ('click', x, y, button),
+# ('clear',) and ('stop',).
+
+def _frame_views(shm, shape, slots):
+    import numpy as np
+    size = shape[0] * shape[1] * CHANNELS
+    return [np.ndarray((shape[0], shape[1], CHANNELS), dtype=np.uint8, buffer=shm.buf, offset=i * size) for i in range(slots)]
+
+def _capture_worker(shm_name, shape, slots, free, filled, control, results, fps, overlay_ttl, grab=None):
+    import cv2
+    import numpy as np
+    import pyautogui
+    from python.recorder import overlay_drawer
+
+    grab = grab or pyautogui.screenshot
+    shm = shared_memory.SharedMemory(name=shm_name)
+    views = _frame_views(shm, shape, slots)
+    metrics = MetricsRegistry()
+    frame_time = metrics.histogram('media.frame')
+    capture_time = metrics.histogram('media.capture')
+    frame_interval = metrics.histogram('media.frame_interval')
+    frames = metrics.counter('media.frames')
+    dropped = metrics.counter('media.frames_dropped')
+    overlays = []
+    click_overlay = None
+    interval = 1.0 / fps
+    next_frame = time.perf_counter()
+    last_frame = None
+    running = True
+    while running:
+        # Apply the overlay messages received since the last frame
+        while True:
+            try:
+                message = control.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == 'overlay':
+                overlays.append({"bounding_box": message[1], "element_id": message[2], "color": message[3], "ttl": overlay_ttl})
+            elif message[0] == 'click':
+                click_overlay = {"x": message[1], "y": message[2], "button": message[3], "ttl": overlay_ttl}
+            elif message[0] == 'clear':
+                overlays = []
+            elif message[0] == 'stop':
+                running = False
+        if not running:
+            break
+
+        frame_start = time.perf_counter()
+        if last_frame is not None:
+            frame_interval.record(frame_start - last_frame)
+        last_frame = frame_start
+        try:
+            with capture_time.time():
+                img = grab()
+            frame = cv2.cvtColor(np.array(img), cv2.COLOR_BGR2RGB)
+            if frame.shape[:2] != tuple(shape):
+                # The screenshot size changes with the DPI scaling of the monitor, the slots don't
+                frame = cv2.resize(frame, (shape[1], shape[0]))
+            frame, overlays, click_overlay = overlay_drawer.draw_overlays(frame, overlays, click_overlay, pyautogui.position())
+            try:
+                slot = free.get_nowait()
+            except queue.Empty:
+                # The encoder is behind, drop the frame rather than slow down capture
+                dropped.inc()
+            else:
+                try:
+                    views[slot][:] = frame
+                except Exception:
+                    # Give the slot back, or it would be lost to both queues
+                    free.put(slot)
+                    raise
+                filled.put(slot)
+                frames.inc()
+            frame_time.record(time.perf_counter() - frame_start)
+        except Exception as e:
+            metrics.counter('media.frame_errors').inc()
+            logger.error("Error during video frame capture: %s", e)
+
+        next_frame = max(next_frame + interval, time.perf_counter())
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+
+    filled.put(None)
+    del views
+    shm.close()
+    results.put(metrics.metrics)
+
+def _encode_worker(shm_name, shape, slots, free, filled, results, video_file, fps):
+    import cv2
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    views = _frame_views(shm, shape, slots)
+    metrics = MetricsRegistry()
+    encode_time = metrics.histogram('media.encode')
+    writer = cv2.VideoWriter(video_file, cv2.VideoWriter_fourcc(*'XVID'), fps, (shape[1], shape[0]))
+    try:
+        while True:
+            slot = filled.get()
+            if slot is None:
+                break
+            with encode_time.time():
+                writer.write(views[slot])
+            free.put(slot)
+    finally:
+        writer.release()
+        del views
+        shm.close()
+        results.put(metrics.metrics)
+
+class IsolatedCapture:
+    """
+    Runs screen capture with overlay drawing, and video encoding, in two worker processes, so that
+    neither competes for the GIL with the input hooks and UIA queries of the recording process.
+    Overlay updates are sent to the capture process as messages.
+    grab replaces pyautogui.screenshot in the capture process, it must be picklable (a module-level function).
+    """
+    def __init__(self, video_file, screen_size, fps=20.0, slots=FRAME_SLOTS, overlay_ttl=40, grab=None):
+        self.video_file = video_file
+        # (height, width), as numpy frames are laid out
+        self.shape = (screen_size[1], screen_size[0])
+        self.fps = fps
+        self.slots = slots
+        self.overlay_ttl = overlay_ttl
+        self.grab = grab
+        # spawn is the only start method on Windows, use it everywhere to behave the same
+        self.context = multiprocessing.get_context('spawn')
+        self.shm = None
+        self.free = None
+        self.filled = None
+        self.control = None
+        self.results = None
+        self.processes = []
+
+    def start(self):
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.shape[0] * self.shape[1] * CHANNELS)
+        # Kept on self: the queues must outlive the children's unpickling of them
+        self.free = self.context.Queue()
+        self.filled = self.context.Queue()
+        for slot in range(self.slots):
+            self.free.put(slot)
+        self.control = self.context.Queue()
+        self.results = self.context.Queue()
+        self.processes = [
+            self.context.Process(target=_capture_worker, name="media-capture", daemon=True,
+                                 args=(self.shm.name, self.shape, self.slots, self.free, self.filled, self.control, self.results, self.fps, self.overlay_ttl, self.grab)),
+            self.context.Process(target=_encode_worker, name="media-encode", daemon=True,
+                                 args=(self.shm.name, self.shape, self.slots, self.free, self.filled, self.results, self.video_file, self.fps)),
+        ]
+        for process in self.processes:
+            process.start()
+        logger.info("Capture and encode worker processes started.")
+
+    def send(self, *message):
+        if self.control:
+            self.control.put(message)
+
+    def stop(self, timeout=30):
+        """
+        Stops the workers once every captured frame is encoded.
+        Returns the metrics they recorded, to merge into the recorder's registry.
+        """
+        metrics = {}
+        if not self.processes:
+            return metrics
+        self.send('stop')
+        # Collect the results before joining, a process can't exit while its queue is not drained
+        for _ in self.processes:
+            try:
+                worker_metrics = self.results.get(timeout=timeout)
+            except queue.Empty:
+                logger.error("A media worker process did not report back.")
+                break
+            for name, metric in worker_metrics.items():
+                if name in metrics:
+                    metrics[name].merge(metric)
+                else:
+                    metrics[name] = metric
+        for process in self.processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.free = self.filled = self.control = self.results = None
+        self.shm.close()
+        self.shm.unlink()
+        logger.info("Capture and encode worker processes stopped.")
+        return metrics
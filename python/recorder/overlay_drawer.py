@@ -31,3 +31,19 @@ def draw_cursor(image, position):
     image = cv2.line(image, (x - cursor_size, y), (x + cursor_size, y), cursor_color, 2)
     image = cv2.line(image, (x, y - cursor_size), (x, y + cursor_size), cursor_color, 2)
     return image
+
+def draw_overlays(image, overlays, click_overlay, cursor_position):
+    """Draws the element overlays, the cursor and the click overlay, and ages them by one frame.
+    Returns the image with the overlays still alive and the click overlay (or None)."""
+    for overlay in overlays:
+        image = draw_rectangle(image, overlay["bounding_box"], overlay["color"], 2, overlay["element_id"])
+    image = draw_cursor(image, cursor_position)
+    if click_overlay:
+        image = draw_circle(image, (click_overlay["x"], click_overlay["y"]), 15, (0, 255, 0) if click_overlay["button"] == 'Button.left' else (255, 0, 0))
+        click_overlay["ttl"] -= 1
+        if click_overlay["ttl"] <= 0:
+            click_overlay = None
+    overlays = [overlay for overlay in overlays if overlay["ttl"] > 0]
+    for overlay in overlays:
+        overlay["ttl"] -= 1
+    return image, overlays, click_overlay
@@ -9,7 +9,7 @@ logger = get_logger(__name__)
 
 recorder_instance = None
 
-def start_recording(whitelist=None, output_folder="generated_scripts/user_recording"):
+def start_recording(whitelist=None, output_folder="generated_scripts/user_recording", segment_duration=None, max_total_size=None, metrics_interval=None, isolated_capture=False, track_focus=False):
     """
     Starts a new recording session.
     """
@@ -17,7 +17,8 @@ def start_recording(whitelist=None, output_folder="generated_scripts/user_record
     if recorder_instance and recorder_instance.is_recording:
         return "Recording is already in progress."
 
-    recorder_instance = Recorder(output_folder=output_folder, whitelist=whitelist)
+    recorder_instance = Recorder(output_folder=output_folder, whitelist=whitelist, segment_duration=segment_duration, max_total_size=max_total_size, metrics_interval=metrics_interval,
+                                 isolated_capture=isolated_capture, track_focus=track_focus)
     recorder_instance.start()
     return "Recording started."
 
@@ -40,17 +41,25 @@ def main():
 
     parser = argparse.ArgumentParser(description="Record UI interactions.")
     parser.add_argument('-wh', '--whitelist', type=str, nargs='+', help='Filter recording by process name(s).')
+    parser.add_argument('--segment-seconds', type=float, help='Write rolling media segments of this length instead of a single video.')
+    parser.add_argument('--max-disk-mb', type=float, help='Evict the oldest segments once they use more than this many MB.')
+    parser.add_argument('--metrics-interval', type=float, help='Also rewrite metrics.json every N seconds while recording.')
+    parser.add_argument('--isolated-capture', action='store_true', help='Capture and encode video in worker processes, off the input hooks\' GIL.')
+    parser.add_argument('--track-focus', action='store_true', help='Cache the focused element from UIA focus events instead of querying it on every key event.')
     args = parser.parse_args()
+    max_total_size = int(args.max_disk_mb * 1024 * 1024) if args.max_disk_mb else None
 
     def on_activate_record():
         global recorder_instance
         if not recorder_instance:
-            recorder_instance = Recorder(whitelist=args.whitelist)
+            recorder_instance = Recorder(whitelist=args.whitelist, segment_duration=args.segment_seconds, max_total_size=max_total_size, metrics_interval=args.metrics_interval,
+                                         isolated_capture=args.isolated_capture, track_focus=args.track_focus)
 
         if recorder_instance.is_recording:
             stop_recording()
         else:
-            start_recording(whitelist=args.whitelist)
+            start_recording(whitelist=args.whitelist, segment_duration=args.segment_seconds, max_total_size=max_total_size, metrics_interval=args.metrics_interval,
+                            isolated_capture=args.isolated_capture, track_focus=args.track_focus)
 
     hotkey = keyboard.HotKey(
         keyboard.HotKey.parse('<alt>+<shift>+r'),
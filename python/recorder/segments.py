@@ -0,0 +1,127 @@
+import os
+import json
+import queue
+import threading
+import time
+from python.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+class SegmentStore:
+    """
+    Keeps rolling, fixed-length media segments on disk together with a manifest.
+    Segments are finalized one by one on a background thread, and the oldest
+    finalized segments are evicted once the total size exceeds max_total_size.
+    """
+    def __init__(self, folder, finalize_func, max_total_size=None):
+        self.folder = folder
+        self.manifest_file = f"{self.folder}/manifest.json"
+        self.finalize_func = finalize_func
+        self.max_total_size = max_total_size
+
+        self.segments = []
+        self.next_index = 0
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.finalizer_thread = None
+        self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_file):
+            return
+        try:
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+            self.segments = manifest.get('segments', [])
+            self.next_index = manifest.get('next_index', len(self.segments))
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read segment manifest {self.manifest_file}: {e}")
+
+    def _write_manifest(self):
+        manifest = {
+            'next_index': self.next_index,
+            'total_size': sum(s.get('size', 0) for s in self.segments),
+            'segments': self.segments,
+        }
+        temp_file = self.manifest_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temp_file, self.manifest_file)
+
+    def start(self):
+        os.makedirs(self.folder, exist_ok=True)
+        self.finalizer_thread = threading.Thread(target=self._finalize_loop, daemon=True)
+        self.finalizer_thread.start()
+
+    def new_segment(self):
+        """
+        Reserves the next segment index and returns the temp file paths to write it to.
+        """
+        with self.lock:
+            index = self.next_index
+            self.next_index += 1
+        return {
+            'index': index,
+            'temp_video_file': f"{self.folder}/segment_{index:05d}.avi",
+            'temp_audio_file': f"{self.folder}/segment_{index:05d}.wav",
+            'video_file': f"{self.folder}/segment_{index:05d}.mp4",
+            'start_time': time.time(),
+        }
+
+    def submit(self, segment, audio_frames=None):
+        """
+        Queues a closed segment for finalization.
+        """
+        segment['end_time'] = time.time()
+        self.queue.put((segment, audio_frames))
+
+    def close(self):
+        """
+        Waits for all queued segments to be finalized.
+        """
+        if self.finalizer_thread:
+            self.queue.put(None)
+            self.finalizer_thread.join()
+            self.finalizer_thread = None
+
+    def _finalize_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            segment, audio_frames = item
+            try:
+                self._finalize_segment(segment, audio_frames)
+            except Exception as e:
+                logger.error(f"Failed to finalize segment {segment['index']}: {e}")
+
+    def _finalize_segment(self, segment, audio_frames):
+        output_file = self.finalize_func(segment['temp_video_file'], segment['temp_audio_file'], segment['video_file'], audio_frames)
+        entry = {
+            'index': segment['index'],
+            'file': os.path.basename(output_file) if output_file else None,
+            'start_time': segment['start_time'],
+            'end_time': segment['end_time'],
+            'duration': segment['end_time'] - segment['start_time'],
+            'size': os.path.getsize(output_file) if output_file and os.path.exists(output_file) else 0,
+            'status': 'ok' if output_file else 'failed',
+        }
+        with self.lock:
+            self.segments.append(entry)
+            self._evict()
+            self._write_manifest()
+        logger.info(f"Segment {segment['index']} finalized: {entry['file']} ({entry['size']} bytes)")
+
+    def _evict(self):
+        if not self.max_total_size:
+            return
+        total_size = sum(s.get('size', 0) for s in self.segments)
+        # Always keep the newest segment, even if it alone exceeds the budget
+        while total_size > self.max_total_size and len(self.segments) > 1:
+            oldest = self.segments.pop(0)
+            total_size -= oldest.get('size', 0)
+            if oldest.get('file'):
+                path = f"{self.folder}/{oldest['file']}"
+                if os.path.exists(path):
+                    os.remove(path)
+            logger.info(f"Evicted segment {oldest['index']} to stay under {self.max_total_size} bytes.")
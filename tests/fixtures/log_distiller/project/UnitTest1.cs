@@ -0,0 +1,19 @@
+using FlaUI.Core;
+using FlaUI.UIA3;
+
+namespace TemplateTest
+{
+    [TestClass]
+    public class UnitTest1
+    {
+        [TestMethod]
+        public void TestMethod1()
+        {
+            var app = Application.Launch("notepad.exe");
+            var window = app.GetMainWindow(new UIA3Automation());
+            var button = window.FindFirstDescendant(cf => cf.ByName("Save")).AsButton();
+            button.Click();
+            Assert.IsTrue(window.IsAvailable);
+        }
+    }
+}
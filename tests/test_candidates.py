@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+from python.agent.candidates import generate_and_build_candidates
+
+# Builds succeed at once, except for code "hang", which records its pid and never finishes
+BUILD_COMMAND = [sys.executable, "-c", (
+    "import os, sys, time\n"
+    "code = open('code.txt').read()\n"
+    "if code == 'hang':\n"
+    "    open('build.pid', 'w').write(str(os.getpid()))\n"
+    "    time.sleep(60)\n"
+    "sys.exit(1 if code == 'error' else 0)\n"
+)]
+
+
+class Response:
+    def __init__(self, parsed):
+        self.parsed = parsed
+
+
+class FakeChat:
+    """
+    CachedChat stand-in: each fork answers with its own code, after its own delay.
+    """
+    def __init__(self, answers, name="main", delays=None):
+        self.answers = answers
+        self.name = name
+        self.delays = delays or {}
+        self.hits = 0
+        self.misses = 0
+        self.adopted = None
+        self.forks = []
+
+    def fork(self, salt):
+        forked = FakeChat(self.answers, salt, self.delays)
+        self.forks.append(forked)
+        return forked
+
+    def adopt(self, other):
+        self.adopted = other.name
+
+    def merge_counts(self, other):
+        self.hits += other.hits
+        self.misses += other.misses
+
+    def send_message(self, prompt_parts, config=None):
+        delay = self.delays.get(self.name)
+        if delay:
+            delay()
+        answer = self.answers[self.name]
+        if isinstance(answer, Exception):
+            raise answer
+        self.misses += 1
+        return Response(answer)
+
+
+def write_files(code, directory):
+    with open(os.path.join(directory, "code.txt"), 'w') as f:
+        f.write(code)
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def generate(chat, tmp_path, count):
+    project_dir = tmp_path / "project"
+    project_dir.mkdir(exist_ok=True)
+    return generate_and_build_candidates(chat, ["prompt"], None, count, str(project_dir), str(tmp_path / "candidates"), write_files, BUILD_COMMAND)
+
+
+def test_first_build_wins_and_the_hanging_build_is_killed(tmp_path):
+    pid_file = tmp_path / "candidates" / "candidate0" / "build.pid"
+
+    def after_candidate0_builds():
+        deadline = time.monotonic() + 10
+        while not pid_file.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    chat = FakeChat({'candidate0': 'hang', 'candidate1': 'ok'}, delays={'candidate1': after_candidate0_builds})
+    start = time.monotonic()
+    code, build_result = generate(chat, tmp_path, 2)
+    assert time.monotonic() - start < 30
+    assert code == 'ok'
+    assert build_result['returncode'] == 0
+    assert chat.adopted == 'candidate1'
+    # The cancelled build is killed in the background, then its fork reports back
+    assert wait_until(lambda: chat.misses == 2)
+
+    pid = int(pid_file.read_text())
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+def test_winner_is_returned_without_waiting_for_the_other_calls(tmp_path):
+    release = threading.Event()
+    chat = FakeChat({'candidate0': 'ok', 'candidate1': 'ok'}, delays={'candidate1': lambda: release.wait(10)})
+    start = time.monotonic()
+    code, _ = generate(chat, tmp_path, 2)
+    assert time.monotonic() - start < 5
+    assert chat.adopted == 'candidate0'
+    assert chat.misses == 1
+
+    # The losing fork's call is counted once it completes, and its answer is never built
+    release.set()
+    assert wait_until(lambda: chat.misses == 2)
+    assert not os.path.exists(tmp_path / "candidates" / "candidate1")
+
+
+def test_build_output_is_not_copied(tmp_path):
+    obj_dir = tmp_path / "project" / "obj"
+    obj_dir.mkdir(parents=True)
+    (obj_dir / "project.assets.json").write_text("{}")
+    (tmp_path / "project" / "Program.cs").write_text("")
+    generate(FakeChat({'candidate0': 'ok'}), tmp_path, 1)
+    candidate_dir = tmp_path / "candidates" / "candidate0"
+    assert (candidate_dir / "Program.cs").exists()
+    assert not (candidate_dir / "obj").exists()
+
+
+def test_fewest_errors_is_kept_when_nothing_builds(tmp_path):
+    chat = FakeChat({'candidate0': 'error', 'candidate1': 'error'})
+    code, build_result = generate(chat, tmp_path, 2)
+    assert build_result['returncode'] == 1
+    assert chat.adopted == 'candidate0'
+
+
+def test_falls_back_to_a_single_request_when_no_candidate_is_generated(tmp_path):
+    failure = RuntimeError("generation failed")
+    chat = FakeChat({'candidate0': failure, 'candidate1': failure, 'main': 'ok'})
+    code, build_result = generate(chat, tmp_path, 2)
+    assert code == 'ok'
+    assert build_result['returncode'] == 0
+    assert chat.adopted is None
+    assert os.path.exists(tmp_path / "candidates" / "fallback" / "code.txt")
@@ -0,0 +1,112 @@
+import os
+import json
+import struct
+import zlib
+
+from python.common.context_planner import ContextPlanner, estimate_tokens, TOKENS_PER_IMAGE_TILE, TOKENS_PER_VIDEO_SECOND, CHARS_PER_TOKEN
+
+
+def box(kind, payload):
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def write_mp4(path, seconds, timescale=1000, version=0):
+    if version == 1:
+        mvhd = bytes([1, 0, 0, 0]) + struct.pack('>QQIQ', 0, 0, timescale, int(seconds * timescale))
+    else:
+        mvhd = bytes(4) + struct.pack('>IIII', 0, 0, timescale, int(seconds * timescale))
+    mvhd += bytes(80)
+    # Media data first, as written by encoders that don't move the index to the front
+    path.write_bytes(box(b'ftyp', b'isom' + bytes(4)) + box(b'mdat', bytes(5000)) + box(b'moov', box(b'mvhd', mvhd) + box(b'trak', bytes(16))))
+    return str(path)
+
+
+def write_png(path, width, height):
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    chunk = struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+    path.write_bytes(b'\x89PNG\r\n\x1a\n' + chunk)
+    return str(path)
+
+
+def write_text(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def age(paths):
+    # Oldest first
+    for i, path in enumerate(paths):
+        os.utime(path, (1000 + i, 1000 + i))
+
+
+def test_video_cost_comes_from_the_movie_header(tmp_path):
+    for version in (0, 1):
+        video = write_mp4(tmp_path / f"recording_v{version}.mp4", 12.5, version=version)
+        assert estimate_tokens(video, os.path.getsize(video)) == int(12.5 * TOKENS_PER_VIDEO_SECOND)
+
+
+def test_screenshot_cost_is_per_tile(tmp_path):
+    small = write_png(tmp_path / "small.png", 300, 200)
+    large = write_png(tmp_path / "large.png", 1000, 800)
+    assert estimate_tokens(small, 100) == TOKENS_PER_IMAGE_TILE
+    # 2 x 2 tiles of 768px
+    assert estimate_tokens(large, 100) == 4 * TOKENS_PER_IMAGE_TILE
+    assert estimate_tokens(write_text(tmp_path / "notes.txt", "x" * 400), 400) == 400 // CHARS_PER_TOKEN
+
+
+def test_plan_ranks_by_kind_mentions_and_recency(tmp_path):
+    summary = write_text(tmp_path / "test_summary.txt", "FAILED TestMethod1\n  Element 42_7 not found")
+    annotations = write_text(tmp_path / "annotations.json.txt", json.dumps([]))
+    mentioned = write_png(tmp_path / "42_7__1200.png", 300, 200)
+    older = write_png(tmp_path / "42_8__1100.png", 300, 200)
+    newer = write_png(tmp_path / "42_9__1300.png", 300, 200)
+    paths = [summary, annotations, older, mentioned, newer]
+    age(paths)
+
+    plan = ContextPlanner().plan(paths)
+    scores = {os.path.basename(a['path']): a for a in plan['selected']}
+    assert scores['test_summary.txt']['score'] > scores['annotations.json.txt']['score'] > scores['42_9__1300.png']['score']
+    # The logs mention it, which outweighs the more recent screenshot
+    assert 'mentioned in logs' in scores['42_7__1200.png']['reasons']
+    assert scores['42_7__1200.png']['score'] > scores['42_9__1300.png']['score']
+    # Same kind, no mention: the more recent one ranks higher
+    assert scores['42_9__1300.png']['score'] > scores['42_8__1100.png']['score']
+    assert plan['dropped'] == []
+
+
+def test_small_budget_keeps_the_most_relevant(tmp_path):
+    summary = write_text(tmp_path / "test_summary.txt", "Element 42_7 not found")
+    mentioned = write_png(tmp_path / "42_7__1200.png", 300, 200)
+    other = write_png(tmp_path / "42_8__1300.png", 300, 200)
+    video = write_mp4(tmp_path / "recording.mp4", 60)
+    paths = [video, other, mentioned, summary]
+    age(paths)
+
+    summary_tokens = estimate_tokens(summary, os.path.getsize(summary))
+    plan = ContextPlanner(token_budget=summary_tokens + TOKENS_PER_IMAGE_TILE).plan(paths)
+    # In the input order
+    assert [os.path.basename(a['path']) for a in plan['selected']] == ["42_7__1200.png", "test_summary.txt"]
+    assert {os.path.basename(a['path']): a['dropped_because'] for a in plan['dropped']} == {"recording.mp4": 'token budget', "42_8__1300.png": 'token budget'}
+    assert plan['tokens'] == summary_tokens + TOKENS_PER_IMAGE_TILE
+
+
+def test_pinned_summaries_are_kept_over_budget(tmp_path):
+    summaries = [write_text(tmp_path / f"{name}_summary.txt", "x" * 4000) for name in ("compilation", "test")]
+    screenshot = write_png(tmp_path / "42_7__1200.png", 300, 200)
+    plan = ContextPlanner(token_budget=100, byte_budget=1000).plan(summaries + [screenshot])
+    assert [a['path'] for a in plan['selected']] == summaries
+    assert plan['tokens'] == 2 * 1000 and plan['tokens'] > plan['budget']['tokens']
+    assert plan['dropped'][0]['path'] == screenshot
+
+
+def test_select_writes_the_plan(tmp_path):
+    summary = write_text(tmp_path / "test_summary.txt", "FAILED")
+    video = write_mp4(tmp_path / "recording.mp4", 60)
+    plan_file = tmp_path / "plans" / "context_plan.json"
+    assert ContextPlanner(byte_budget=100).select([video, summary], str(plan_file)) == [summary]
+
+    plan = json.loads(plan_file.read_text())
+    assert plan['budget'] == {'tokens': None, 'bytes': 100}
+    assert [a['path'] for a in plan['selected']] == [summary]
+    assert plan['dropped'][0]['path'] == video and plan['dropped'][0]['dropped_because'] == 'byte budget'
+    assert plan['dropped'][0]['tokens'] == 60 * TOKENS_PER_VIDEO_SECOND
@@ -0,0 +1,50 @@
+import json
+
+from python.recorder.element_table import ElementTable, serialize_annotations, expand_annotations, load_annotations, FORMAT_VERSION
+
+
+def checkbox(state):
+    return {'id': '42_7', 'name': 'Remember me', 'control_type': 'CheckBoxControl', 'bounding_rectangle': [10, 10, 120, 30],
+            'patterns': {'TogglePattern': {'ToggleState': state}}}
+
+
+WINDOW = {'id': '42_1', 'name': 'Login', 'control_type': 'WindowControl', 'bounding_rectangle': [0, 0, 800, 600], 'patterns': {}}
+
+
+def record(table, hierarchies):
+    return [{'timestamp': i, 'event_type': 'mouse_click', 'event_data': {}, 'element_hierarchy': [table.ref(info) for info in hierarchy] if hierarchy else None}
+            for i, hierarchy in enumerate(hierarchies)]
+
+
+def test_changed_element_gets_a_new_version():
+    table = ElementTable()
+    assert table.ref(checkbox('Off')) == ['42_7', 0]
+    assert table.ref(checkbox('Off')) == ['42_7', 0]
+    assert table.ref(checkbox('On')) == ['42_7', 1]
+    # Toggled back: the first version is reused
+    assert table.ref(checkbox('Off')) == ['42_7', 0]
+    assert table.ref(WINDOW) == ['42_1', 0]
+    assert len(table.elements['42_7']) == 2
+    assert table.get('42_7', 1) == checkbox('On')
+
+
+def test_annotations_round_trip(tmp_path):
+    hierarchies = [[checkbox('Off'), WINDOW], [checkbox('On'), WINDOW], None, [checkbox('Off'), WINDOW]]
+    table = ElementTable()
+    events = record(table, hierarchies)
+    annotations_file = tmp_path / "annotations.json.txt"
+    annotations_file.write_text(json.dumps(serialize_annotations(events, table)))
+
+    data = json.loads(annotations_file.read_text())
+    assert data['format'] == FORMAT_VERSION
+    # Each element version is stored once, however many events refer to it
+    assert {element_id: len(versions) for element_id, versions in data['elements'].items()} == {'42_7': 2, '42_1': 1}
+
+    loaded = load_annotations(str(annotations_file))
+    assert [event['element_hierarchy'] for event in loaded] == hierarchies
+    assert [event['timestamp'] for event in loaded] == [0, 1, 2, 3]
+
+
+def test_format_1_is_returned_unchanged():
+    events = [{'timestamp': 0, 'event_type': 'key_release', 'event_data': "'a'", 'element_hierarchy': [checkbox('Off')]}]
+    assert expand_annotations(events) is events
@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+
+from python.common import uia, fake_uia
+from python.common.fake_uia import build_tree
+from python.common.focus_tracker import FocusTracker, ScriptedEventSource
+from python.common.uia import UIAHelper
+
+
+@pytest.fixture
+def fake():
+    fake = build_tree(50)
+    uia.set_backend(fake)
+    yield fake
+    uia.set_backend(None)
+
+
+def make_tracker(**kwargs):
+    source = ScriptedEventSource()
+    tracker = FocusTracker(UIAHelper(), source, **kwargs)
+    tracker.start()
+    return tracker, source
+
+
+def test_hits_until_focus_changes(fake):
+    tracker, source = make_tracker()
+    element, _, hierarchy = tracker.current()
+    assert element is fake.focused
+    assert hierarchy[0]['id'] == uia.get_runtime_id(fake.focused)
+    tracker.current()
+    tracker.current()
+    assert (tracker.hits, tracker.misses) == (2, 1)
+
+    other = fake.focused.GetParentControl()
+    source.focus(other)
+    element, _, hierarchy = tracker.current()
+    assert element is other
+    assert hierarchy[0]['id'] == uia.get_runtime_id(other)
+    assert (tracker.hits, tracker.misses) == (2, 2)
+
+
+def test_hit_makes_no_uia_calls(fake):
+    tracker, _ = make_tracker()
+    tracker.current()
+    fake.reset_calls()
+    tracker.current()
+    assert fake.total_calls() == 0
+
+
+def test_structure_change_invalidates_only_cached_elements(fake):
+    tracker, source = make_tracker()
+    _, _, hierarchy = tracker.current()
+    unrelated = next(c for c in fake.root.children[0].children if uia.get_runtime_id(c) not in {info['id'] for info in hierarchy})
+    source.structure_changed(unrelated)
+    tracker.current()
+    assert (tracker.hits, tracker.misses) == (1, 1)
+
+    source.structure_changed(fake.focused.GetParentControl())
+    tracker.current()
+    assert (tracker.hits, tracker.misses) == (1, 2)
+
+    # Without a sender, anything may have changed
+    source.structure_changed(None)
+    tracker.current()
+    assert (tracker.hits, tracker.misses) == (1, 3)
+
+
+def test_walk_overtaken_by_focus_change_is_not_cached(fake):
+    tracker, source = make_tracker()
+    other = fake.focused.GetParentControl()
+    get_element_hierarchy = tracker.uia_helper.get_element_hierarchy
+
+    def walk_then_change_focus(element, process_names=None):
+        hierarchy = get_element_hierarchy(element, process_names)
+        source.focus(other)
+        return hierarchy
+
+    tracker.uia_helper.get_element_hierarchy = walk_then_change_focus
+    element, _, _ = tracker.current()
+    assert element is fake.focused
+    tracker.uia_helper.get_element_hierarchy = get_element_hierarchy
+    element, _, _ = tracker.current()
+    assert element is other
+    assert tracker.misses == 2
+
+
+def test_notifications_are_not_blocked_by_a_walk(fake):
+    tracker, source = make_tracker()
+    walking, release = threading.Event(), threading.Event()
+    get_element_hierarchy = tracker.uia_helper.get_element_hierarchy
+
+    def slow_walk(element, process_names=None):
+        walking.set()
+        release.wait(5)
+        return get_element_hierarchy(element, process_names)
+
+    tracker.uia_helper.get_element_hierarchy = slow_walk
+    thread = threading.Thread(target=tracker.current)
+    thread.start()
+    assert walking.wait(5)
+    notified = threading.Thread(target=source.focus, args=(fake.focused,))
+    notified.start()
+    notified.join(1)
+    assert not notified.is_alive()
+    release.set()
+    thread.join(5)
+
+
+def test_refresh_element_rereads_the_value_and_rect_only(fake, monkeypatch):
+    def controls(control):
+        yield control
+        for child in control.children:
+            yield from controls(child)
+
+    fake.focused = next(c for c in controls(fake.root) if c.properties['ControlTypeName'] == 'EditControl')
+    tracker, _ = make_tracker(refresh_element=True)
+    _, _, hierarchy = tracker.current()
+    assert hierarchy[0]['patterns']['ValuePattern']['Value'] == 'text'
+
+    monkeypatch.setitem(fake_uia.PATTERN_VALUES, 'Value', {'Value': 'typed', 'IsReadOnly': False})
+    moved = fake_uia.FakeRect(100, 100, 300, 120)
+    monkeypatch.setitem(fake.focused.properties, 'BoundingRectangle', moved)
+    fake.reset_calls()
+    _, _, refreshed = tracker.current()
+    assert refreshed[0]['patterns']['ValuePattern']['Value'] == 'typed'
+    assert refreshed[0]['bounding_rectangle'] is moved
+    assert refreshed[1:] == hierarchy[1:]
+    assert tracker.hits == 1
+    assert set(fake.calls) == {'BoundingRectangle', 'GetValuePattern', 'ValuePattern.Value', 'ValuePattern.IsReadOnly'}
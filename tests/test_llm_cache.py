@@ -0,0 +1,155 @@
+import pytest
+
+types = pytest.importorskip("google.genai.types")
+from pydantic import BaseModel
+
+from python.common.llm_cache import ResponseCache, CachedChat, ReplayMissError, config_digest, part_digest
+
+
+class Answer(BaseModel):
+    code: str
+
+
+class LiveResponse:
+    def __init__(self, text):
+        self.text = text
+        self.parsed = Answer.model_validate_json(text)
+
+
+class LiveChat:
+    """
+    genai chat stand-in: answers with the number of messages it was sent, including its seeded history.
+    """
+    def __init__(self, history):
+        self.history = history
+        self.sent = []
+
+    def send_message(self, prompt_parts, config=None):
+        self.sent.append(prompt_parts)
+        return LiveResponse(f'{{"code": "answer {len(self.history) // 2 + len(self.sent)}"}}')
+
+
+class ChatFactory:
+    def __init__(self):
+        self.chats = []
+
+    def __call__(self, history):
+        chat = LiveChat(history)
+        self.chats.append(chat)
+        return chat
+
+
+class FilePart:
+    # Uploaded file reference, as returned by the files API
+    def __init__(self, uri, sha256_hash=None, mime_type="text/plain"):
+        self.uri = uri
+        self.sha256_hash = sha256_hash
+        self.mime_type = mime_type
+
+
+CONFIG = types.GenerateContentConfig(response_mime_type="application/json", response_schema=Answer, system_instruction="Write code.")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "llm_cache"))
+
+
+def make_chat(cache, model="model-a", replay=False):
+    factory = ChatFactory()
+    return CachedChat(model, cache=cache, chat_factory=factory, replay=replay), factory
+
+
+def converse(chat, prompts, config=CONFIG):
+    return [chat.send_message([prompt], config).parsed.code for prompt in prompts]
+
+
+def test_conversation_is_replayed_from_the_cache(cache):
+    chat, _ = make_chat(cache)
+    assert converse(chat, ["generate", "fix it"]) == ["answer 1", "answer 2"]
+    assert (chat.hits, chat.misses) == (0, 2)
+
+    again, factory = make_chat(cache)
+    assert converse(again, ["generate", "fix it"]) == ["answer 1", "answer 2"]
+    assert (again.hits, again.misses) == (2, 0)
+    # No live chat is created while everything is served from the cache
+    assert factory.chats == []
+
+
+def test_key_covers_model_config_history_and_parts(cache):
+    chat, _ = make_chat(cache)
+    converse(chat, ["generate", "fix it"])
+
+    other_model, _ = make_chat(cache, model="model-b")
+    converse(other_model, ["generate"])
+    other_config, _ = make_chat(cache)
+    converse(other_config, ["generate"], types.GenerateContentConfig(response_mime_type="application/json", response_schema=Answer, system_instruction="Write tests."))
+    other_history, _ = make_chat(cache)
+    converse(other_history, ["generate differently", "fix it"])
+    other_parts, _ = make_chat(cache)
+    converse(other_parts, ["generate", "fix it again"])
+    assert [c.misses for c in (other_model, other_config, other_history, other_parts)] == [1, 1, 2, 1]
+    assert other_parts.hits == 1
+
+
+def test_files_are_keyed_by_content():
+    assert part_digest(FilePart("files/abc", sha256_hash="1234")) == part_digest(FilePart("files/def", sha256_hash="1234"))
+    assert part_digest(FilePart("files/abc")) != part_digest(FilePart("files/def"))
+    assert part_digest("text") != part_digest("other text")
+
+
+def test_config_digest_covers_the_response_schema():
+    class OtherAnswer(BaseModel):
+        code: str
+        comments: str
+
+    other = types.GenerateContentConfig(response_mime_type="application/json", response_schema=OtherAnswer, system_instruction="Write code.")
+    assert config_digest(CONFIG) == config_digest(types.GenerateContentConfig(response_mime_type="application/json", response_schema=Answer, system_instruction="Write code."))
+    assert config_digest(CONFIG) != config_digest(other)
+    assert config_digest(None) != config_digest(CONFIG)
+
+
+def test_live_chat_is_seeded_with_the_cached_turns(cache):
+    chat, _ = make_chat(cache)
+    converse(chat, ["generate"])
+
+    again, factory = make_chat(cache)
+    assert converse(again, ["generate", "fix it"]) == ["answer 1", "answer 2"]
+    assert (again.hits, again.misses) == (1, 1)
+    history = factory.chats[0].history
+    assert [content.role for content in history] == ["user", "model"]
+    assert history[0].parts[0].text == "generate"
+
+
+def test_forks_are_cached_apart_and_adopted(cache):
+    chat, _ = make_chat(cache)
+    converse(chat, ["generate"])
+    first, second = chat.fork("candidate0"), chat.fork("candidate1")
+    converse(first, ["fix it"])
+    converse(second, ["fix it"])
+    # Same prompt and history, but each fork made its own request
+    assert (first.misses, second.misses) == (1, 1)
+
+    chat.adopt(second)
+    assert chat.turns == second.turns
+    assert chat.history_digest == second.history_digest
+    assert chat.live_chat is second.live_chat
+
+    # A rerun of the same forks is served from the cache
+    rerun, factory = make_chat(cache)
+    converse(rerun, ["generate"])
+    fork = rerun.fork("candidate1")
+    converse(fork, ["fix it"])
+    assert (rerun.hits, fork.hits) == (1, 1)
+    assert factory.chats == []
+
+
+def test_replay_raises_on_a_miss(cache):
+    chat, _ = make_chat(cache)
+    converse(chat, ["generate"])
+
+    replay, factory = make_chat(cache, replay=True)
+    assert converse(replay, ["generate"]) == ["answer 1"]
+    with pytest.raises(ReplayMissError):
+        converse(replay, ["fix it"])
+    assert factory.chats == []
@@ -0,0 +1,210 @@
+import os
+import time
+
+import pytest
+from contextlib import contextmanager
+from python.common.common_flow import send_message_with_retries
+from python.common.llm_client import LLMClient, TokenBucket, FileTokenBucket, get_retry_after
+
+
+class APIError(Exception):
+    def __init__(self, code, retry_after=None):
+        super().__init__(f"{code} error")
+        self.code = code
+        self.response = type('Response', (), {'headers': {'Retry-After': str(retry_after)} if retry_after is not None else {}})()
+
+
+class Usage:
+    prompt_token_count = 10
+    candidates_token_count = 5
+    total_token_count = 15
+
+
+class Response:
+    usage_metadata = Usage()
+
+
+class FakeChat:
+    """
+    Fails with the scripted errors, in order, then answers.
+    """
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def send_message(self, prompt_parts, config=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return Response()
+
+
+def make_client(max_retries=5, base_delay=1.0, max_delay=60.0):
+    delays = []
+    return LLMClient(max_retries=max_retries, base_delay=base_delay, max_delay=max_delay, sleep=delays.append), delays
+
+
+def test_retries_throttling_and_server_errors():
+    client, delays = make_client()
+    chat = FakeChat(APIError(429), APIError(503), APIError(503))
+    assert isinstance(client.send_message(chat, ["prompt"], None), Response)
+    assert chat.calls == 4
+    entry = client.metrics[-1]
+    assert entry['attempts'] == 4
+    assert [r['status_code'] for r in entry['retries']] == [429, 503, 503]
+    assert entry['prompt_tokens'] == 10 and entry['output_tokens'] == 5
+
+
+def test_retries_timeouts():
+    client, delays = make_client()
+    chat = FakeChat(TimeoutError("read timed out"))
+    client.send_message(chat, ["prompt"], None)
+    assert chat.calls == 2
+    assert client.metrics[-1]['retries'][0]['timeout'] is True
+
+
+def test_backoff_is_bounded_exponential_with_jitter():
+    client, delays = make_client(max_retries=6, base_delay=1.0, max_delay=8.0)
+    chat = FakeChat(*[APIError(503) for _ in range(6)])
+    client.send_message(chat, ["prompt"], None)
+    assert len(delays) == 6
+    for attempt, delay in enumerate(delays, start=1):
+        assert 0 <= delay <= min(8.0, 2 ** (attempt - 1))
+
+
+def test_retry_after_sets_the_minimum_delay():
+    client, delays = make_client(base_delay=0.01)
+    chat = FakeChat(APIError(429, retry_after=7))
+    client.send_message(chat, ["prompt"], None)
+    assert delays == [7.0]
+
+
+def test_retry_after_is_capped_by_max_delay():
+    client, delays = make_client(base_delay=0.01, max_delay=5.0)
+    client.send_message(FakeChat(APIError(429, retry_after=120)), ["prompt"], None)
+    assert delays == [5.0]
+
+
+def test_retry_delay_from_error_details():
+    assert get_retry_after(Exception("429 RESOURCE_EXHAUSTED {'retryDelay': '17s'}")) == 17.0
+
+
+def test_gives_up_after_max_retries():
+    client, delays = make_client(max_retries=2)
+    chat = FakeChat(*[APIError(503) for _ in range(5)])
+    with pytest.raises(APIError):
+        client.send_message(chat, ["prompt"], None)
+    assert chat.calls == 3
+    assert client.metrics[-1]['status'] == 'error'
+    assert client.metrics[-1]['attempts'] == 3
+
+
+def test_does_not_retry_client_errors():
+    client, delays = make_client()
+    chat = FakeChat(APIError(400))
+    with pytest.raises(APIError):
+        client.send_message(chat, ["prompt"], None)
+    assert chat.calls == 1
+    assert delays == []
+
+
+def test_span_attributes_come_from_the_call_itself(monkeypatch):
+    from python.common import llm_client
+    captured = []
+
+    @contextmanager
+    def span(name, **attributes):
+        captured.append(attributes)
+        yield attributes
+
+    monkeypatch.setattr(llm_client, 'span', span)
+    client, _ = make_client()
+    real_record = client._record
+
+    def record(entry):
+        real_record(entry)
+        # Another thread's call finishing right after this one must not leak into this call's span
+        real_record({'attempts': 99, 'prompt_tokens': 99, 'retries': [], 'throttle_wait': 0.0, 'status': 'ok', 'latency': 0})
+
+    client._record = record
+    client.send_message(FakeChat(APIError(503)), ["prompt"], None)
+    assert captured[-1]['attempts'] == 2
+    assert captured[-1]['prompt_tokens'] == 10
+
+
+class Clock:
+    """
+    Simulated clock, advanced by the bucket's own sleeps.
+    """
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_bucket_allows_a_burst_then_the_rate():
+    clock = Clock()
+    bucket = TokenBucket(rate=2.0, capacity=3, clock=clock, sleep=clock.sleep)
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.acquire() == pytest.approx(0.5)
+    clock.now += 10
+    # Refilled up to the capacity only
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.acquire() == pytest.approx(0.5)
+
+
+def test_file_buckets_share_their_budget(tmp_path):
+    clock = Clock()
+    state_file = str(tmp_path / "limits" / "key.json")
+    first = FileTokenBucket(state_file, rate=1.0, capacity=2, clock=clock, sleep=clock.sleep)
+    second = FileTokenBucket(state_file, rate=1.0, capacity=2, clock=clock, sleep=clock.sleep)
+    assert first.acquire() == 0
+    assert second.acquire() == 0
+    # Both took from the same two tokens
+    assert first.acquire() == pytest.approx(1.0)
+    clock.now += 1
+    assert second.acquire() == 0
+    assert not os.path.exists(first.lock_file)
+
+
+def test_file_bucket_waits_for_the_lock(tmp_path):
+    clock = Clock()
+    bucket = FileTokenBucket(str(tmp_path / "key.json"), rate=1.0, capacity=1, clock=clock, sleep=clock.sleep)
+    # Another process holds the lock, and releases it after a few polls
+    open(bucket.lock_file, 'w').close()
+
+    def sleep(seconds):
+        clock.sleep(seconds)
+        if len(clock.sleeps) == 3:
+            os.remove(bucket.lock_file)
+
+    bucket.sleep = sleep
+    assert bucket.acquire() == 0
+    assert len(clock.sleeps) == 3
+    assert not os.path.exists(bucket.lock_file)
+
+
+def test_file_bucket_breaks_a_stale_lock(tmp_path):
+    clock = Clock()
+    bucket = FileTokenBucket(str(tmp_path / "key.json"), rate=1.0, capacity=1, clock=clock, sleep=clock.sleep)
+    open(bucket.lock_file, 'w').close()
+    # Left by a process that crashed 11 seconds ago
+    stale = time.time() - 11
+    os.utime(bucket.lock_file, (stale, stale))
+    assert bucket.acquire() == 0
+    assert clock.sleeps == []
+    assert not os.path.exists(bucket.lock_file)
+
+
+def test_send_message_with_retries_counts_attempts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chat = FakeChat(APIError(503), APIError(503), APIError(503))
+    with pytest.raises(APIError):
+        send_message_with_retries(chat, ["prompt"], None, max_retries=3, retry_delay=0)
+    assert chat.calls == 3
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from python.common.log_distiller import distill_build_log, distill_test_log, parse_msbuild_diagnostics, source_snippet
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "log_distiller")
+# The logs were written on another machine, their absolute paths only resolve through the project dir
+PROJECT_DIR = os.path.join(FIXTURES, "project")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def build_log():
+    return read_fixture("build.log")
+
+
+@pytest.fixture
+def test_log():
+    return read_fixture("test.log")
+
+
+def test_build_diagnostics_are_deduplicated(build_log):
+    # MSBuild repeats every diagnostic in its closing summary
+    diagnostics = parse_msbuild_diagnostics(build_log)
+    assert [(d['severity'], d['code'], d['line'], d['count']) for d in diagnostics] == [
+        ('error', 'CS0103', '14', 2),
+        ('error', 'CS1061', '15', 2),
+        ('warning', 'CS0168', '16', 2),
+    ]
+
+
+def test_build_summary_line(build_log):
+    distilled = distill_build_log(build_log, "", PROJECT_DIR)
+    assert distilled.splitlines()[0] == "BUILD SUMMARY: 2 error(s), 1 warning(s)"
+    assert distilled.count("ERROR CS0103 UnitTest1.cs:14:38 (x2)") == 1
+    assert distilled.count("The name 'cf' does not exist in the current context") == 1
+    assert "WARNING CS0168 UnitTest1.cs:16:13 (x2)" in distilled
+
+
+def test_build_errors_get_a_source_excerpt(build_log):
+    distilled = distill_build_log(build_log, "", PROJECT_DIR)
+    assert '> 0014:             var button = window.FindFirstDescendant(cf => cf.ByName("Save")).AsButton();' in distilled
+    assert "> 0015:             button.Click();" in distilled
+    # Warnings are listed without an excerpt
+    assert "> 0016:" not in distilled
+
+
+def test_source_snippet_marks_the_line():
+    snippet = source_snippet("C:\\agents\\ws3\\TemplateTest\\UnitTest1.cs", 1, PROJECT_DIR, context=1)
+    assert snippet.splitlines() == ["> 0001: using FlaUI.Core;", "  0002: using FlaUI.UIA3;"]
+    assert source_snippet("C:\\agents\\ws3\\TemplateTest\\Missing.cs", 1, PROJECT_DIR) is None
+
+
+def test_test_summary_line_and_failure(test_log):
+    distilled = distill_test_log(test_log, "", PROJECT_DIR)
+    lines = distilled.splitlines()
+    assert lines[0].startswith("TEST SUMMARY: Failed!  - Failed:     1, Passed:     1")
+    assert "FAILED TestMethod1 [6 s]" in lines
+    assert "TestMethod2" not in distilled
+    # The repeated exception message is kept once
+    assert distilled.count("System.NullReferenceException: Object reference not set") == 1
+    assert "  at TemplateTest.UnitTest1.TestMethod1() (UnitTest1.cs:14)" in lines
+    assert '> 0014:             var button = window.FindFirstDescendant(cf => cf.ByName("Save")).AsButton();' in lines
+
+
+def test_test_logger_lines_are_deduplicated(test_log):
+    distilled = distill_test_log(test_log, "", PROJECT_DIR)
+    assert "TEST LOG (last 3 of 3 lines):" in distilled
+    assert distilled.count("INFO Main window found") == 1
+    # Also echoed under Standard Output Messages
+    assert distilled.count("ERROR Save button not found") == 1
+
+
+def test_missing_test_summary_falls_back_to_the_tail():
+    distilled = distill_test_log("Build started\nsomething went wrong\n", "boom", PROJECT_DIR)
+    assert distilled.splitlines()[0] == "TEST SUMMARY: no summary found"
+    assert distilled.rstrip().endswith("something went wrong\nboom")
@@ -0,0 +1,113 @@
+import json
+import time
+
+import pytest
+
+from python.common import uia, fake_uia
+from python.common.fake_uia import build_tree
+from python.common.focus_tracker import ScriptedEventSource
+from python.common.uia import UIAHelper
+from python.recorder.element_table import load_annotations
+from python.recorder.load_replay import StubMediaRecorder, NullInputListener
+from python.recorder.main_recorder import Recorder
+
+
+@pytest.fixture
+def fake():
+    fake = build_tree(50)
+    uia.set_backend(fake)
+    yield fake
+    uia.set_backend(None)
+
+
+def make_recorder(tmp_path, **kwargs):
+    return Recorder(output_folder=str(tmp_path / "recording"), media_recorder=StubMediaRecorder(), uia_helper=UIAHelper(),
+                    input_listener=NullInputListener(), **kwargs)
+
+
+def click_at(recorder, timestamp, x, y):
+    # Events are timestamped relative to the start time
+    recorder.start_time = time.time() - timestamp
+    recorder._handle_click(x, y, 'Button.left', True)
+
+
+def saved_annotations(recorder):
+    with open(recorder.json_file) as f:
+        return json.load(f)
+
+
+def test_buffered_mode_keeps_only_the_window(tmp_path, fake):
+    recorder = make_recorder(tmp_path, buffer_seconds=10)
+    recorder.start()
+    # Two columns of the window, with different elements under them
+    click_at(recorder, 0, 5, 500)
+    click_at(recorder, 5, 1900, 500)
+    click_at(recorder, 20, 1900, 500)
+    assert len(recorder.annotations) == 1
+    # Nothing goes through the table while buffering, the dropped events take their elements with them
+    assert recorder.element_table.elements == {}
+    recorder.stop()
+    assert not (tmp_path / "recording").exists()
+
+    recorder.save()
+    data = saved_annotations(recorder)
+    assert len(data['events']) == 1
+    kept_ids = {element_id for element_id, _ in data['events'][0]['element_hierarchy']}
+    assert set(data['elements']) == kept_ids
+    assert uia.get_runtime_id(fake.ControlFromPoint(5, 500)) not in data['elements']
+
+
+def test_buffered_mode_without_save_writes_nothing(tmp_path, fake):
+    recorder = make_recorder(tmp_path, buffer_seconds=10)
+    recorder.start()
+    click_at(recorder, 0, 5, 500)
+    recorder.stop()
+    assert not (tmp_path / "recording").exists()
+
+
+def test_unbuffered_mode_writes_every_event_at_stop(tmp_path, fake):
+    recorder = make_recorder(tmp_path)
+    recorder.start()
+    click_at(recorder, 0, 5, 500)
+    click_at(recorder, 20, 1900, 500)
+    recorder.stop()
+    data = saved_annotations(recorder)
+    assert len(data['events']) == 2
+    assert data['elements'] == recorder.element_table.elements
+
+
+def test_focus_tracking_records_the_typed_value(tmp_path, fake, monkeypatch):
+    window = fake.root.children[0]
+    fake.focused = next(c for c in window.children if c.properties['ControlTypeName'] == 'EditControl')
+    recorder = make_recorder(tmp_path, track_focus=True, focus_source=ScriptedEventSource())
+    recorder.start()
+    recorder._handle_release('a')
+    # The focus doesn't change while typing, the second key release hits the cache
+    monkeypatch.setitem(fake_uia.PATTERN_VALUES, 'Value', {'Value': 'typed', 'IsReadOnly': False})
+    monkeypatch.setitem(fake.focused.properties, 'BoundingRectangle', fake_uia.FakeRect(100, 100, 300, 120))
+    recorder._handle_release('b')
+    recorder.stop()
+    assert recorder.focus_tracker.hits == 1
+
+    events = load_annotations(recorder.json_file)
+    focused = [event['element_hierarchy'][0] for event in events]
+    assert [info['patterns']['ValuePattern']['Value'] for info in focused] == ['text', 'typed']
+    assert focused[1]['bounding_rectangle'] == [100, 100, 300, 120]
+
+
+def test_lazy_patterns_are_resolved_when_written(tmp_path, fake):
+    # A leaf edit, so that it is the control under the click
+    edit = next(c for c in fake.root.children[0].children[0].children if c.properties['ControlTypeName'] == 'EditControl')
+    rect = edit.properties['BoundingRectangle']
+    recorder = make_recorder(tmp_path)
+    recorder.start()
+    fake.reset_calls()
+    click_at(recorder, 0, (rect.left + rect.right) // 2, rect.bottom - 1)
+    assert recorder.annotations[0]['element_hierarchy'][0]['id'] == uia.get_runtime_id(edit)
+    # The input hook only queried the cheap patterns of the clicked element
+    assert fake.calls['GetTextPattern'] == 0
+    recorder.stop()
+    assert fake.calls['GetTextPattern'] == 1
+
+    events = load_annotations(recorder.json_file)
+    assert events[0]['element_hierarchy'][0]['patterns']['TextPattern'] == {'Text': "Lorem ipsum dolor sit amet"}
@@ -0,0 +1,61 @@
+import time
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("pyautogui")
+
+from python.recorder import media
+
+
+class ScriptedInputStream:
+    """
+    sounddevice.InputStream stand-in: delivers a block every 10 ms, and a last block when closed,
+    a little later, as the driver flushes the frames it still holds.
+    """
+    delivered = 0
+
+    def __init__(self, samplerate, channels, callback):
+        self.callback = callback
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+
+    def _deliver(self):
+        self.callback(np.ones((441, 1), dtype=np.float32), 441, None, None)
+        ScriptedInputStream.delivered += 1
+
+    def _run(self):
+        while not self.stopped.wait(0.01):
+            self._deliver()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        time.sleep(0.2)
+        self._deliver()
+
+
+def test_segments_get_all_the_audio(tmp_path, monkeypatch):
+    monkeypatch.setattr(media.sd, 'InputStream', ScriptedInputStream, raising=False)
+    ScriptedInputStream.delivered = 0
+    recorder = media.MediaRecorder(str(tmp_path), segment_duration=0.2)
+    finalized = []
+
+    def finalize(temp_video_file, temp_audio_file, video_file, audio_frames):
+        finalized.append(len(audio_frames or ()))
+        return None
+
+    recorder.segment_store.finalize_func = finalize
+    recorder.start()
+    time.sleep(0.5)
+    recorder.stop()
+
+    assert len(finalized) >= 2
+    # Including the block delivered while the audio stream was closing, after the video thread stopped
+    assert sum(finalized) == ScriptedInputStream.delivered
@@ -0,0 +1,132 @@
+import time
+import queue
+import threading
+from multiprocessing import shared_memory
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("pyautogui")
+
+from python.recorder import media_worker, overlay_drawer
+from python.recorder.media_worker import IsolatedCapture, CHANNELS
+
+SHAPE = (36, 64)
+SLOTS = 4
+
+
+def synthetic_screenshot():
+    # Module level, to be pickled into the spawned capture process
+    return np.zeros((SHAPE[0] * 10, SHAPE[1] * 10, CHANNELS), dtype=np.uint8)
+
+
+class CountingScreen:
+    """
+    pyautogui.screenshot stand-in: returns frames of the given size, and signals once `count` were taken.
+    """
+    def __init__(self, count, size=SHAPE):
+        self.count = count
+        self.size = size
+        self.taken = 0
+        self.done = threading.Event()
+
+    def __call__(self):
+        self.taken += 1
+        if self.taken >= self.count:
+            self.done.set()
+        return np.full((self.size[0], self.size[1], CHANNELS), self.taken % 256, dtype=np.uint8)
+
+
+def run_workers(tmp_path, grab):
+    """
+    Runs the capture and encode workers in threads until grab has taken its frames, then stops them.
+    Returns (free slots left, filled queue, {metric name: metric}).
+    """
+    shm = shared_memory.SharedMemory(create=True, size=SLOTS * SHAPE[0] * SHAPE[1] * CHANNELS)
+    free, filled, control, results = queue.Queue(), queue.Queue(), queue.Queue(), queue.Queue()
+    for slot in range(SLOTS):
+        free.put(slot)
+    workers = [
+        threading.Thread(target=media_worker._capture_worker, args=(shm.name, SHAPE, SLOTS, free, filled, control, results, 200.0, 40, grab)),
+        threading.Thread(target=media_worker._encode_worker, args=(shm.name, SHAPE, SLOTS, free, filled, results, str(tmp_path / "video.avi"), 200.0)),
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        assert grab.done.wait(10)
+        control.put(('stop',))
+        for worker in workers:
+            worker.join(10)
+            assert not worker.is_alive()
+    finally:
+        shm.close()
+        shm.unlink()
+    metrics = {}
+    for _ in workers:
+        metrics.update(results.get(timeout=1))
+    return sorted(free.queue), filled, metrics
+
+
+def test_every_slot_is_back_after_the_drain(tmp_path):
+    free, filled, metrics = run_workers(tmp_path, CountingScreen(3 * SLOTS))
+    assert free == list(range(SLOTS))
+    assert filled.empty()
+    # Every frame handed to the encoder was written
+    assert metrics['media.frames'].value == metrics['media.encode'].count > 0
+    assert 'media.frame_errors' not in metrics
+    assert (tmp_path / "video.avi").stat().st_size > 0
+
+
+def test_screenshots_of_another_size_are_resized(tmp_path):
+    # e.g. the DPI scaling of the monitor changed during the recording
+    free, _, metrics = run_workers(tmp_path, CountingScreen(3 * SLOTS, size=(SHAPE[0] * 2, SHAPE[1] * 2)))
+    assert free == list(range(SLOTS))
+    assert 'media.frame_errors' not in metrics
+    assert metrics['media.frames'].value == metrics['media.encode'].count > 0
+
+
+def test_slot_is_given_back_when_a_frame_fails(tmp_path, monkeypatch):
+    draw_overlays = overlay_drawer.draw_overlays
+    failures = 2 * SLOTS
+
+    def draw_then_break(image, overlays, click_overlay, cursor_position):
+        nonlocal failures
+        image, overlays, click_overlay = draw_overlays(image, overlays, click_overlay, cursor_position)
+        if failures:
+            failures -= 1
+            # A single channel frame can't be copied into a slot
+            image = image[:, :, 0]
+        return image, overlays, click_overlay
+
+    monkeypatch.setattr(overlay_drawer, 'draw_overlays', draw_then_break)
+    free, _, metrics = run_workers(tmp_path, CountingScreen(4 * SLOTS))
+    assert metrics['media.frame_errors'].value == 2 * SLOTS
+    # More failed frames than slots, and the following frames still get a slot
+    assert metrics['media.frames'].value > 0
+    assert 'media.frames_dropped' not in metrics or metrics['media.frames_dropped'].value < 2 * SLOTS
+    assert free == list(range(SLOTS))
+
+
+def test_frame_rate_holds_under_input_load(tmp_path):
+    fps = 20.0
+    capture = IsolatedCapture(str(tmp_path / "video.avi"), (SHAPE[1], SHAPE[0]), fps=fps, grab=synthetic_screenshot)
+    capture.start()
+    try:
+        # The recording process is busy with input handling and overlay updates, holding the GIL
+        end = time.perf_counter() + 2.0
+        sent = 0
+        while time.perf_counter() < end:
+            sum(i * i for i in range(20000))
+            capture.send('overlay', (0, 0, 10, 10), f"element {sent}", (255, 0, 0))
+            capture.send('clear')
+            sent += 1
+    finally:
+        metrics = capture.stop()
+    assert sent > 0
+    frame_interval = metrics['media.frame_interval']
+    # Spawning the workers takes part of the two seconds
+    assert frame_interval.count >= fps / 2
+    # The capture process keeps its own pace, whatever this process is doing
+    assert frame_interval.percentile(90) < 2 / fps
+    assert metrics['media.frames'].value == metrics['media.encode'].count
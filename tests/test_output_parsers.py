@@ -0,0 +1,59 @@
+from python.common.output_parsers import RepeatedExceptionParser, dotnet_test_parsers
+
+
+def feed(parsers, lines):
+    """
+    Feeds the lines to every parser, returns the first abort reason or None.
+    """
+    for line in lines:
+        for parser in parsers:
+            reason = parser.feed(line, "stdout")
+            if reason:
+                return reason
+    return None
+
+
+MSTEST_FAILURE = [
+    "  Failed TestMethod1 [2 s]",
+    "  Error Message:",
+    "   Test method TemplateTest.UnitTest1.TestMethod1 threw exception: ",
+    "System.TimeoutException: Timed out waiting for the window",
+    "  Stack Trace:",
+    "      at TemplateTest.UnitTest1.TestMethod1() in C:\\TemplateTest\\UnitTest1.cs:line 12",
+    "      at System.TimeoutException..ctor()",
+]
+
+
+def test_exceptions_mentioned_in_logs_are_not_counted():
+    parser = RepeatedExceptionParser(max_repeats=3)
+    lines = ["Retrying after TimeoutException from the app", "Handled InvalidOperationException, continuing"] * 5
+    assert feed([parser], lines) is None
+    assert parser.counts == {}
+
+
+def test_each_thrown_exception_is_counted_once():
+    parser = RepeatedExceptionParser(max_repeats=3)
+    assert feed([parser], MSTEST_FAILURE * 2) is None
+    assert parser.counts == {'System.TimeoutException': 2}
+    assert feed([parser], MSTEST_FAILURE) == "repeated_exceptions: System.TimeoutException raised 3 times"
+
+
+def test_unhandled_and_inner_exceptions_are_counted():
+    parser = RepeatedExceptionParser(max_repeats=2)
+    lines = [
+        "Unhandled exception. System.InvalidOperationException: boom",
+        " ---> System.InvalidOperationException: inner",
+    ]
+    assert feed([parser], lines) == "repeated_exceptions: System.InvalidOperationException raised 2 times"
+
+
+def test_element_not_found_only_in_exceptions():
+    assert feed(dotnet_test_parsers(), ["[12:00:01] No element found for 'OK', retrying...", "could not find element Save, waiting"]) is None
+    assert feed(dotnet_test_parsers(), ["System.Exception: No element found for 'OK'"]).startswith("element_not_found: ")
+    assert feed(dotnet_test_parsers(), ["FlaUI.Core.Exceptions.ElementNotAvailableException: Element not available"]).startswith("element_not_found: ")
+
+
+def test_thresholds_are_configurable():
+    lines = ["System.Exception: No element found for 'OK'"] * 2
+    assert feed(dotnet_test_parsers(max_element_not_found=3), lines) is None
+    assert feed(dotnet_test_parsers(max_repeated_exceptions=1), MSTEST_FAILURE) == "repeated_exceptions: System.TimeoutException raised 1 times"
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+
+import pytest
+
+from python.agent.pipeline import ExecutionPipeline, run_command_async
+from python.common.context_planner import ContextPlanner
+
+FAILING_TEST = [sys.executable, "-c", "print('Failed TestMethod1')"]
+PASSING_TEST = [sys.executable, "-c", "print('!Passed!')"]
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_cancelling_run_command_async_kills_the_process(tmp_path):
+    pid_file = tmp_path / "pid"
+    command = [sys.executable, "-c", f"import os, time; open({str(pid_file)!r}, 'w').write(str(os.getpid())); time.sleep(60)"]
+
+    async def run():
+        task = asyncio.create_task(run_command_async(command, timeout=60))
+        await asyncio.to_thread(wait_until, lambda: pid_file.exists() and pid_file.read_text())
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return int(pid_file.read_text())
+
+    start = time.monotonic()
+    pid = asyncio.run(run())
+    # asyncio.run waits for the worker thread, which only returns once the process is gone
+    assert not is_running(pid)
+    assert time.monotonic() - start < 30
+
+
+class Steps:
+    """
+    Stub steps recording when each one starts and ends.
+    """
+    def __init__(self, delay=0.3, recording_files=None):
+        self.delay = delay
+        self.recording_files = recording_files or {"annotations.json.txt": "[]"}
+        self.lock = threading.Lock()
+        self.events = []
+
+    def record(self, name, start):
+        with self.lock:
+            self.events.append((name, start, time.monotonic()))
+
+    def times(self, prefix):
+        return [(start, end) for name, start, end in self.events if name.startswith(prefix)]
+
+    def start_recording(self, recordings_dir):
+        return recordings_dir
+
+    def stop_recording(self, recordings_dir, failed):
+        start = time.monotonic()
+        time.sleep(self.delay)
+        if failed:
+            os.makedirs(recordings_dir, exist_ok=True)
+            for name, content in self.recording_files.items():
+                with open(os.path.join(recordings_dir, name), 'w') as f:
+                    f.write(content)
+        self.record("stop", start)
+
+    def dump_ui(self, output_file):
+        start = time.monotonic()
+        time.sleep(self.delay)
+        with open(output_file, 'w') as f:
+            f.write("{}")
+        self.record("dump", start)
+
+    def upload(self, paths):
+        start = time.monotonic()
+        time.sleep(0.05)
+        self.record("upload:" + os.path.basename(paths[0]), start)
+        return [os.path.basename(path) for path in paths]
+
+    def generate(self, prompt_parts):
+        self.record("generate", time.monotonic())
+        return prompt_parts
+
+
+def make_pipeline(steps, test_command, **kwargs):
+    return ExecutionPipeline(test_command, None, steps.start_recording, steps.stop_recording, steps.dump_ui, steps.upload, steps.generate, **kwargs)
+
+
+def test_failed_run_overlaps_collection_and_generates_last(tmp_path):
+    steps = Steps()
+    start = time.monotonic()
+    result, response = make_pipeline(steps, FAILING_TEST).run(str(tmp_path), "prompt")
+    elapsed = time.monotonic() - start
+    assert result['returncode'] == 0
+
+    # The UI dump runs while the recording finalizes
+    (dump_start, dump_end), = steps.times("dump")
+    (stop_start, stop_end), = steps.times("stop")
+    assert dump_start < stop_end and stop_start < dump_end
+    assert elapsed < 2 * steps.delay + 0.5
+
+    # The summary is uploaded while the recording finalizes, each artifact as soon as it is written
+    (summary_start, _), = steps.times("upload:execution_summary.txt")
+    assert summary_start < stop_end
+    (dump_upload_start, _), = steps.times("upload:ui_dump.json.txt")
+    (recording_upload_start, _), = steps.times("upload:annotations.json.txt")
+    assert dump_upload_start >= dump_end
+    assert recording_upload_start >= stop_end
+
+    # The LLM is called once every upload is done, with the parts in upload_dir_files order
+    (generate_start, _), = steps.times("generate")
+    assert all(end <= generate_start for _, end in steps.times("upload:"))
+    assert response == ["prompt", "execution_summary.txt", "ui_dump.json.txt", "annotations.json.txt"]
+
+
+def test_passed_run_sends_nothing(tmp_path):
+    steps = Steps(delay=0.01)
+    result, response = make_pipeline(steps, PASSING_TEST).run(str(tmp_path), "prompt")
+    assert response is None
+    assert steps.times("upload:") == [] and steps.times("generate") == []
+    assert steps.times("stop")
+    assert os.path.exists(tmp_path / "execution_summary.txt")
+
+
+def test_last_iteration_sends_nothing(tmp_path):
+    steps = Steps(delay=0.01)
+    _, response = make_pipeline(steps, FAILING_TEST).run(str(tmp_path), "prompt", last=True)
+    assert response is None
+    assert steps.times("generate") == []
+
+
+def test_planner_runs_before_uploading(tmp_path):
+    steps = Steps(delay=0.05, recording_files={"annotations.json.txt": "[]", "notes.txt": "x" * 100000})
+    pipeline = make_pipeline(steps, FAILING_TEST, planner=ContextPlanner(byte_budget=50000), plan_file_name="plan.json")
+    _, response = pipeline.run(str(tmp_path), "prompt")
+
+    # Dropped artifacts are never uploaded, not just left out of the prompt
+    assert "notes.txt" not in response
+    assert steps.times("upload:notes.txt") == []
+    assert "annotations.json.txt" in response and "execution_summary.txt" in response
+    with open(tmp_path / "plan.json") as f:
+        plan = json.load(f)
+    assert [os.path.basename(a['path']) for a in plan['dropped']] == ["notes.txt"]
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+from python.common.common_flow import run_command
+from python.common.output_parsers import PatternParser
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="stand-in processes use POSIX process groups")
+
+
+def script(code):
+    return [sys.executable, "-u", "-c", code]
+
+
+def fatal_parsers():
+    return [PatternParser("fatal", [r'^FATAL'])]
+
+
+def is_alive(pid):
+    # Killed processes reparented to a non-reaping init linger as zombies
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_fatal_line_aborts_after_the_grace_period():
+    start = time.monotonic()
+    result = run_command(script("import time; print('FATAL: boom'); time.sleep(0.3); print('last words'); time.sleep(60)"),
+                         timeout=60, parsers=fatal_parsers(), grace_period=1.0)
+    elapsed = time.monotonic() - start
+    assert result['aborted']
+    assert result['abort_reason'] == "fatal: FATAL: boom"
+    assert result['returncode'] != 0
+    # Output written during the grace period is kept, the process doesn't run to its end
+    assert "last words" in result['stdout']
+    assert 1.0 <= elapsed < 10
+    assert result['findings'] == {'fatal': {'matches': ["FATAL: boom"]}}
+
+
+def test_process_exiting_during_the_grace_period_is_not_killed():
+    result = run_command(script("print('FATAL: boom'); print('done')"), timeout=60, parsers=fatal_parsers(), grace_period=5.0)
+    assert not result['aborted']
+    assert result['returncode'] == 0
+    assert "done" in result['stdout']
+
+
+def test_timeout_kills_the_process():
+    start = time.monotonic()
+    result = run_command(script("import time; print('started'); time.sleep(60)"), timeout=0.5)
+    assert time.monotonic() - start < 10
+    assert result['aborted']
+    assert result['returncode'] == -1
+    assert result['stderr'].startswith("TimeoutExpired")
+    assert "started" in result['stderr']
+
+
+def test_abort_kills_the_whole_process_tree(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    # The child keeps the pipes open, like the testhost spawned by `dotnet test`
+    code = (
+        "import subprocess, sys, time\n"
+        "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+        f"open({str(pid_file)!r}, 'w').write(str(child.pid))\n"
+        "print('FATAL: crash', flush=True)\n"
+        "time.sleep(60)\n"
+    )
+    start = time.monotonic()
+    result = run_command(script(code), timeout=60, parsers=fatal_parsers(), grace_period=0.1)
+    assert time.monotonic() - start < 10
+    assert result['aborted']
+    child_pid = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+    while is_alive(child_pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not is_alive(child_pid)
+
+
+def test_cancel_event_kills_the_process():
+    cancel_event = threading.Event()
+    threading.Timer(0.3, cancel_event.set).start()
+    start = time.monotonic()
+    result = run_command(script("import time; time.sleep(60)"), timeout=60, cancel_event=cancel_event)
+    assert time.monotonic() - start < 10
+    assert result['aborted']
+    assert result['abort_reason'] == "Cancelled"
@@ -0,0 +1,50 @@
+import json
+import os
+
+import pytest
+
+from python.common.ui_screenshots import ScreenshotBatch, ATLAS_MAX_SIZE, ATLAS_INDEX_FILE
+
+Image = pytest.importorskip("PIL.Image")
+
+
+class Rect:
+    def __init__(self, left, top, right, bottom):
+        self.left, self.top, self.right, self.bottom = left, top, right, bottom
+
+
+def grab(bbox):
+    left, top, right, bottom = bbox
+    return Image.new('RGB', (right - left, bottom - top), (200, 30, 30))
+
+
+def test_oversized_crop_keeps_its_aspect_ratio():
+    batch = ScreenshotBatch("unused", atlas=True)
+    destination = batch._place(2 * ATLAS_MAX_SIZE, ATLAS_MAX_SIZE // 2)
+    assert destination['scale'] == 0.5
+    assert destination['rect'] == [0, 0, ATLAS_MAX_SIZE, ATLAS_MAX_SIZE // 4]
+
+
+def test_small_crop_is_not_scaled():
+    batch = ScreenshotBatch("unused", atlas=True)
+    destination = batch._place(300, 100)
+    assert destination == {'atlas': 'atlas_0.png', 'rect': [0, 0, 300, 100], 'scale': 1.0}
+
+
+def test_atlas_index_records_the_scale(tmp_path):
+    batch = ScreenshotBatch(str(tmp_path), atlas=True, grab=grab)
+    batch.capture(Rect(0, 0, 3 * ATLAS_MAX_SIZE // 2, 1000))
+    batch.add("small", Rect(10, 10, 110, 60))
+    batch.add("wide", Rect(0, 0, 3 * ATLAS_MAX_SIZE // 2, 300))
+    assert batch.write() == 2
+
+    with open(os.path.join(tmp_path, ATLAS_INDEX_FILE)) as f:
+        index = json.load(f)
+    assert index['small']['scale'] == 1.0
+    assert index['small']['rect'][2:] == [100, 50]
+    assert index['wide']['scale'] == pytest.approx(2 / 3)
+    assert index['wide']['rect'][2:] == [ATLAS_MAX_SIZE, 200]
+    for entry in index.values():
+        with Image.open(os.path.join(tmp_path, entry['atlas'])) as page:
+            x, y, width, height = entry['rect']
+            assert x + width <= page.width and y + height <= page.height
@@ -0,0 +1,80 @@
+import os
+import copy
+import json
+import importlib.util
+
+import pytest
+
+from python.common import uia
+from python.common.fake_uia import build_tree
+from python.common.uia_benchmark import run_benchmarks, compare, benchmark_cases, WINDOW_NAME
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "fixtures", "uia_benchmark_baseline.json")
+SIZES = [1000, 10000, pytest.param(100000, marks=pytest.mark.slow)]
+CASES = ('get_element_info', 'get_element_hierarchy', 'traverse_element_tree', 'dump_ui')
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_calls_per_element_against_baseline(size, baseline):
+    # Calls are deterministic, wall time and memory are left to the CLI gate on a dedicated runner
+    results = run_benchmarks((size,), memory=False)
+    assert set(results[size]) == set(baseline[str(size)])
+    for name, measurement in results[size].items():
+        assert measurement['elements'] == baseline[str(size)][name]['elements'], name
+    assert compare(results, baseline, 0.25) == []
+
+
+@pytest.fixture
+def fake_tree(request, tmp_path):
+    fake = build_tree(request.param, window_name=WINDOW_NAME)
+    uia.set_backend(fake)
+    yield fake, str(tmp_path / "ui_dump.json")
+    uia.set_backend(None)
+
+
+@pytest.mark.skipif(importlib.util.find_spec('pytest_benchmark') is None, reason="pytest-benchmark is not installed")
+@pytest.mark.parametrize("case", CASES)
+@pytest.mark.parametrize("fake_tree", SIZES, indirect=True)
+def test_wall_time(benchmark, fake_tree, case):
+    fake, output_file = fake_tree
+    func = benchmark_cases(fake, output_file)[case]
+    fake.reset_calls()
+    elements = benchmark.pedantic(func, rounds=1, iterations=1)
+    benchmark.extra_info['elements'] = elements
+    benchmark.extra_info['calls_per_element'] = fake.total_calls() / max(elements, 1)
+
+
+def test_calls_are_normalised_by_visited_elements():
+    results = run_benchmarks((100,), fan_out=10, hierarchy_repeats=5)[100]
+    # The focused leaf is at depth 2: each walk visits it, its parent, the window and the desktop
+    assert results['get_element_hierarchy']['elements'] == 5 * 4
+    assert results['get_element_info']['elements'] == 10
+    assert results['traverse_element_tree']['elements'] == 100
+    assert results['dump_ui']['elements'] == 100
+    for measurement in results.values():
+        assert measurement['calls_per_element'] == measurement['calls'] / measurement['elements']
+        assert measurement['peak_memory_mb'] > 0
+
+
+def test_compare_flags_more_calls_per_element():
+    results = run_benchmarks((100,), hierarchy_repeats=5)
+    baseline = {str(size): copy.deepcopy(cases) for size, cases in results.items()}
+    for measurement in baseline['100'].values():
+        measurement['wall_time'] = measurement['peak_memory_mb'] = 1000
+    assert compare(results, baseline, 0.25) == []
+
+    baseline['100']['get_element_hierarchy']['calls_per_element'] -= 1
+    regressions = compare(results, baseline, 0.25)
+    assert len(regressions) == 1 and regressions[0].startswith("get_element_hierarchy @ 100: calls per element")
+
+
+def test_compare_skips_figures_missing_from_the_baseline():
+    results = run_benchmarks((100,), hierarchy_repeats=5, memory=False)
+    baseline = {'100': {name: {'calls_per_element': m['calls_per_element']} for name, m in results[100].items()}}
+    assert compare(results, baseline, 0.25) == []
@@ -0,0 +1,75 @@
+import pytest
+
+from python.common import uia
+from python.common.fake_uia import FakeUIA
+from python.common.uia import get_element_info, LazyPatterns, PROFILES, EXPENSIVE_PATTERNS, PATTERN_PROPERTIES
+
+
+@pytest.fixture
+def fake():
+    fake = FakeUIA()
+    uia.set_backend(fake)
+    yield fake
+    uia.set_backend(None)
+
+
+@pytest.fixture
+def edit(fake):
+    # Supports Value and the expensive Text pattern
+    window = fake.add_window(depth=1, fan_out=4)
+    return next(c for c in window.children if c.properties['ControlTypeName'] == 'EditControl')
+
+
+def probed(fake):
+    """
+    Returns the patterns the backend was asked for, through Get<X>Pattern or Is<X>PatternAvailable.
+    """
+    patterns = set()
+    for name in fake.calls:
+        if name.startswith('Get') and name.endswith('Pattern'):
+            patterns.add(name[len('Get'):-len('Pattern')])
+        elif name.startswith('Is') and name.endswith('PatternAvailable'):
+            patterns.add(name[len('Is'):-len('PatternAvailable')])
+    return patterns
+
+
+def test_full_profile_queries_every_pattern(fake, edit):
+    info = get_element_info(edit, profile='full')
+    assert probed(fake) == set(PATTERN_PROPERTIES)
+    assert isinstance(info['patterns'], dict)
+    assert info['patterns']['TextPattern'] == {'Text': "Lorem ipsum dolor sit amet"}
+    assert fake.calls['TextRange.GetText'] == 1
+
+
+def test_minimal_profile_queries_cheap_state_patterns_only(fake, edit):
+    info = get_element_info(edit, profile='minimal')
+    assert probed(fake) == set(PROFILES['minimal']['patterns'])
+    assert 'ValuePattern' not in info['patterns']
+
+
+def test_standard_profile_defers_expensive_patterns(fake, edit):
+    info = get_element_info(edit, profile='standard')
+    assert probed(fake) == set(PATTERN_PROPERTIES) - set(EXPENSIVE_PATTERNS)
+    assert isinstance(info['patterns'], LazyPatterns)
+    assert info['patterns']['ValuePattern'] == {'Value': 'text', 'IsReadOnly': False}
+    assert fake.calls['TextRange.GetText'] == 0
+
+    # Accessed: only that pattern is queried, once
+    assert info['patterns']['TextPattern'] == {'Text': "Lorem ipsum dolor sit amet"}
+    info['patterns']['TextPattern']
+    assert fake.calls['GetTextPattern'] == 1
+    assert fake.calls['GetSelectionPattern'] == 0
+
+    # Serialized: the rest is resolved, and the element released
+    patterns = dict(info['patterns'])
+    assert fake.calls['GetSelectionPattern'] == fake.calls['GetMultipleViewPattern'] == 1
+    assert 'SelectionPattern' not in patterns
+    assert info['patterns'].element is None
+
+
+def test_unsupported_lazy_pattern_raises_key_error(fake, edit):
+    info = get_element_info(edit, profile='standard')
+    with pytest.raises(KeyError):
+        info['patterns']['SelectionPattern']
+    assert info['patterns'].get('SelectionPattern') is None
+    assert fake.calls['GetSelectionPattern'] == 1
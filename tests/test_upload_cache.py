@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+
+import pytest
+from google.genai import types
+
+from python.common import upload_cache
+from python.common.common_flow import upload_files, reupload_stale_files, is_stale_file_error
+from python.common.llm_client import api_key_id
+from python.common.upload_cache import UploadCache
+
+
+class NotFound(Exception):
+    code = 404
+
+
+class FakeFiles:
+    """
+    Local stand-in for client.files: uploads are ACTIVE at once, deleted files are NOT_FOUND.
+    """
+    def __init__(self):
+        self.uploads = []
+        self.deleted = set()
+
+    def upload(self, file, config=None):
+        self.uploads.append(file)
+        name = f"files/{len(self.uploads)}"
+        return types.File(name=name, uri=f"https://files.test/{name}", mime_type=getattr(config, 'mime_type', None) or "text/plain",
+                          state='ACTIVE', expiration_time=getattr(self, 'expiration_time', None))
+
+    def get(self, name):
+        if name in self.deleted:
+            raise NotFound(f"404 NOT_FOUND. File {name} does not exist.")
+        return types.File(name=name, state='ACTIVE')
+
+
+class FakeClient:
+    def __init__(self):
+        self.files = FakeFiles()
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return UploadCache(str(tmp_path / "cache" / "upload_cache.json"))
+
+
+def write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content)
+    return str(path)
+
+
+def upload(client, paths, cache):
+    return [f for _, f, _ in upload_files(client, paths, cache=cache, min_poll_interval=0.01) if f]
+
+
+def test_identical_content_is_served_from_the_cache(tmp_path, client, cache):
+    first = upload(client, [write(tmp_path, "a.txt", "same")], cache)
+    # Another file with the same content, and a new cache instance reading the persisted entries
+    second = upload(client, [write(tmp_path, "b.txt", "same")], UploadCache(cache.cache_file))
+    assert len(client.files.uploads) == 1
+    assert second[0].name == first[0].name
+
+
+def test_miss_uploads(tmp_path, client, cache):
+    upload(client, [write(tmp_path, "a.txt", "one"), write(tmp_path, "b.txt", "two")], cache)
+    assert len(client.files.uploads) == 2
+    assert len(cache.entries) == 2
+
+
+def test_changed_content_is_uploaded_again(tmp_path, client, cache):
+    path = write(tmp_path, "a.txt", "before")
+    upload(client, [path], cache)
+    write(tmp_path, "a.txt", "after")
+    upload(client, [path], cache)
+    assert len(client.files.uploads) == 2
+
+
+def test_expired_entry_is_uploaded_again(tmp_path, client, cache, monkeypatch):
+    client.files.expiration_time = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    path = write(tmp_path, "a.txt", "content")
+    upload(client, [path], cache)
+    upload(client, [path], cache)
+    assert len(client.files.uploads) == 1
+
+    # Within the expiry margin counts as expired
+    expires = client.files.expiration_time.timestamp()
+    monkeypatch.setattr(upload_cache.time, 'time', lambda: expires - upload_cache.EXPIRY_MARGIN_SECONDS + 1)
+    upload(client, [path], cache)
+    assert len(client.files.uploads) == 2
+
+
+def test_stale_file_is_invalidated_and_uploaded_again(tmp_path, client, cache):
+    path = write(tmp_path, "a.txt", "content")
+    kept, stale = upload(client, [write(tmp_path, "b.txt", "other"), path], cache)
+    client.files.deleted.add(stale.name)
+    error = NotFound(f"404 NOT_FOUND. File {stale.name} does not exist.")
+    assert is_stale_file_error(error)
+
+    parts = reupload_stale_files(client, ["prompt", kept, stale], cache)
+    assert parts[:2] == ["prompt", kept]
+    assert parts[2].name != stale.name
+    assert client.files.uploads[-1] == path
+    assert cache.find(stale.name) is None
+    assert cache.find(parts[2].name)[1]['path'] == path
+
+
+def test_stale_file_with_changed_local_copy_is_left_alone(tmp_path, client, cache):
+    path = write(tmp_path, "a.txt", "content")
+    stale, = upload(client, [path], cache)
+    client.files.deleted.add(stale.name)
+    write(tmp_path, "a.txt", "edited")
+    assert reupload_stale_files(client, [stale], cache) == [stale]
+    assert len(client.files.uploads) == 1
+    assert cache.find(stale.name) is None
+
+
+def test_api_key_id_separates_keys():
+    assert api_key_id("key-a") != api_key_id("key-b")
+    assert "key-a" not in api_key_id("key-a")
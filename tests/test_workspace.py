@@ -0,0 +1,94 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from python.agent.workspace import WorkspacePool, LOCK_FILE
+
+# Counts its runs in obj/, which survives resets
+WARM_COMMAND = [sys.executable, "-c", "import os; os.makedirs('obj', exist_ok=True); open(os.path.join('obj', 'warm.txt'), 'a').write('x')"]
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    template = tmp_path / "template"
+    (template / "Pages").mkdir(parents=True)
+    (template / "TemplateTest.csproj").write_text("<Project />")
+    (template / "Pages" / "ApplicationPage.cs").write_text("// page")
+    (template / "TestClass.cs").write_text("// test")
+    # Build output of the template itself is not part of it
+    (template / "bin").mkdir()
+    (template / "bin" / "TemplateTest.dll").write_text("")
+    return template
+
+
+@pytest.fixture
+def pool(tmp_path, template_dir):
+    return WorkspacePool(str(template_dir), str(tmp_path / "pool"), warm_command=WARM_COMMAND)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_acquire_locks_and_release_frees(pool):
+    first = pool.acquire()
+    with open(os.path.join(first, LOCK_FILE)) as f:
+        assert int(f.read()) == os.getpid()
+    # Locked by a live process, the next run gets its own workspace
+    second = pool.acquire()
+    assert (os.path.basename(first), os.path.basename(second)) == ("workspace0", "workspace1")
+
+    pool.release(first)
+    assert not os.path.exists(os.path.join(first, LOCK_FILE))
+    assert pool.acquire() == first
+
+
+def test_workspace_of_a_dead_run_is_reclaimed(pool):
+    workspace = pool.acquire()
+    with open(os.path.join(workspace, LOCK_FILE), 'w') as f:
+        f.write(str(dead_pid()))
+    assert pool.acquire() == workspace
+    with open(os.path.join(workspace, LOCK_FILE)) as f:
+        assert int(f.read()) == os.getpid()
+
+
+def test_template_sources_are_hardlinked_generated_files_copied(pool, template_dir):
+    workspace = pool.acquire()
+    assert os.path.samefile(template_dir / "TemplateTest.csproj", os.path.join(workspace, "TemplateTest.csproj"))
+    generated = os.path.join(workspace, "Pages", "ApplicationPage.cs")
+    assert not os.path.samefile(template_dir / "Pages" / "ApplicationPage.cs", generated)
+    with open(generated, 'w') as f:
+        f.write("// generated")
+    assert (template_dir / "Pages" / "ApplicationPage.cs").read_text() == "// page"
+    assert not os.path.exists(os.path.join(workspace, "bin"))
+
+
+def test_reset_restores_the_template_and_keeps_build_output(pool, template_dir):
+    workspace = pool.acquire()
+    with open(os.path.join(workspace, "TestClass.cs"), 'w') as f:
+        f.write("// generated")
+    with open(os.path.join(workspace, "Extra.cs"), 'w') as f:
+        f.write("")
+    pool.release(workspace)
+
+    assert pool.acquire() == workspace
+    assert open(os.path.join(workspace, "TestClass.cs")).read() == "// test"
+    assert not os.path.exists(os.path.join(workspace, "Extra.cs"))
+    # Warmed up once, when it was created
+    assert open(os.path.join(workspace, "obj", "warm.txt")).read() == "x"
+
+
+def test_export_leaves_out_the_lock_and_build_output(pool, tmp_path):
+    workspace = pool.acquire()
+    target = tmp_path / "run" / "TemplateTest"
+    pool.export(workspace, str(target))
+    assert (target / "TemplateTest.csproj").read_text() == "<Project />"
+    assert (target / "Pages" / "ApplicationPage.cs").exists()
+    assert not (target / LOCK_FILE).exists()
+    assert not (target / "obj").exists()
+    # Exported files are copies, not links into the pool
+    assert not os.path.samefile(target / "TemplateTest.csproj", os.path.join(workspace, "TemplateTest.csproj"))